@@ -0,0 +1,176 @@
+import math
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional
+from cpu_profile import CpuProfile, apply_thread_settings, model_precision, optimize_model
+from config import MAX_LENGTH, CONVERTED_MODEL_DIR, CT2_COMPUTE_TYPE, DECODING_PRESETS
+
+def pipeline(*args, **kwargs):
+    # transformers (and torch behind it) take seconds to import, so only load them
+    # once a model is actually built
+    from transformers import pipeline as transformers_pipeline
+    return transformers_pipeline(*args, **kwargs)
+
+def get_decoding_preset(name: str) -> Dict:
+    try:
+        return DECODING_PRESETS[name]
+    except KeyError:
+        raise ValueError(f"Unknown decoding preset: {name} (choose from {', '.join(DECODING_PRESETS)})")
+
+def generation_budget(preset: Dict, input_tokens: int) -> Optional[int]:
+    # Translations of subtitle lines stay close to the source length, so a short cue
+    # does not need the worst-case budget of a long one. None leaves it to the model.
+    if preset['length_ratio'] is None:
+        return None
+    return min(MAX_LENGTH, math.ceil(preset['length_ratio'] * input_tokens) + preset['length_offset'])
+
+class TranslationBackend:
+    name = ''
+
+    @property
+    def variant(self) -> str:
+        # Engine and weight precision; together with the model and preset it decides the
+        # output, so cached translations are keyed on it
+        return self.name
+
+    def count_tokens(self, lines: List[str]) -> List[int]:
+        encoded = self.tokenizer(lines, truncation=True, max_length=MAX_LENGTH)
+        return [len(ids) for ids in encoded['input_ids']]
+
+    def translate_batch(self, lines: List[str], max_length: Optional[int] = MAX_LENGTH,
+                        num_beams: Optional[int] = 1) -> List[str]:
+        # None for either setting means the model's default
+        raise NotImplementedError
+
+    def memory_bytes(self) -> Optional[int]:
+        # Weights held by this backend, or None when unknown
+        return None
+
+    def close(self) -> None:
+        pass
+
+class HFPipelineBackend(TranslationBackend):
+    name = 'hf'
+
+    def __init__(self, model_name: str, device, cpu_profile: Optional[CpuProfile] = None):
+        if cpu_profile is not None:
+            apply_thread_settings(cpu_profile)
+        self.pipeline = pipeline(
+            "translation",
+            model=model_name,
+            device=device
+        )
+        if cpu_profile is not None:
+            self.pipeline.model = optimize_model(self.pipeline.model, cpu_profile)
+        self.precision = model_precision(cpu_profile)
+        self.tokenizer = self.pipeline.tokenizer
+
+    @property
+    def variant(self) -> str:
+        return f"{self.name}-{self.precision}"
+
+    def translate_batch(self, lines: List[str], max_length: Optional[int] = MAX_LENGTH,
+                        num_beams: Optional[int] = 1) -> List[str]:
+        generation = {}
+        if max_length is not None:
+            generation['max_length'] = max_length
+        if num_beams is not None:
+            generation['num_beams'] = num_beams
+        outputs = self.pipeline(lines, batch_size=len(lines), **generation)
+        return [output['translation_text'] for output in outputs]
+
+    def memory_bytes(self) -> Optional[int]:
+        try:
+            return sum(p.numel() * p.element_size() for p in self.pipeline.model.parameters())
+        except (AttributeError, TypeError):
+            return None
+
+class CTranslate2Backend(TranslationBackend):
+    name = 'ct2'
+
+    def __init__(self, model_name: str, device, cpu_profile: Optional[CpuProfile] = None,
+                 compute_type: str = CT2_COMPUTE_TYPE, cache_dir: Path = CONVERTED_MODEL_DIR):
+        try:
+            import ctranslate2
+        except ImportError:
+            raise RuntimeError("The ct2 backend requires CTranslate2: pip install ctranslate2")
+        from transformers import AutoTokenizer
+        
+        model_dir = self.convert(model_name, Path(cache_dir))
+        self.model_dir = model_dir
+        self.compute_type = compute_type
+        threads = {}
+        if cpu_profile is not None:
+            # CTranslate2 quantizes through compute_type, so only the thread counts apply
+            threads = {
+                'intra_threads': cpu_profile.intra_threads or 0,
+                'inter_threads': cpu_profile.inter_threads or 1,
+            }
+        self.translator = ctranslate2.Translator(
+            str(model_dir),
+            device='cuda' if str(device).startswith('cuda') else 'cpu',
+            compute_type=compute_type,
+            **threads
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+    @staticmethod
+    def convert(model_name: str, cache_dir: Path) -> Path:
+        # Converted once from the locally cached Hugging Face model, then reused
+        model_dir = cache_dir / 'ct2' / model_name.replace('/', '--')
+        if (model_dir / 'model.bin').exists():
+            return model_dir
+        
+        from ctranslate2.converters import TransformersConverter
+        print(f"Converting {model_name} to CTranslate2 format in {model_dir}...")
+        tmp_dir = model_dir.with_name(model_dir.name + f'.tmp{os.getpid()}')
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        TransformersConverter(model_name).convert(str(tmp_dir))
+        model_dir.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.replace(tmp_dir, model_dir)
+        except OSError:
+            # Another process finished the conversion first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return model_dir
+
+    def translate_batch(self, lines: List[str], max_length: Optional[int] = MAX_LENGTH,
+                        num_beams: Optional[int] = 1) -> List[str]:
+        tokens = [self.tokenizer.convert_ids_to_tokens(self.tokenizer.encode(line)) for line in lines]
+        # CTranslate2 does not read the model's generation config; without a preset
+        # it decodes as before presets existed
+        beams = {} if num_beams is None else {'beam_size': num_beams}
+        results = self.translator.translate_batch(
+            tokens,
+            max_batch_size=len(lines),
+            max_decoding_length=MAX_LENGTH if max_length is None else max_length,
+            **beams
+        )
+        return [
+            self.tokenizer.decode(self.tokenizer.convert_tokens_to_ids(result.hypotheses[0]), skip_special_tokens=True)
+            for result in results
+        ]
+
+    @property
+    def variant(self) -> str:
+        return f"{self.name}-{self.compute_type}"
+
+    def memory_bytes(self) -> Optional[int]:
+        try:
+            return (self.model_dir / 'model.bin').stat().st_size
+        except OSError:
+            return None
+
+BACKENDS = {
+    HFPipelineBackend.name: HFPipelineBackend,
+    CTranslate2Backend.name: CTranslate2Backend,
+}
+
+def create_backend(name: str, model_name: str, device,
+                   cpu_profile: Optional[CpuProfile] = None) -> TranslationBackend:
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown backend: {name} (choose from {', '.join(BACKENDS)})")
+    return backend_class(model_name, device, cpu_profile)
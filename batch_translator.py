@@ -1,119 +1,309 @@
 from pathlib import Path
 import argparse
-from translator import process_single_file
-import hashlib
-import json
+from translator import create_model_cache
+from backends import BACKENDS
+from cpu_profile import CpuProfile, add_cpu_profile_arguments, cpu_profile_from_args
+from pipeline import TranslationPipeline
+from manifest import TranslationManifest
+from worker_pool import process_files_parallel
+from watcher import FileDebouncer, create_watcher, is_source_file
+from library_index import LibraryIndex, get_target_path
+from server import add_server_arguments, server_from_args
+from metrics import ProgressReporter, add_metrics_arguments, configure_from_args, metrics
+from state_store import DONE, FAILED, LibraryState
+from targets import add_target_arguments, group_targets, model_concurrency
+from work_claims import WorkClaims, print_queue_status
 import time
-from typing import List, Optional
-from config import get_source_patterns, get_target_suffix
+from contextlib import nullcontext
+from typing import Dict, Iterator, List, Optional
+from config import (get_model_name, USE_TRANSLATION_MEMORY, BACKEND, MERGE_SENTENCES, SERVER_ADDRESS,
+                    DECODING_PRESET, DECODING_PRESETS, LIBRARY_INDEX_FILE, STATE_DB_FILE, TARGET_LANG,
+                    MODEL_CACHE_MB, CLAIM_BATCH_FILES, WATCH_SETTLE_SECONDS, WATCH_RECONCILE_SECONDS)
 
-HASH_FILE = Path.home() / '.subtitle_translator_state.json'
+STATE_FILE = STATE_DB_FILE
 
 def find_subtitle_files(directory: str) -> List[Path]:
-    base_dir = Path(directory)
-    all_files = []
-    for pattern in get_source_patterns():
-        all_files.extend(base_dir.rglob(pattern))
-    return all_files
+    return LibraryIndex(directory).scan().source_paths
 
-def needs_translation(srt_file: Path) -> bool:
-    target_file = srt_file.parent / f"{srt_file.stem[:-3]}{get_target_suffix()}{srt_file.suffix}"
-    return not target_file.exists()
+def needs_translation(srt_file: Path, target: Optional[str] = None) -> bool:
+    target_file = get_target_path(srt_file, target)
+    if not target_file.exists():
+        return True
+    # Retranslate edited sources; only changed cues go back to the model
+    manifest = TranslationManifest.load(target_file)
+    return manifest is not None and not manifest.matches_source(srt_file)
 
 def calculate_directory_hash(directory: Path) -> str:
-    hasher = hashlib.md5()
-    
-    subtitle_files = []
-    for pattern in get_source_patterns():
-        for path in sorted(directory.rglob(pattern)):
-            stats = path.stat()
-            file_info = f"{path}|{stats.st_size}|{stats.st_mtime}"
-            subtitle_files.append(file_info)
-    
-    dir_content = "\n".join(subtitle_files)
-    hasher.update(dir_content.encode())
-    
-    return hasher.hexdigest()
-
-def load_last_hash() -> Optional[str]:
-    if not HASH_FILE.exists():
-        return None
-    
-    try:
-        with open(HASH_FILE, 'r') as f:
-            data = json.load(f)
-            return data.get('last_hash')
-    except (json.JSONDecodeError, FileNotFoundError):
-        return None
+    return LibraryIndex(directory).scan().fingerprint()
 
-def save_current_hash(hash_value: str) -> None:
-    with open(HASH_FILE, 'w') as f:
-        json.dump({
-            'last_hash': hash_value,
-            'last_check': time.time()
-        }, f)
+def queue_status(directory: str, targets: Optional[List[str]] = None) -> int:
+    targets = targets or [TARGET_LANG]
+    scan = LibraryIndex(directory, LIBRARY_INDEX_FILE).scan()
+    pending = sum(1 for path in scan.source_paths if any(scan.needs_translation(path, t) for t in targets))
+    print_queue_status(pending, WorkClaims(directory).status())
+    return 0
 
-def process_directory(directory: str) -> None:
+def process_directory(directory: str, use_memory: bool = USE_TRANSLATION_MEMORY, workers: int = 1,
+                      backend: str = BACKEND, cpu_profile: Optional[CpuProfile] = None,
+                      merge_sentences: bool = MERGE_SENTENCES, server: Optional[str] = SERVER_ADDRESS,
+                      preset: str = DECODING_PRESET, targets: Optional[List[str]] = None,
+                      budget_mb: int = MODEL_CACHE_MB, distributed: bool = False) -> None:
+    targets = targets or [TARGET_LANG]
+    if distributed and workers > 1:
+        raise ValueError("--distributed runs one pipeline per process; start more processes instead of --workers")
+    state = LibraryState(directory, STATE_FILE)
     try:
-        base_dir = Path(directory)
+        # One walk answers the change check, the file list and the skip decisions
+        index = LibraryIndex(directory, LIBRARY_INDEX_FILE)
+        with metrics.timer('scan'):
+            scan = index.scan()
+            index.save()
+        print(f"Scanned library: {index.listed} directories listed, {index.reused} unchanged")
         
-        current_hash = calculate_directory_hash(base_dir)
-        last_hash = load_last_hash()
+        current_hash = scan.fingerprint(targets)
+        last_hash = state.last_fingerprint()
         
         if current_hash == last_hash:
             print("No changes detected in directory structure since last run. Skipping processing.")
             return
         
-        subtitle_files = find_subtitle_files(directory)
+        subtitle_files = scan.source_paths
         
         if not subtitle_files:
             print(f"No .en.srt or .en.ass files found in {directory}")
-            save_current_hash(current_hash)
+            state.save_fingerprint(current_hash)
             return
         
-        files_to_process = [f for f in subtitle_files if needs_translation(f)]
+        # Targets each source still needs; sources and targets are checked in one pass
+        pending = {str(path): needed for path, needed in state.targets_to_translate(scan, targets).items()}
         
-        if not files_to_process:
-            print(f"All {len(subtitle_files)} found subtitle files already have Danish translations!")
-            save_current_hash(current_hash)
+        if not pending:
+            print(f"All {len(subtitle_files)} found subtitle files already have {', '.join(targets)} translations!")
+            state.save_fingerprint(current_hash)
             return
         
         print(f"Found {len(subtitle_files)} subtitle files")
-        print(f"Need to process {len(files_to_process)} files (skipping {len(subtitle_files) - len(files_to_process)} already translated)")
-        
-        # Save initial hash to mark start of processing
-        save_current_hash(current_hash)
-        
-        for i, srt_file in enumerate(files_to_process, 1):
-            print(f"\nProcessing file {i}/{len(files_to_process)}: {srt_file}")
-            try:
-                process_single_file(str(srt_file))
-                # Save hash after each successful translation
-                save_current_hash(current_hash)
-            except Exception as e:
-                print(f"Error processing {srt_file}: {str(e)}")
-        
-        # Final save to mark completion
-        save_current_hash(current_hash)
+        print(f"Need to process {len(pending)} files (skipping {len(subtitle_files) - len(pending)} already translated)")
+        
+        # Targets that fit in the model budget together share one pass over the files
+        groups = group_targets(targets, budget_mb)
+        passes = [(group, [(path, [t for t in needed if t in group]) for path, needed in pending.items()])
+                  for group in groups]
+        passes = [(group, [(path, needed) for path, needed in jobs if needed]) for group, jobs in passes]
+        for target in targets:
+            state.mark_pending([path for path, needed in pending.items() if target in needed], get_model_name(target))
+        if len(groups) > 1:
+            print(f"Translating {len(targets)} targets in {len(groups)} passes to stay within {budget_mb} MB of models")
+        
+        completed = 0
+        failed = 0
+        deferred = 0
+        progress = ProgressReporter('library', sum(len(jobs) for _, jobs in passes))
+        
+        def claimed_batches(claims: Optional[WorkClaims], job_targets: Dict[str, List[str]]) -> Iterator[List[str]]:
+            # Without claims every file is ours. With them, a few files at a time are claimed
+            # just before they are translated, so other nodes pick up the rest.
+            nonlocal deferred
+            if claims is None:
+                yield list(job_targets)
+                return
+            batch = []
+            for path in job_targets:
+                if not claims.claim(path):
+                    deferred += 1
+                    continue
+                # Another node may have finished it since this node scanned
+                still_needed = [target for target in job_targets[path] if needs_translation(Path(path), target)]
+                if not still_needed:
+                    claims.release(path)
+                    continue
+                job_targets[path] = still_needed
+                batch.append(path)
+                if len(batch) == CLAIM_BATCH_FILES:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        
+        with WorkClaims(directory) if distributed else nullcontext() as claims:
+            for group, jobs in passes:
+                job_targets = dict(jobs)
+                
+                def report(srt_file, error, seconds=None):
+                    nonlocal completed, failed, deferred
+                    completed += 1
+                    if claims is not None and not claims.release(srt_file):
+                        # Another node took the file over after its lease lapsed; its result counts
+                        deferred += 1
+                        progress.update(completed, 'files')
+                        return
+                    for target in job_targets[srt_file]:
+                        if error is None:
+                            state.record(srt_file, DONE, seconds, get_model_name(target))
+                        else:
+                            state.record(srt_file, FAILED, seconds, get_model_name(target), error)
+                    if error is not None:
+                        failed += 1
+                        metrics.incr('file_errors')
+                        print(f"Error processing {srt_file}: {error}")
+                    progress.update(completed, 'files')
+                
+                if workers > 1:
+                    print(f"Translating with {workers} worker processes")
+                    for srt_file, error, seconds in process_files_parallel(jobs, workers, use_memory, backend,
+                                                                            cpu_profile, merge_sentences, server,
+                                                                            preset, group, budget_mb):
+                        report(srt_file, error, seconds)
+                else:
+                    # Load each model once; parsing and writing overlap with inference
+                    concurrency = model_concurrency(len(group))
+                    with create_model_cache(use_memory, backend, cpu_profile, merge_sentences, server, preset,
+                                            budget_mb, concurrency) as models:
+                        for batch in claimed_batches(claims, job_targets):
+                            pipeline = TranslationPipeline(
+                                models, targets=group, select_targets=job_targets.get, concurrency=concurrency,
+                                may_write=claims.holds if claims is not None else None,
+                                on_complete=lambda job, error: report(job, error, pipeline.durations.get(job)))
+                            pipeline.run(batch)
+                            if claims is None:
+                                pipeline.print_report()
+        
+        if deferred:
+            print(f"Left {deferred} files to other nodes")
+        
+        # Failed files keep the library marked as changed so the next run retries them;
+        # so do files another node was translating, in case it does not finish them
+        if not failed and not deferred:
+            state.save_fingerprint(current_hash)
 
     except KeyboardInterrupt:
         print("\nOperation cancelled by user. Progress has been saved.")
         return 1
+    finally:
+        state.close()
     
     return 0
 
+def watch_directory(directory: str, use_memory: bool = USE_TRANSLATION_MEMORY, backend: str = BACKEND,
+                    cpu_profile: Optional[CpuProfile] = None, polling: bool = False, settle_seconds: float = WATCH_SETTLE_SECONDS,
+                    reconcile_seconds: float = WATCH_RECONCILE_SECONDS,
+                    merge_sentences: bool = MERGE_SENTENCES, server: Optional[str] = SERVER_ADDRESS,
+                    preset: str = DECODING_PRESET, targets: Optional[List[str]] = None,
+                    budget_mb: int = MODEL_CACHE_MB) -> int:
+    targets = targets or [TARGET_LANG]
+    watcher = create_watcher(directory, polling)
+    debouncer = FileDebouncer(settle_seconds)
+    state = LibraryState(directory, STATE_FILE)
+    print(f"Watching {directory} for new subtitles ({type(watcher).__name__})")
+    
+    def missing_targets(srt_file):
+        return [target for target in targets if needs_translation(Path(srt_file), target)]
+    
+    def report(srt_file, error, seconds=None, done_targets=()):
+        for target in done_targets:
+            if error is None:
+                state.record(srt_file, DONE, seconds, get_model_name(target))
+            else:
+                state.record(srt_file, FAILED, seconds, get_model_name(target), error)
+        if error is None:
+            print(f"Finished file: {srt_file}")
+        else:
+            metrics.incr('file_errors')
+            print(f"Error processing {srt_file}: {error}")
+    
+    models = None
+    try:
+        last_reconcile = None
+        while True:
+            if (last_reconcile is None or watcher.needs_reconcile
+                    or time.monotonic() - last_reconcile >= reconcile_seconds):
+                watcher.needs_reconcile = False
+                last_reconcile = time.monotonic()
+                index = LibraryIndex(directory, LIBRARY_INDEX_FILE)
+                missed = state.targets_to_translate(index.scan(), targets)
+                index.save()
+                for path in missed:
+                    if str(path) not in debouncer.pending:
+                        debouncer.touch(str(path))
+                if missed:
+                    print(f"Reconciliation scan queued {len(missed)} files")
+            
+            for path in watcher.poll(timeout=1.0):
+                if is_source_file(path):
+                    debouncer.touch(path)
+            
+            ready = {path: needed for path in debouncer.ready() for needed in [missing_targets(path)] if needed}
+            if ready:
+                print(f"\nTranslating {len(ready)} new or changed files")
+                # Load models on the first file and keep them for the lifetime of the watcher
+                concurrency = model_concurrency(len(targets))
+                if models is None:
+                    models = create_model_cache(use_memory, backend, cpu_profile, merge_sentences, server, preset,
+                                                budget_mb, concurrency)
+                pipeline = TranslationPipeline(
+                    models, targets=targets, select_targets=ready.get, concurrency=concurrency,
+                    on_complete=lambda job, error: report(job, error, pipeline.durations.get(job), ready[job]))
+                pipeline.run(list(ready))
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    finally:
+        watcher.close()
+        state.close()
+        if models is not None:
+            models.close()
+    return 0
+
 def main():
     parser = argparse.ArgumentParser(description='Batch translate English SRT files to Danish')
     parser.add_argument('directory', help='Directory to search for .en.srt files')
     parser.add_argument('--force', action='store_true', help='Force processing even if no changes detected')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes, each pinned to its own slice of CPU cores')
+    parser.add_argument('--watch', action='store_true', help='Keep running and translate new or changed files as they appear')
+    parser.add_argument('--poll', action='store_true', help='With --watch, poll the directory instead of using inotify')
+    parser.add_argument('--settle', type=float, default=WATCH_SETTLE_SECONDS, help='With --watch, seconds a file must be unchanged before it is translated')
+    parser.add_argument('--no-memory', action='store_true', help='Do not use the persistent translation memory')
+    parser.add_argument('--backend', choices=list(BACKENDS), default=BACKEND, help='Inference engine to use')
+    parser.add_argument('--preset', choices=list(DECODING_PRESETS), default=DECODING_PRESET,
+                        help='Decoding preset: model (its own generation config), fast (greedy) for backlogs, balanced, or quality')
+    parser.add_argument('--merge-sentences', action='store_true', default=MERGE_SENTENCES,
+                        help='Translate sentences that span several lines or cues as one and split the result back')
+    parser.add_argument('--distributed', action='store_true',
+                        help='Share the library with other nodes running --distributed on it, claiming files as they go')
+    parser.add_argument('--queue-status', action='store_true',
+                        help='Show how many files still need translation and which nodes have claimed files')
+    add_target_arguments(parser)
+    add_server_arguments(parser)
+    add_cpu_profile_arguments(parser)
+    add_metrics_arguments(parser)
     
     try:
         args = parser.parse_args()
+        configure_from_args(args)
         
         if args.force:
-            HASH_FILE.unlink(missing_ok=True)
+            state = LibraryState(args.directory, STATE_FILE)
+            state.forget_fingerprint()
+            state.close()
+        
+        if args.queue_status:
+            return queue_status(args.directory, args.targets)
+        if args.distributed and (args.watch or args.workers > 1):
+            parser.error("--distributed cannot be combined with --watch or --workers; run one process per node or core slice")
+        if args.watch and args.workers > 1:
+            parser.error("--watch translates in a single process; --workers only applies to one-off runs")
+        
+        cpu_profile = cpu_profile_from_args(args)
+        if args.watch:
+            return watch_directory(args.directory, use_memory=not args.no_memory, backend=args.backend,
+                                   cpu_profile=cpu_profile, polling=args.poll, settle_seconds=args.settle,
+                                   merge_sentences=args.merge_sentences, server=server_from_args(args),
+                                   preset=args.preset, targets=args.targets, budget_mb=args.model_cache_mb)
         
-        return process_directory(args.directory)
+        return process_directory(args.directory, use_memory=not args.no_memory, workers=args.workers,
+                                 backend=args.backend, cpu_profile=cpu_profile,
+                                 merge_sentences=args.merge_sentences, server=server_from_args(args),
+                                 preset=args.preset, targets=args.targets, budget_mb=args.model_cache_mb,
+                                 distributed=args.distributed)
 
     except KeyboardInterrupt:
         print("\nOperation cancelled by user. Exiting...")
@@ -121,6 +311,8 @@ def main():
     except Exception as e:
         print(f"Error: {e}")
         return 1
+    finally:
+        metrics.close()
 
 if __name__ == "__main__":
     exit(main()) 
\ No newline at end of file
@@ -0,0 +1,71 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from subtitle_formats import SrtFormat, AssFormat
+from benchmarks.corpus import write_srt_corpus, write_ass_corpus
+
+def timed(label: str, func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<32} {best * 1000:9.1f} ms")
+    return best
+
+def run(cues: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        srt_path, ass_path = tmp / "corpus.srt", tmp / "corpus.ass"
+        write_srt_corpus(srt_path, cues)
+        write_ass_corpus(ass_path, cues)
+        out = str(tmp / "out")
+
+        srt, ass_format = SrtFormat(), AssFormat()
+        print(f"SRT, {cues} cues ({srt_path.stat().st_size / 1e6:.1f} MB)")
+        timed("subtrans read", lambda: srt.read(str(srt_path)), repeat)
+        timed("subtrans iter_cues", lambda: sum(1 for _ in srt.iter_cues(str(srt_path))), repeat)
+        timed("subtrans read + save", lambda: srt.save(srt.read(str(srt_path)), out + ".srt"), repeat)
+        try:
+            import pysrt
+            timed("pysrt open", lambda: pysrt.open(str(srt_path)), repeat)
+            timed("pysrt open + save", lambda: pysrt.open(str(srt_path)).save(out + ".srt", encoding='utf-8'), repeat)
+        except ImportError:
+            print("  pysrt not installed, skipping comparison")
+
+        print(f"ASS, {cues} cues ({ass_path.stat().st_size / 1e6:.1f} MB)")
+        timed("subtrans read", lambda: ass_format.read(str(ass_path)), repeat)
+        timed("subtrans iter_cues", lambda: sum(1 for _ in ass_format.iter_cues(str(ass_path))), repeat)
+        timed("subtrans read + save", lambda: ass_format.save(ass_format.read(str(ass_path)), out + ".ass"), repeat)
+        try:
+            import ass
+
+            def ass_parse():
+                with open(ass_path, encoding='utf-8') as f:
+                    return ass.parse(f)
+
+            def ass_round_trip():
+                doc = ass_parse()
+                with open(out + ".ass", 'w', encoding='utf-8') as f:
+                    doc.dump_file(f)
+
+            timed("ass parse", ass_parse, repeat)
+            timed("ass parse + dump", ass_round_trip, repeat)
+        except ImportError:
+            print("  ass not installed, skipping comparison")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark subtitle parsing against pysrt/ass')
+    parser.add_argument('--cues', type=int, default=20000, help='Number of cues in the generated files')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement (best is reported)')
+    args = parser.parse_args()
+    run(args.cues, args.repeat)
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
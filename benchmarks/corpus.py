@@ -0,0 +1,68 @@
+import random
+from pathlib import Path
+from typing import List
+
+from subtitle_formats import format_srt_timestamp, format_ass_timestamp
+
+ASS_HEADER = """[Script Info]
+Title: Benchmark
+ScriptType: v4.00+
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Arial,20,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,0,0,0,0,100,100,0,0,1,2,2,2,10,10,10,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+# Short, repetitive dialogue like real TV subtitles, so dedup and caching behave realistically
+WORDS = ("you what we the I it no yes go come on here there know think right now "
+         "okay well just get out this that are is was be have do not can hey wait").split()
+STOCK_LINES = ["What?", "Yeah.", "No!", "Come on.", "Let's go.", "I don't know.", "Previously on..."]
+
+def random_line(rng: random.Random) -> str:
+    if rng.random() < 0.15:
+        return rng.choice(STOCK_LINES)
+    words = [rng.choice(WORDS) for _ in range(rng.randint(2, 10))]
+    return ' '.join(words).capitalize() + rng.choice('.?!')
+
+def random_cue_lines(rng: random.Random) -> List[str]:
+    if rng.random() < 0.2:
+        return [f"-{random_line(rng)}", f"-{random_line(rng)}"]
+    return [random_line(rng) for _ in range(rng.randint(1, 2))]
+
+def write_srt_corpus(path: Path, cues: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(cues):
+            start = i * 3000
+            text = '\n'.join(random_cue_lines(rng))
+            f.write(f"{i + 1}\n{format_srt_timestamp(start)} --> {format_srt_timestamp(start + 2500)}\n{text}\n\n")
+
+def write_ass_corpus(path: Path, cues: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(ASS_HEADER)
+        for i in range(cues):
+            start = i * 3000
+            text = '\\N'.join(random_cue_lines(rng))
+            f.write(f"Dialogue: 0,{format_ass_timestamp(start)},{format_ass_timestamp(start + 2500)},"
+                    f"Default,,0,0,0,,{text}\n")
+
+def write_library(root: Path, files: int, cues_per_file: int, seed: int = 0) -> List[Path]:
+    # Mimics a TV library: show/season directories with media and subtitle files
+    paths = []
+    for i in range(files):
+        season = root / f"Show {i // 50:03}" / f"Season {(i // 10) % 5 + 1:02}"
+        season.mkdir(parents=True, exist_ok=True)
+        episode = season / f"Episode {i:04}"
+        (season / f"Episode {i:04}.mkv").touch()
+        if i % 4 == 3:
+            path = episode.with_suffix('.en.ass')
+            write_ass_corpus(path, cues_per_file, seed + i)
+        else:
+            path = episode.with_suffix('.en.srt')
+            write_srt_corpus(path, cues_per_file, seed + i)
+        paths.append(path)
+    return paths
@@ -0,0 +1,189 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.corpus import write_srt_corpus, write_ass_corpus, write_library
+from benchmarks.stub import StubBackend
+
+DEFAULT_THRESHOLD = 0.15  # Fail compare when throughput drops by more than this fraction
+
+def measure(func: Callable[[], int], repeat: int) -> Dict[str, float]:
+    # func returns the number of items it processed; the best run is kept
+    best, items = float('inf'), 0
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            items = func()
+            elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+    return {'seconds': best, 'items': items, 'per_second': items / best if best > 0 else 0.0}
+
+def stub_translator():
+    from translator import SubtitleTranslator
+    return SubtitleTranslator(backend=StubBackend())
+
+def run_suite(cues: int, files: int, cues_per_file: int, repeat: int, real_model: bool) -> Dict:
+    import batch_translator
+    from subtitle_formats import SrtFormat, AssFormat
+    
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        srt_path, ass_path = tmp / "corpus.en.srt", tmp / "corpus.en.ass"
+        write_srt_corpus(srt_path, cues)
+        write_ass_corpus(ass_path, cues)
+        srt, ass_format = SrtFormat(), AssFormat()
+        
+        results['parse_srt'] = measure(lambda: len(srt.read(str(srt_path))), repeat)
+        results['parse_ass'] = measure(lambda: len(ass_format.read(str(ass_path)).events), repeat)
+        
+        parsed = srt.read(str(srt_path))
+        
+        def save():
+            srt.save(parsed, str(tmp / "out.srt"))
+            return len(parsed)
+        results['save_srt'] = measure(save, repeat)
+        
+        translator = stub_translator()
+        
+        def translate_loop():
+            subs = srt.read(str(srt_path))
+            translator.translate_document(srt, subs, str(srt_path))
+            return len(subs)
+        results['translate_loop'] = measure(translate_loop, repeat)
+        
+        library = tmp / "library"
+        write_library(library, files, cues_per_file)
+        results['scan_find_subtitle_files'] = measure(
+            lambda: len(batch_translator.find_subtitle_files(str(library))), repeat)
+        
+        def directory_hash():
+            batch_translator.calculate_directory_hash(library)
+            return files
+        results['scan_directory_hash'] = measure(directory_hash, repeat)
+        
+        def end_to_end():
+            for target in library.rglob("*.da.*"):
+                target.unlink()
+            for manifest in library.rglob(".*.subtrans.json"):
+                manifest.unlink()
+            for state_file in tmp.glob("state.db*"):
+                state_file.unlink()
+            # server=None: a running `subtrans serve` would replace the stub with the real model
+            batch_translator.process_directory(str(library), use_memory=False, backend=StubBackend(), server=None)
+            return files
+        
+        # Keep run state out of the home directory, for this measurement only
+        saved_paths = batch_translator.STATE_FILE, batch_translator.LIBRARY_INDEX_FILE
+        batch_translator.STATE_FILE = tmp / "state.db"
+        batch_translator.LIBRARY_INDEX_FILE = tmp / "index.json"
+        try:
+            results['process_directory'] = measure(end_to_end, repeat)
+        finally:
+            batch_translator.STATE_FILE, batch_translator.LIBRARY_INDEX_FILE = saved_paths
+        
+        if real_model:
+            from translator import SubtitleTranslator, split_dialogue_prefix
+            from config import DECODING_PRESETS
+            with contextlib.redirect_stdout(io.StringIO()):
+                model_translator = SubtitleTranslator()
+            lines = [split_dialogue_prefix(line)[1] for sub in parsed[:200]
+                     for line in sub.text.split('\n') if line.strip()]
+            results['model_translate_lines'] = measure(lambda: len(model_translator.translate_lines(lines)), 1)
+            # The same lines under every decoding preset, sharing the loaded model
+            backend = model_translator.backend
+            for preset in DECODING_PRESETS:
+                preset_translator = SubtitleTranslator(backend=backend, preset=preset)
+                results[f'model_preset_{preset}'] = measure(
+                    lambda: len(preset_translator.translate_lines(lines)), 1)
+    
+    return results
+
+def save_results(results: Dict, output: Path, settings: Dict) -> None:
+    data = {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            **settings,
+        },
+        'results': results,
+    }
+    with open(output, 'w') as f:
+        json.dump(data, f, indent=2)
+
+def compare_results(baseline: Dict, current: Dict, threshold: float = DEFAULT_THRESHOLD) -> Dict[str, float]:
+    # Returns the throughput ratio (current / baseline) of every regressed benchmark
+    regressions = {}
+    for name, base in baseline['results'].items():
+        result = current['results'].get(name)
+        if result is None or not base['per_second']:
+            continue
+        ratio = result['per_second'] / base['per_second']
+        if ratio < 1 - threshold:
+            regressions[name] = ratio
+    return regressions
+
+def print_results(results: Dict, baseline: Optional[Dict] = None) -> None:
+    for name, result in results.items():
+        line = f"  {name:<28} {result['per_second']:12.1f} items/s  ({result['seconds'] * 1000:.1f} ms)"
+        if baseline and name in baseline['results'] and baseline['results'][name]['per_second']:
+            ratio = result['per_second'] / baseline['results'][name]['per_second']
+            line += f"  {ratio:6.2f}x baseline"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description='Subtitle translator benchmark suite')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    run_parser = subparsers.add_parser('run', help='Run the benchmarks and write JSON results')
+    run_parser.add_argument('--output', default='benchmark_results.json', help='Where to write the results')
+    run_parser.add_argument('--cues', type=int, default=20000, help='Cues in the single-file corpora')
+    run_parser.add_argument('--files', type=int, default=200, help='Subtitle files in the generated library')
+    run_parser.add_argument('--cues-per-file', type=int, default=300, help='Cues per library file')
+    run_parser.add_argument('--repeat', type=int, default=3, help='Runs per benchmark (best is kept)')
+    run_parser.add_argument('--real-model', action='store_true', help='Also time the Helsinki-NLP model from the local cache')
+    run_parser.add_argument('--baseline', help='Compare against this results file after running')
+    run_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Allowed throughput drop (fraction)')
+    
+    compare_parser = subparsers.add_parser('compare', help='Compare two results files')
+    compare_parser.add_argument('baseline', help='Baseline results JSON')
+    compare_parser.add_argument('current', help='Current results JSON')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Allowed throughput drop (fraction)')
+    
+    args = parser.parse_args()
+    
+    if args.command == 'run':
+        settings = {'cues': args.cues, 'files': args.files, 'cues_per_file': args.cues_per_file,
+                    'repeat': args.repeat, 'real_model': args.real_model}
+        results = run_suite(args.cues, args.files, args.cues_per_file, args.repeat, args.real_model)
+        save_results(results, Path(args.output), settings)
+        print(f"Results written to {args.output}")
+        if not args.baseline:
+            print_results(results)
+            return 0
+        current = {'results': results}
+    else:
+        with open(args.current) as f:
+            current = json.load(f)
+    
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    print_results(current['results'], baseline)
+    regressions = compare_results(baseline, current, args.threshold)
+    for name, ratio in regressions.items():
+        print(f"REGRESSION: {name} is at {ratio:.2f}x of baseline (threshold {1 - args.threshold:.2f}x)")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,20 @@
+from typing import List
+
+from backends import TranslationBackend
+
+class StubBackend(TranslationBackend):
+    # Deterministic stand-in for the model: no download, no torch, and a cost
+    # proportional to the input, so the benchmarks measure our own overhead
+    name = 'stub'
+
+    def __init__(self):
+        self.batches = 0
+        self.lines = 0
+
+    def count_tokens(self, lines: List[str]) -> List[int]:
+        return [len(line.split()) + 1 for line in lines]
+
+    def translate_batch(self, lines: List[str], max_length: int = 512, num_beams: int = 1) -> List[str]:
+        self.batches += 1
+        self.lines += len(lines)
+        return [' '.join(reversed(line.split())) for line in lines]
@@ -1,3 +1,5 @@
+from pathlib import Path
+
 SOURCE_LANG = "en"  # Source language code (e.g., 'en', 'ja', 'da')
 TARGET_LANG = "da"  # Target language code
 MODEL = f"Helsinki-NLP/opus-mt-{SOURCE_LANG}-{TARGET_LANG}"
@@ -6,12 +8,97 @@ SOURCE_SUFFIX = f".{SOURCE_LANG}"
 TARGET_SUFFIX = f".{TARGET_LANG}"
 
 SUBTITLE_FORMATS = [".srt", ".ass"]
+# ASS events in these styles (lowercase fnmatch patterns) are signs or song lyrics
+# and are left untranslated, like comments, drawings and karaoke-timed lines
+ASS_SKIP_STYLES = ["sign*", "*karaoke*", "kara*", "*romaji*", "op", "ed", "song*"]
+MEDIA_EXTENSIONS = [".mkv", ".mp4", ".m4v", ".avi", ".mov", ".ts"]
+
+# Inference engine: "hf" (transformers pipeline) or "ct2" (CTranslate2, converted once and cached)
+BACKEND = "hf"
+CONVERTED_MODEL_DIR = Path.home() / '.cache' / 'subtrans'
+CT2_COMPUTE_TYPE = "int8"  # e.g. "int8", "int8_float16", "float32"
+
+# CPU profile (--cpu-profile)
+CPU_QUANTIZE = True  # Dynamic int8 quantization of linear layers
+CPU_INTRA_THREADS = None  # None uses every core available to the process
+CPU_INTER_THREADS = 1
+CPU_BF16 = False  # Only used on CPUs with native bf16 (AVX512-BF16/AMX)
+
+# Batched inference settings
+MAX_LENGTH = 512  # Hard cap on generated tokens per line
+MAX_BATCH_TOKENS = 4096  # Token budget per batch (longest line * batch size)
+MAX_BATCH_SIZE = 64  # Upper bound on lines per batch
+
+# Decoding presets (--preset). A batch may generate at most
+# length_ratio * its longest input + length_offset tokens per line, capped at MAX_LENGTH.
+# "model" sets nothing and keeps the model's own generation config (4 beams for opus-mt).
+DECODING_PRESET = "model"
+DECODING_PRESETS = {
+    'model': {'num_beams': None, 'length_ratio': None, 'length_offset': None},
+    'fast': {'num_beams': 1, 'length_ratio': 1.5, 'length_offset': 8},
+    'balanced': {'num_beams': 2, 'length_ratio': 2.0, 'length_offset': 16},
+    'quality': {'num_beams': 4, 'length_ratio': 3.0, 'length_offset': 32},
+}
+
+# Several target languages in one run (--targets da,sv,no). Models are kept loaded up to
+# this budget; the least recently used one is unloaded beyond it.
+MODEL_CACHE_MB = 2048
+MODEL_MEMORY_ESTIMATE_MB = 300  # Assumed size of a model that has not been loaded yet
+MIN_CORES_PER_MODEL = 4  # Models only translate side by side when each gets this many cores
+
+# Sentence-aware merging (--merge-sentences): lines and adjacent cues that continue one
+# sentence are translated together and the result is split back by length and punctuation
+MERGE_SENTENCES = False
+MERGE_MAX_CHARS = 300  # Longest merged sentence sent to the model
+MERGE_MAX_GAP_MS = 1500  # Cues further apart than this are never merged
+
+# Persistent translation memory shared across files and runs
+USE_TRANSLATION_MEMORY = True
+TRANSLATION_MEMORY_FILE = Path.home() / '.subtitle_translator_memory.db'
+TRANSLATION_MEMORY_MAX_ENTRIES = 500000  # Least recently used lines are evicted beyond this
+
+# Cached directory listings, so unchanged subtrees are not relisted on later runs
+LIBRARY_INDEX_FILE = Path.home() / '.subtitle_translator_index.json'
+
+# Per-library run state (fingerprint, per-file status) shared by concurrent runs
+STATE_DB_FILE = Path.home() / '.subtitle_translator_state.db'
+
+# ffprobe results cached by path, size and mtime for library scans
+PROBE_CACHE_FILE = Path.home() / '.subtitle_translator_probes.json'
+
+# Several nodes sharing one library (--distributed) claim files through lease files in
+# <library>/.subtrans-claims. A claim that is not renewed within the lease is taken over.
+CLAIM_DIR_NAME = '.subtrans-claims'
+CLAIM_LEASE_SECONDS = 900  # Renewed every third of this while the file is translated
+CLAIM_BATCH_FILES = 4  # Files a node claims at a time
+
+# Watch mode
+WATCH_SETTLE_SECONDS = 10  # Quiet period before a new or modified file is translated
+WATCH_POLL_SECONDS = 30  # Rescan interval when inotify is unavailable
+WATCH_RECONCILE_SECONDS = 3600  # Full rescan to catch missed events
+
+# Translated lines of an unfinished file are checkpointed every N batches, so a
+# killed run resumes where it stopped
+CHECKPOINT_EVERY_BATCHES = 4
+
+# Minimum seconds between progress lines (and Prometheus textfile rewrites)
+PROGRESS_INTERVAL_SECONDS = 5
+
+# Translation server (subtrans serve). The CLIs use it automatically while it is running.
+# Either a Unix socket path or an http://host:port URL.
+SERVER_ADDRESS = str(Path.home() / '.subtitle_translator.sock')
+SERVER_MAX_WAIT_MS = 20  # How long a request may wait for others to share its batch
+SERVER_MAX_BATCH_LINES = 64  # Lines coalesced into one inference call
+SERVER_TIMEOUT = 600  # Client timeout in seconds for one request
+
+# Number of parsed files allowed to wait ahead of (and behind) the model
+PIPELINE_QUEUE_SIZE = 2
 
 def get_source_patterns():
     return [f"*{SOURCE_SUFFIX}{ext}" for ext in SUBTITLE_FORMATS]
 
-def get_target_suffix():
-    return TARGET_SUFFIX
+def get_target_suffix(target=None):
+    return TARGET_SUFFIX if target is None else f".{target}"
 
-def get_model_name():
-    return MODEL 
\ No newline at end of file
+def get_model_name(target=None):
+    return MODEL if target is None else f"Helsinki-NLP/opus-mt-{SOURCE_LANG}-{target}"
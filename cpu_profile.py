@@ -0,0 +1,126 @@
+import argparse
+import os
+import time
+from typing import Dict, List, Optional
+from config import CPU_QUANTIZE, CPU_INTRA_THREADS, CPU_INTER_THREADS, CPU_BF16
+
+class CpuProfile:
+    def __init__(self, quantize: bool = CPU_QUANTIZE, intra_threads: Optional[int] = CPU_INTRA_THREADS,
+                 inter_threads: Optional[int] = CPU_INTER_THREADS, bf16: bool = CPU_BF16):
+        self.quantize = quantize
+        self.intra_threads = intra_threads
+        self.inter_threads = inter_threads
+        self.bf16 = bf16
+
+    def __repr__(self):
+        return (f"CpuProfile(quantize={self.quantize}, intra_threads={self.intra_threads}, "
+                f"inter_threads={self.inter_threads}, bf16={self.bf16})")
+
+def cpu_supports_bf16() -> bool:
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+def apply_thread_settings(profile: CpuProfile) -> None:
+    import torch
+    if profile.intra_threads:
+        torch.set_num_threads(profile.intra_threads)
+    if profile.inter_threads:
+        try:
+            torch.set_num_interop_threads(profile.inter_threads)
+        except RuntimeError:
+            # Can only be set before the first parallel work has started
+            print("Warning: inter-op thread count already fixed for this process")
+
+def model_precision(profile: Optional[CpuProfile]) -> str:
+    # What optimize_model turns the weights into
+    if profile is None:
+        return 'fp32'
+    if profile.bf16 and cpu_supports_bf16():
+        return 'bf16'
+    return 'int8' if profile.quantize else 'fp32'
+
+def optimize_model(model, profile: CpuProfile):
+    import torch
+    if profile.bf16:
+        if cpu_supports_bf16():
+            return model.to(torch.bfloat16)
+        print("Warning: CPU has no native bf16 support, keeping fp32")
+    if profile.quantize:
+        # Marian spends most of its time in nn.Linear; int8 weights with dynamic activations
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+def add_cpu_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group('CPU inference profile')
+    group.add_argument('--cpu-profile', action='store_true', help='Optimize for CPU: int8 dynamic quantization and thread tuning')
+    group.add_argument('--threads', type=int, default=CPU_INTRA_THREADS, help='Intra-op threads (default: all available cores)')
+    group.add_argument('--interop-threads', type=int, default=CPU_INTER_THREADS, help='Inter-op threads')
+    group.add_argument('--no-quantize', action='store_true', help='With --cpu-profile, keep fp32 weights')
+    group.add_argument('--bf16', action='store_true', help='With --cpu-profile, run in bf16 on CPUs that support it')
+
+def cpu_profile_from_args(args) -> Optional[CpuProfile]:
+    if not args.cpu_profile:
+        return None
+    intra_threads = args.threads
+    if intra_threads is None and hasattr(os, 'sched_getaffinity'):
+        intra_threads = len(os.sched_getaffinity(0))
+    return CpuProfile(
+        quantize=not args.no_quantize,
+        intra_threads=intra_threads,
+        inter_threads=args.interop_threads,
+        bf16=args.bf16
+    )
+
+def _token_f1(reference: str, candidate: str) -> float:
+    ref, cand = reference.split(), candidate.split()
+    if not ref and not cand:
+        return 1.0
+    common = sum(min(ref.count(token), cand.count(token)) for token in set(cand))
+    if not common:
+        return 0.0
+    precision, recall = common / len(cand), common / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+def compare_outputs(reference: List[str], candidate: List[str]) -> Dict[str, float]:
+    pairs = list(zip(reference, candidate))
+    if not pairs:
+        return {'exact_match': 1.0, 'token_f1': 1.0}
+    return {
+        'exact_match': sum(ref == cand for ref, cand in pairs) / len(pairs),
+        'token_f1': sum(_token_f1(ref, cand) for ref, cand in pairs) / len(pairs),
+    }
+
+def _timed_translation(translator, lines: List[str]):
+    start = time.perf_counter()
+    translated = translator.translate_lines(lines)
+    return translated, time.perf_counter() - start
+
+def run_self_check(sample_path: str, profile: CpuProfile, backend: str) -> Dict[str, float]:
+    from translator import SubtitleTranslator, split_dialogue_prefix
+    from subtitle_formats import get_subtitle_handler
+    
+    handler = get_subtitle_handler(sample_path)
+    subs = handler.read(sample_path)
+    items = subs.events if hasattr(subs, 'events') else subs
+    lines = [split_dialogue_prefix(line)[1] for sub in items
+             for line in handler.get_text(sub).split('\n') if line.strip()]
+    
+    print(f"Self-check on {len(lines)} lines from {sample_path}")
+    baseline, baseline_time = _timed_translation(SubtitleTranslator(device='cpu', backend=backend), lines)
+    optimized, optimized_time = _timed_translation(
+        SubtitleTranslator(device='cpu', backend=backend, cpu_profile=profile), lines)
+    
+    report = compare_outputs(baseline, optimized)
+    report['baseline_lines_per_second'] = len(lines) / baseline_time if baseline_time else 0.0
+    report['profile_lines_per_second'] = len(lines) / optimized_time if optimized_time else 0.0
+    report['speedup'] = baseline_time / optimized_time if optimized_time else 0.0
+    
+    print(f"  fp32:    {report['baseline_lines_per_second']:8.1f} lines/s")
+    print(f"  profile: {report['profile_lines_per_second']:8.1f} lines/s ({report['speedup']:.2f}x) {profile}")
+    print(f"  agreement with fp32: {report['exact_match']:.1%} identical lines, "
+          f"token F1 {report['token_f1']:.3f}")
+    return report
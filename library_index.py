@@ -0,0 +1,157 @@
+import fnmatch
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from manifest import TranslationManifest, get_manifest_path
+from config import get_source_patterns, get_target_suffix, SUBTITLE_FORMATS, CLAIM_DIR_NAME
+
+# Directories modified this recently are always relisted, since a change made in
+# the same mtime tick as the previous scan would otherwise go unnoticed
+MTIME_GRACE_SECONDS = 2.0
+
+def get_target_path(source_path: Path, target: Optional[str] = None) -> Path:
+    return source_path.parent / f"{source_path.stem[:-3]}{get_target_suffix(target)}{source_path.suffix}"
+
+class LibraryScan:
+    def __init__(self, root: Path, sources: List[Tuple[str, int, int]], targets: Set[str], manifests: Set[str]):
+        self.root = root
+        self.sources = sorted(sources)
+        self.targets = targets
+        self.manifests = manifests
+
+    @property
+    def source_paths(self) -> List[Path]:
+        return [Path(path) for path, _, _ in self.sources]
+
+    def fingerprint(self, targets: Optional[List[str]] = None) -> str:
+        hasher = hashlib.md5()
+        hasher.update("\n".join(f"{path}|{size}|{mtime_ns}" for path, size, mtime_ns in self.sources).encode())
+        if targets is not None:
+            # Asking for another language is a change even if no file moved
+            hasher.update(f"\ntargets|{','.join(targets)}".encode())
+        return hasher.hexdigest()
+
+    def needs_translation(self, source_path: Path, target: Optional[str] = None) -> bool:
+        target_path = get_target_path(source_path, target)
+        if str(target_path) not in self.targets:
+            return True
+        if str(get_manifest_path(target_path)) not in self.manifests:
+            return False
+        manifest = TranslationManifest.load(target_path)
+        return manifest is not None and not manifest.matches_source(source_path)
+
+    def files_to_translate(self, target: Optional[str] = None) -> List[Path]:
+        return [path for path in self.source_paths if self.needs_translation(path, target)]
+
+class LibraryIndex:
+    def __init__(self, root, index_file: Optional[Path] = None):
+        self.root = Path(root)
+        self.index_file = Path(index_file) if index_file is not None else None
+        self.dirs: Dict[str, Dict] = {}
+        self.listed = 0
+        self.reused = 0
+        self._source_patterns = get_source_patterns()
+        # Every other subtitle file may be a translation, whichever targets a run asks for
+        self._subtitle_endings = tuple(SUBTITLE_FORMATS)
+        self._load()
+
+    def _root_key(self) -> str:
+        return str(self.root.resolve())
+
+    def _load(self) -> None:
+        if self.index_file is None or not self.index_file.exists():
+            return
+        try:
+            with open(self.index_file, 'r') as f:
+                self.dirs = json.load(f).get(self._root_key(), {})
+        except (json.JSONDecodeError, OSError):
+            self.dirs = {}
+
+    def save(self) -> None:
+        if self.index_file is None:
+            return
+        data = {}
+        if self.index_file.exists():
+            try:
+                with open(self.index_file, 'r') as f:
+                    data = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                data = {}
+        data[self._root_key()] = self.dirs
+        # Concurrent runs each write their own temp file and the last rename wins. Only
+        # a cache is lost: a library whose listing was dropped is relisted next time.
+        tmp_path = self.index_file.with_name(f"{self.index_file.name}.tmp{os.getpid()}")
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.index_file)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def _list_directory(self, directory: str, mtime_ns: int) -> Dict:
+        entry = {'mtime_ns': mtime_ns, 'sources': [], 'subtitles': [], 'manifests': [], 'subdirs': []}
+        with os.scandir(directory) as it:
+            for item in it:
+                name = item.name
+                try:
+                    if item.is_dir():
+                        if name != CLAIM_DIR_NAME:
+                            entry['subdirs'].append(name)
+                        continue
+                except OSError:
+                    continue
+                if any(fnmatch.fnmatch(name, pattern) for pattern in self._source_patterns):
+                    entry['sources'].append(name)
+                elif name.endswith(self._subtitle_endings):
+                    entry['subtitles'].append(name)
+                elif name.startswith('.') and name.endswith('.subtrans.json'):
+                    entry['manifests'].append(name)
+        return entry
+
+    def scan(self) -> LibraryScan:
+        started = time.time()
+        sources, targets, manifests = [], set(), set()
+        visited = set()
+        dirs = {}
+        stack = [str(self.root)]
+        
+        while stack:
+            directory = stack.pop()
+            try:
+                stats = os.stat(directory)
+            except OSError:
+                continue
+            if (stats.st_dev, stats.st_ino) in visited:
+                continue
+            visited.add((stats.st_dev, stats.st_ino))
+            
+            cached = self.dirs.get(directory)
+            # Entries written before 'subtitles' only listed Danish targets
+            if (cached is not None and 'subtitles' in cached and cached['mtime_ns'] == stats.st_mtime_ns
+                    and started - stats.st_mtime_ns / 1e9 > MTIME_GRACE_SECONDS):
+                entry = cached
+                self.reused += 1
+            else:
+                try:
+                    entry = self._list_directory(directory, stats.st_mtime_ns)
+                except OSError:
+                    continue
+                self.listed += 1
+            dirs[directory] = entry
+            
+            for name in entry['sources']:
+                path = os.path.join(directory, name)
+                try:
+                    source_stats = os.stat(path)
+                except OSError:
+                    continue
+                sources.append((path, source_stats.st_size, source_stats.st_mtime_ns))
+            targets.update(os.path.join(directory, name) for name in entry['subtitles'])
+            manifests.update(os.path.join(directory, name) for name in entry['manifests'])
+            stack.extend(os.path.join(directory, name) for name in entry['subdirs'])
+        
+        self.dirs = dirs
+        return LibraryScan(self.root, sources, targets, manifests)
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+from config import CHECKPOINT_EVERY_BATCHES
+
+MANIFEST_VERSION = 1
+
+def get_manifest_path(output_path) -> Path:
+    output_path = Path(output_path)
+    return output_path.parent / f".{output_path.name}.subtrans.json"
+
+def get_journal_path(output_path) -> Path:
+    output_path = Path(output_path)
+    return output_path.parent / f".{output_path.name}.subtrans.journal"
+
+def cue_key(text: str) -> str:
+    # Keyed on text only, so cues that were merely retimed still match
+    normalized = '\n'.join(' '.join(line.split()) for line in text.split('\n') if line.strip())
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+def cue_translations(keys: List[str], texts: List[Optional[str]]) -> Dict[str, str]:
+    # Manifest entries by cue text. A text whose cues were translated differently (e.g.
+    # into different pieces of merged sentences) is left out and retranslated next time.
+    translations = {}
+    conflicting = set()
+    for key, text in zip(keys, texts):
+        if text is None:
+            continue
+        if translations.get(key, text) != text:
+            conflicting.add(key)
+        translations[key] = text
+    for key in conflicting:
+        del translations[key]
+    return translations
+
+def file_hash(path) -> str:
+    hasher = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+class TranslationManifest:
+    def __init__(self, path, model: str, source: Optional[Dict] = None, cues: Optional[Dict[str, str]] = None):
+        self.path = Path(path)
+        self.model = model
+        self.source = source or {}
+        self.cues = cues or {}
+
+    @classmethod
+    def load(cls, output_path) -> Optional['TranslationManifest']:
+        path = get_manifest_path(output_path)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if data.get('version') != MANIFEST_VERSION:
+            return None
+        return cls(path, data.get('model', ''), data.get('source'), data.get('cues'))
+
+    @classmethod
+    def create(cls, source_path, output_path, model: str, cues: Dict[str, str]) -> 'TranslationManifest':
+        stats = os.stat(source_path)
+        source = {
+            'size': stats.st_size,
+            'mtime_ns': stats.st_mtime_ns,
+            'sha1': file_hash(source_path),
+        }
+        return cls(get_manifest_path(output_path), model, source, cues)
+
+    def matches_source(self, source_path) -> bool:
+        try:
+            stats = os.stat(source_path)
+        except FileNotFoundError:
+            return False
+        if stats.st_size == self.source.get('size') and stats.st_mtime_ns == self.source.get('mtime_ns'):
+            return True
+        # Touched but possibly unchanged (e.g. copied or restored), so compare content
+        return stats.st_size == self.source.get('size') and file_hash(source_path) == self.source.get('sha1')
+
+    def translations_for(self, model: str) -> Dict[str, str]:
+        return self.cues if self.model == model else {}
+
+    def save(self) -> None:
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp{os.getpid()}")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': MANIFEST_VERSION,
+                'model': self.model,
+                'source': self.source,
+                'cues': self.cues,
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+class TranslationJournal:
+    # Checkpoint of a file that is still being translated: a JSON header line with the
+    # model, then one JSON object per checkpoint mapping source lines to translations.
+    # Appended every few batches and removed once the output and manifest are written.
+    def __init__(self, path, model: str, entries: Optional[Dict[str, str]] = None,
+                 every: int = CHECKPOINT_EVERY_BATCHES):
+        self.path = Path(path)
+        self.model = model
+        self.entries = entries or {}
+        self.every = max(1, every)
+        self._pending: Dict[str, str] = {}
+        self._batches = 0
+        self._file = None
+
+    @classmethod
+    def open(cls, output_path, model: str, every: int = CHECKPOINT_EVERY_BATCHES) -> 'TranslationJournal':
+        path = get_journal_path(output_path)
+        entries: Dict[str, str] = {}
+        torn = False
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline() or '{}')
+                if header.get('model') == model:
+                    for line in f:
+                        try:
+                            entries.update(json.loads(line))
+                        except json.JSONDecodeError:
+                            # Killed halfway through an append
+                            torn = True
+                            break
+        except FileNotFoundError:
+            return cls(path, model, every=every)
+        except json.JSONDecodeError:
+            pass
+        
+        journal = cls(path, model, entries, every)
+        if not entries:
+            path.unlink(missing_ok=True)
+        elif torn:
+            journal._rewrite()
+        return journal
+
+    def _rewrite(self) -> None:
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp{os.getpid()}")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'model': self.model}) + '\n')
+            f.write(json.dumps(self.entries, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def record(self, translations: Dict[str, str]) -> None:
+        self.entries.update(translations)
+        self._pending.update(translations)
+        self._batches += 1
+        if self._batches >= self.every:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        if self._file is None:
+            fresh = not self.path.exists()
+            self._file = open(self.path, 'a', encoding='utf-8')
+            if fresh:
+                self._file.write(json.dumps({'model': self.model}) + '\n')
+        self._file.write(json.dumps(self._pending, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = {}
+        self._batches = 0
+
+    def close(self) -> None:
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._pending = {}
+        self.path.unlink(missing_ok=True)
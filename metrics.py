@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+from config import PROGRESS_INTERVAL_SECONDS
+
+METRIC_PREFIX = 'subtrans'
+FORMATS = ('jsonl', 'prometheus')
+
+def _label_key(labels: Dict[str, str]) -> Tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+class Metrics:
+    # Counters and gauges are aggregated in memory; events are per file/run records.
+    # With a jsonl sink every event is appended as it happens, with a prometheus
+    # sink the aggregates are rewritten (atomically) for the node exporter textfile collector.
+    def __init__(self):
+        self.counters: Dict[Tuple[str, Tuple], float] = {}
+        self.gauges: Dict[Tuple[str, Tuple], float] = {}
+        self.path: Optional[Path] = None
+        self.format = 'jsonl'
+        self.flush_interval = PROGRESS_INTERVAL_SECONDS
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+
+    def configure(self, path, metrics_format: str = 'jsonl') -> None:
+        if metrics_format not in FORMATS:
+            raise ValueError(f"Unknown metrics format: {metrics_format} (choose from {', '.join(FORMATS)})")
+        self.path = Path(path) if path is not None else None
+        self.format = metrics_format
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+
+    def incr(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self.gauges[(name, _label_key(labels))] = value
+
+    def counter(self, name: str, **labels) -> float:
+        return self.counters.get((name, _label_key(labels)), 0)
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.incr('stage_seconds', time.perf_counter() - start, stage=stage)
+
+    def event(self, name: str, **fields) -> None:
+        if self.path is not None and self.format == 'jsonl':
+            record = {'ts': round(time.time(), 3), 'event': name, **fields}
+            with self._lock:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record) + '\n')
+        self.flush()
+
+    def prometheus_text(self) -> str:
+        lines = []
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+        for kind, values in (('counter', counters), ('gauge', gauges)):
+            seen = set()
+            for (name, labels), value in sorted(values.items()):
+                metric = f"{METRIC_PREFIX}_{name}_total" if kind == 'counter' else f"{METRIC_PREFIX}_{name}"
+                if metric not in seen:
+                    lines.append(f"# TYPE {metric} {kind}")
+                    seen.add(metric)
+                label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+                lines.append(f"{metric}{{{label_text}}} {value:g}" if label_text else f"{metric} {value:g}")
+        return '\n'.join(lines) + '\n'
+
+    def flush(self, force: bool = False) -> None:
+        if self.path is None or self.format != 'prometheus':
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        text = self.prometheus_text()
+        tmp_path = self.path.with_name(self.path.name + f'.tmp{os.getpid()}')
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, self.path)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                'counters': {self._display(key): value for key, value in self.counters.items()},
+                'gauges': {self._display(key): value for key, value in self.gauges.items()},
+            }
+
+    @staticmethod
+    def _display(key: Tuple[str, Tuple]) -> str:
+        name, labels = key
+        return name + (''.join(f"[{k}={v}]" for k, v in labels) if labels else '')
+
+    def close(self) -> None:
+        if self.path is not None and self.format == 'jsonl':
+            self.event('summary', **self.summary())
+        self.flush(force=True)
+
+metrics = Metrics()
+
+def record_file(path: str, stats: Dict, timings: Dict[str, float]) -> None:
+    # stats comes from SubtitleTranslator.last_stats, timings maps stage name to seconds
+    metrics.incr('files')
+    for key in ('cues', 'lines', 'tokens'):
+        metrics.incr(key, stats.get(key, 0))
+    for stage, seconds in timings.items():
+        metrics.incr('stage_seconds', seconds, stage=stage)
+    translate = timings.get('translate', 0.0)
+    rates = {f"{key}_per_second": round(stats.get(key, 0) / translate, 2) if translate > 0 else 0.0
+             for key in ('cues', 'lines', 'tokens')}
+    metrics.event('file', path=str(path), **stats,
+                  **{f"{stage}_seconds": round(seconds, 4) for stage, seconds in timings.items()}, **rates)
+
+class ProgressReporter:
+    # Prints at most once per interval. Work that finishes within the first
+    # interval prints nothing, so short calls stay quiet.
+    def __init__(self, label: str, total: int, interval: float = PROGRESS_INTERVAL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.clock = clock
+        self.start = clock()
+        self._last = self.start
+
+    def update(self, done: int, unit: str = 'items') -> None:
+        now = self.clock()
+        if done < self.total and now - self._last < self.interval:
+            return
+        if done >= self.total and now - self.start < self.interval:
+            return
+        self._last = now
+        elapsed = now - self.start
+        rate = done / elapsed if elapsed > 0 else 0.0
+        print(f"[{self.label}] {done}/{self.total} {unit} ({rate:.1f} {unit}/s)")
+
+def add_metrics_arguments(parser) -> None:
+    parser.add_argument('--metrics-file', help='Write timing and throughput metrics to this file')
+    parser.add_argument('--metrics-format', choices=FORMATS, default='jsonl',
+                        help='JSON lines events or a Prometheus textfile')
+
+def configure_from_args(args) -> None:
+    if args.metrics_file:
+        metrics.configure(args.metrics_file, args.metrics_format)
@@ -0,0 +1,264 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from subtitle_formats import get_subtitle_handler
+from manifest import TranslationJournal, TranslationManifest, cue_key, cue_translations
+from metrics import record_file
+from config import PIPELINE_QUEUE_SIZE, TARGET_LANG, get_model_name
+
+_DONE = object()
+_STAGE_CHECK_SECONDS = 0.5
+
+class StageStats:
+    def __init__(self, name: str, workers: int = 1):
+        self.name = name
+        self.workers = workers
+        self.busy = 0.0
+        self.items = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self.busy += seconds
+            self.items += 1
+
+    def utilization(self, wall: float) -> float:
+        return self.busy / (wall * self.workers) if wall > 0 else 0.0
+
+class TargetOutput:
+    # One target language of a parsed file
+    __slots__ = ('target', 'model', 'output_path', 'previous', 'journal', 'translations', 'stats', 'timings',
+                 'error')
+
+    def __init__(self, target: str, output_path: str):
+        self.target = target
+        # The translator's cache key (model, preset and backend), set once it is in use
+        self.model = get_model_name(target)
+        self.output_path = output_path
+        self.previous = None
+        self.journal = None
+        self.translations = None
+        self.stats = {}
+        self.timings = {}
+        self.error = None
+
+class PipelineItem:
+    __slots__ = ('job', 'input_path', 'handler', 'subs', 'keys', 'outputs', 'error', 'timings')
+
+    def __init__(self, job):
+        self.job = job
+        self.input_path = None
+        self.handler = None
+        self.subs = None
+        self.keys = None
+        self.outputs: List[TargetOutput] = []
+        self.error = None
+        self.timings = {}
+
+# Loader threads run the optional prepare step (e.g. ffmpeg extraction) and parse,
+# the calling thread runs inference and a writer thread saves. Full queues block
+# the producing stage, so at most queue_size parsed files wait ahead of the model.
+# With several targets each file is parsed once and translated by every target's
+# model (side by side when concurrency allows); translator is then a ModelCache.
+class TranslationPipeline:
+    def __init__(self, translator, prepare: Optional[Callable[[Any], str]] = None,
+                 load_workers: int = 1, queue_size: int = PIPELINE_QUEUE_SIZE,
+                 on_complete: Optional[Callable[[Any, Optional[str]], None]] = None,
+                 targets: Optional[List[str]] = None,
+                 select_targets: Optional[Callable[[str], List[str]]] = None, concurrency: int = 1,
+                 may_write: Optional[Callable[[Any], bool]] = None):
+        from translator import apply_translations, document_cues, get_output_path
+        self.translator = translator
+        self.prepare = prepare
+        self.load_workers = max(1, load_workers)
+        self.queue_size = queue_size
+        self.on_complete = on_complete
+        self.targets = targets if targets is not None else [getattr(translator, 'target', TARGET_LANG)]
+        # Narrows the targets per input file, e.g. to those without an up to date output
+        self.select_targets = select_targets
+        self.concurrency = max(1, min(concurrency, len(self.targets)))
+        # Asked right before a job's outputs are saved, e.g. whether this node still owns the file
+        self.may_write = may_write
+        self.get_output_path = get_output_path
+        self.document_cues = document_cues
+        self.apply_translations = apply_translations
+        self.stats = {
+            'extract': StageStats('extract', self.load_workers),
+            'parse': StageStats('parse', self.load_workers),
+            'translate': StageStats('translate', self.concurrency),
+            'write': StageStats('write'),
+        }
+        self.wall = 0.0
+        self.results: List[Tuple[Any, Optional[str]]] = []
+        # Busy seconds spent on each job across all stages
+        self.durations: Dict[Any, float] = {}
+
+    def _timed(self, timings: Dict[str, float], stage: str, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            self.stats[stage].record(seconds)
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def _use(self, target: str):
+        if hasattr(self.translator, 'use'):
+            return self.translator.use(target)
+        return nullcontext(self.translator)
+
+    def _load(self, jobs: queue.Queue, parsed: queue.Queue) -> None:
+        try:
+            self._load_jobs(jobs, parsed)
+        finally:
+            parsed.put(_DONE)
+
+    def _load_jobs(self, jobs: queue.Queue, parsed: queue.Queue) -> None:
+        while True:
+            try:
+                job = jobs.get_nowait()
+            except queue.Empty:
+                break
+            
+            item = PipelineItem(job)
+            try:
+                if self.prepare is not None:
+                    item.input_path = str(self._timed(item.timings, 'extract', self.prepare, job))
+                else:
+                    item.input_path = str(job)
+                targets = self.select_targets(item.input_path) if self.select_targets else self.targets
+                item.handler = get_subtitle_handler(item.input_path)
+                item.subs = self._timed(item.timings, 'parse', item.handler.read, item.input_path)
+                item.keys = [cue_key(item.handler.get_text(sub)) for sub in self.document_cues(item.subs)]
+                for target in targets:
+                    item.outputs.append(TargetOutput(target, str(self.get_output_path(item.input_path, target))))
+            except Exception as e:
+                item.error = str(e)
+            parsed.put(item)
+
+    def _write(self, translated: queue.Queue) -> None:
+        while True:
+            item = translated.get()
+            if item is _DONE:
+                break
+            
+            if item.error is None and self.may_write is not None and not self.may_write(item.job):
+                item.error = "Not saved: another node took this file over"
+            if item.error is None:
+                for output in item.outputs:
+                    if output.error is not None:
+                        continue
+                    try:
+                        self.apply_translations(item.handler, item.subs, output.translations)
+                        self._timed(output.timings, 'write', item.handler.save, item.subs, output.output_path)
+                        TranslationManifest.create(item.input_path, output.output_path, output.model,
+                                                   cue_translations(item.keys, output.translations)).save()
+                        output.journal.remove()
+                        record_file(item.input_path, output.stats, {**item.timings, **output.timings})
+                        print(f"Translation completed! Saved to: {output.output_path}")
+                    except Exception as e:
+                        output.error = str(e)
+                item.error = self._combined_error(item)
+            # Drop the parsed document as soon as it is on disk
+            item.subs = None
+            for output in item.outputs:
+                output.translations = None
+            
+            self.results.append((item.job, item.error))
+            self.durations[item.job] = sum(item.timings.values()) + sum(
+                sum(output.timings.values()) for output in item.outputs)
+            if self.on_complete is not None:
+                # A failing callback (e.g. a locked state database) must not stop the writer,
+                # or the translate stage would wait forever on the full queue
+                try:
+                    self.on_complete(item.job, item.error)
+                except Exception as e:
+                    print(f"Error recording result of {item.job}: {e}")
+                    self.results[-1] = (item.job, item.error or f"Could not record result: {e}")
+
+    def run(self, jobs: Iterable[Any]) -> List[Tuple[Any, Optional[str]]]:
+        job_queue = queue.Queue()
+        for job in jobs:
+            job_queue.put(job)
+        parsed = queue.Queue(maxsize=self.queue_size)
+        translated = queue.Queue(maxsize=self.queue_size)
+        
+        start = time.perf_counter()
+        pool = ThreadPoolExecutor(self.concurrency) if self.concurrency > 1 else None
+        loaders = [threading.Thread(target=self._load, args=(job_queue, parsed), daemon=True)
+                   for _ in range(self.load_workers)]
+        writer = threading.Thread(target=self._write, args=(translated,), daemon=True)
+        for thread in loaders:
+            thread.start()
+        writer.start()
+        
+        finished_loaders = 0
+        while finished_loaders < len(loaders):
+            item = parsed.get()
+            if item is _DONE:
+                finished_loaders += 1
+                continue
+            
+            if item.error is None:
+                if pool is not None and len(item.outputs) > 1:
+                    list(pool.map(lambda output: self._translate(item, output), item.outputs))
+                else:
+                    for output in item.outputs:
+                        self._translate(item, output)
+            self._put(translated, item, writer)
+        
+        self._put(translated, _DONE, writer)
+        writer.join()
+        if pool is not None:
+            pool.shutdown()
+        self.wall = time.perf_counter() - start
+        return self.results
+
+    def _put(self, translated: queue.Queue, item, writer: threading.Thread) -> None:
+        while True:
+            try:
+                translated.put(item, timeout=_STAGE_CHECK_SECONDS)
+                return
+            except queue.Full:
+                if not writer.is_alive():
+                    raise RuntimeError("Pipeline writer stopped unexpectedly; remaining files were not saved")
+
+    def _translate(self, item: PipelineItem, output: TargetOutput) -> None:
+        try:
+            with self._use(output.target) as translator:
+                # Earlier translations only count if they came from the same model, preset and backend
+                output.model = getattr(translator, 'cache_key', output.model)
+                manifest = TranslationManifest.load(output.output_path)
+                if manifest is not None:
+                    output.previous = manifest.translations_for(output.model)
+                output.journal = TranslationJournal.open(output.output_path, output.model)
+                # The shared document is left untouched; the writer applies each target in turn
+                output.translations = self._timed(output.timings, 'translate', translator.translate_document,
+                                                  item.handler, item.subs, item.input_path, output.previous,
+                                                  output.journal, apply=False)
+                output.stats = dict(getattr(translator, 'last_stats', {}))
+            if len(self.targets) > 1:
+                output.stats['target'] = output.target
+        except Exception as e:
+            output.error = str(e)
+        finally:
+            if output.journal is not None:
+                output.journal.close()
+
+    def _combined_error(self, item: PipelineItem) -> Optional[str]:
+        errors = [(output.target, output.error) for output in item.outputs if output.error is not None]
+        if not errors:
+            return None
+        if len(self.targets) == 1:
+            return errors[0][1]
+        return '; '.join(f"{target}: {error}" for target, error in errors)
+
+    def print_report(self) -> None:
+        print(f"\nPipeline finished {len(self.results)} files in {self.wall:.1f}s")
+        for stats in self.stats.values():
+            if stats.items:
+                print(f"  {stats.name:<10} {stats.items:>5} items  {stats.busy:8.1f}s busy  "
+                      f"{stats.utilization(self.wall):6.1%} utilization")
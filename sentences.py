@@ -0,0 +1,115 @@
+import re
+from typing import List, Optional, Sequence, Tuple
+from config import MERGE_MAX_CHARS, MERGE_MAX_GAP_MS
+
+# A segment is (cue_index, dialogue_prefix, body), as gathered by translate_document
+Segment = Tuple[int, str, str]
+
+_SENTENCE_END = re.compile(r'[.!?♪]["\'”’)\]]*$')
+_ELLIPSIS_END = re.compile(r'(\.\.\.|…)["\'”’)\]]*$')
+_SPLIT_PUNCTUATION = ',;:.!?…'
+_MARKUP = ('<', '{')
+
+def ends_sentence(body: str, following: Optional[str] = None) -> bool:
+    body = body.rstrip()
+    if _ELLIPSIS_END.search(body):
+        # "I was going to..." / "...tell you" is one sentence across the break
+        return not (following and (following.startswith(('...', '…')) or following[:1].islower()))
+    return bool(_SENTENCE_END.search(body))
+
+def _has_markup(body: str) -> bool:
+    return any(marker in body for marker in _MARKUP)
+
+def _track(item) -> Tuple[str, str]:
+    # ASS events in different styles or layers are separate streams of text (e.g. two
+    # speakers at the top and bottom); SRT cues all share one
+    return getattr(item, 'style', ''), getattr(item, 'layer', '')
+
+def _time_ranks(items: Sequence) -> List[int]:
+    # Position of each cue among all cues sorted by track, then start time, since
+    # ASS events are often stored out of order
+    order = sorted(range(len(items)), key=lambda k: (_track(items[k]), getattr(items[k], 'start', 0) or 0, k))
+    ranks = [0] * len(items)
+    for rank, k in enumerate(order):
+        ranks[k] = rank
+    return ranks
+
+def group_sentences(segments: Sequence[Segment], items: Optional[Sequence] = None,
+                    max_chars: int = MERGE_MAX_CHARS, max_gap_ms: int = MERGE_MAX_GAP_MS) -> List[List[int]]:
+    # Group members are segment indices in reading order, which is not always file order
+    ranks = _time_ranks(items) if items is not None else None
+    order = sorted(range(len(segments)), key=lambda i: (ranks[segments[i][0]] if ranks else segments[i][0], i))
+    groups: List[List[int]] = []
+    length = 0
+    previous = None
+    for i in order:
+        cue_index, prefix, body = segments[i]
+        if groups:
+            previous_cue, _, previous_body = segments[previous]
+            joinable = (
+                not prefix  # each dialogue dash starts a new speaker
+                and not ends_sentence(previous_body, body)
+                and not _has_markup(body) and not _has_markup(previous_body)
+                and length + 1 + len(body) <= max_chars
+            )
+            if joinable and cue_index != previous_cue:
+                joinable = _follows(items, ranks, previous_cue, cue_index, max_gap_ms)
+            if joinable:
+                groups[-1].append(i)
+                length += 1 + len(body)
+                previous = i
+                continue
+        groups.append([i])
+        length = len(body)
+        previous = i
+    return groups
+
+def _follows(items: Optional[Sequence], ranks: Optional[List[int]], first: int, second: int,
+             max_gap_ms: int) -> bool:
+    # The second cue comes right after the first on the same track, without overlapping it
+    if items is None:
+        return second == first + 1
+    return (ranks[second] == ranks[first] + 1
+            and _track(items[first]) == _track(items[second])
+            and 0 <= _cue_gap(items, first, second) <= max_gap_ms)
+
+def _cue_gap(items: Optional[Sequence], first: int, second: int) -> float:
+    if items is None:
+        return 0
+    start = getattr(items[second], 'start', None)
+    end = getattr(items[first], 'end', None)
+    if start is None or end is None:
+        return 0
+    return start - end
+
+def split_translation(text: str, weights: Sequence[int]) -> Optional[List[str]]:
+    # Cut the translation into len(weights) pieces at word boundaries, aiming for the
+    # source proportions and preferring cuts right after punctuation. Returns None when
+    # there are fewer words than pieces, since some cue would be left blank.
+    if len(weights) == 1:
+        return [text]
+    words = text.split()
+    if len(words) < len(weights):
+        return None
+    if len(words) == len(weights):
+        return words
+    text = ' '.join(words)
+    spaces = [i for i, char in enumerate(text) if char == ' ']
+    total = sum(max(weight, 1) for weight in weights)
+    bonus = 0.3 * len(text) / len(weights)
+
+    pieces = []
+    start = 0
+    cumulative = 0
+    candidates = spaces
+    for k, weight in enumerate(weights[:-1]):
+        cumulative += max(weight, 1)
+        remaining = len(weights) - k - 2  # cuts still needed after this one
+        usable = candidates[:len(candidates) - remaining] if remaining else candidates
+        target = len(text) * cumulative / total
+        cut = min(usable, key=lambda pos: abs(pos - target) - (bonus if text[pos - 1] in _SPLIT_PUNCTUATION else 0))
+        pieces.append(text[start:cut])
+        start = cut + 1
+        candidates = [pos for pos in candidates if pos > cut]
+    pieces.append(text[start:])
+    return pieces
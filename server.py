@@ -0,0 +1,342 @@
+import argparse
+import http.client
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+from backends import BACKENDS, TranslationBackend
+from cpu_profile import CpuProfile, add_cpu_profile_arguments, cpu_profile_from_args
+from metrics import add_metrics_arguments, configure_from_args, metrics
+from config import (get_model_name, BACKEND, MAX_LENGTH, SERVER_ADDRESS, SERVER_MAX_WAIT_MS,
+                    SERVER_MAX_BATCH_LINES, SERVER_TIMEOUT, USE_TRANSLATION_MEMORY, DECODING_PRESET,
+                    DECODING_PRESETS)
+
+def parse_address(address: str) -> Tuple[str, object]:
+    # "http://host:port" listens on TCP, anything else is a Unix socket path
+    if address.startswith(('http://', 'https://')):
+        parts = urlsplit(address)
+        return 'http', (parts.hostname or '127.0.0.1', parts.port or 80)
+    if address.startswith('unix:'):
+        address = address[len('unix:'):]
+    return 'unix', os.path.expanduser(address)
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+def server_request(address: str, method: str, path: str, payload=None, timeout: float = SERVER_TIMEOUT):
+    kind, target = parse_address(address)
+    if kind == 'unix':
+        connection = _UnixHTTPConnection(target, timeout)
+    else:
+        connection = http.client.HTTPConnection(*target, timeout=timeout)
+    try:
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        data = json.loads(response.read().decode('utf-8'))
+        if response.status != 200:
+            raise RuntimeError(f"Translation server error: {data.get('error', response.reason)}")
+        return data
+    finally:
+        connection.close()
+
+class RemoteBackend(TranslationBackend):
+    # Sends batches to a running `subtrans serve`, which merges them with other clients' batches
+    name = 'remote'
+
+    def __init__(self, address: str, timeout: float = SERVER_TIMEOUT, server_variant: str = 'remote'):
+        self.address = address
+        self.timeout = timeout
+        # The server's own backend decides the output, so cached translations are shared with it
+        self.server_variant = server_variant
+
+    @property
+    def variant(self) -> str:
+        return self.server_variant
+
+    def count_tokens(self, lines: List[str]) -> List[int]:
+        # Only sizes the requests; the server batches again with the real tokenizer
+        return [len(line.split()) + 1 for line in lines]
+
+    def translate_batch(self, lines: List[str], max_length: int = MAX_LENGTH, num_beams: int = 1) -> List[str]:
+        # Generation settings are the server's (subtrans serve --preset); connect_server
+        # only hands out a RemoteBackend when that preset is the client's
+        return server_request(self.address, 'POST', '/translate', {'lines': lines}, self.timeout)['translations']
+
+    def memory_bytes(self) -> Optional[int]:
+        return 0
+
+def connect_server(address: Optional[str] = SERVER_ADDRESS, model_name: Optional[str] = None,
+                   preset: str = DECODING_PRESET) -> Optional[RemoteBackend]:
+    if not address:
+        return None
+    kind, target = parse_address(address)
+    if kind == 'unix' and not os.path.exists(target):
+        return None
+    try:
+        info = server_request(address, 'GET', '/health', timeout=1.0)
+    except (OSError, ValueError, RuntimeError, http.client.HTTPException):
+        return None
+    if info.get('model') != (model_name or get_model_name()):
+        print(f"Translation server at {address} runs {info.get('model')}, translating locally")
+        return None
+    if info.get('preset') != preset:
+        print(f"Translation server at {address} uses the {info.get('preset')} preset, "
+              f"translating locally with {preset}")
+        return None
+    return RemoteBackend(address, server_variant=info.get('variant', RemoteBackend.name))
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--server', default=SERVER_ADDRESS,
+                        help='Use the translation server at this Unix socket or http://host:port when it is running')
+    parser.add_argument('--no-server', action='store_true', help='Always load a model in this process')
+
+def server_from_args(args) -> Optional[str]:
+    return None if args.no_server else args.server
+
+class _Request:
+    __slots__ = ('lines', 'translations', 'error', 'done')
+
+    def __init__(self, lines: List[str]):
+        self.lines = lines
+        self.translations = None
+        self.error = None
+        self.done = threading.Event()
+
+class BatchingQueue:
+    # One thread owns the translator. It takes the oldest request, waits up to max_wait
+    # for others to arrive and translates them all in a single translate_lines call.
+    def __init__(self, translator, max_wait: float = SERVER_MAX_WAIT_MS / 1000,
+                 max_batch_lines: int = SERVER_MAX_BATCH_LINES):
+        self.translator = translator
+        self.max_wait = max_wait
+        self.max_batch_lines = max_batch_lines
+        self._requests: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        return self._requests.qsize()
+
+    def submit(self, lines: List[str]) -> List[str]:
+        request = _Request(lines)
+        self._requests.put(request)
+        metrics.set('server_queue_depth', self.depth)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.translations
+
+    def close(self) -> None:
+        self._requests.put(None)
+        self._thread.join()
+
+    def _collect(self, first: _Request) -> Tuple[List[_Request], bool]:
+        batch = [first]
+        lines = len(first.lines)
+        deadline = time.monotonic() + self.max_wait
+        while lines < self.max_batch_lines:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+            lines += len(request.lines)
+        return batch, False
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._requests.get()
+            if first is None:
+                break
+            batch, stopping = self._collect(first)
+            lines = [line for request in batch for line in request.lines]
+            metrics.set('server_queue_depth', self.depth)
+            metrics.incr('server_requests', len(batch))
+            metrics.incr('server_batches')
+            metrics.incr('server_batch_lines', len(lines))
+            metrics.set('server_batch_fill', min(1.0, len(lines) / self.max_batch_lines))
+            try:
+                translations = self.translator.translate_lines(lines)
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+                    request.done.set()
+                continue
+            start = 0
+            for request in batch:
+                request.translations = translations[start:start + len(request.lines)]
+                start += len(request.lines)
+                request.done.set()
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'subtrans'
+
+    def _send(self, status: int, body: bytes, content_type: str = 'application/json') -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data) -> None:
+        self._send(status, json.dumps(data).encode('utf-8'))
+
+    def do_GET(self):
+        batcher = self.server.batcher
+        if self.path == '/health':
+            backend = batcher.translator.backend
+            self._send_json(200, {'model': self.server.model_name, 'backend': backend.name,
+                                  'variant': backend.variant, 'preset': self.server.preset,
+                                  'queue_depth': batcher.depth})
+        elif self.path == '/metrics':
+            self._send(200, metrics.prometheus_text().encode('utf-8'), 'text/plain; version=0.0.4')
+        else:
+            self._send_json(404, {'error': f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        if self.path != '/translate':
+            self._send_json(404, {'error': f"Unknown path: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            lines = json.loads(self.rfile.read(length).decode('utf-8'))['lines']
+            if not isinstance(lines, list) or not all(isinstance(line, str) for line in lines):
+                raise ValueError("lines must be a list of strings")
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_json(400, {'error': f"Invalid request: {e}"})
+            return
+        try:
+            translations = self.server.batcher.submit(lines)
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+        self._send_json(200, {'translations': translations})
+
+    def log_message(self, format, *args):
+        # One line per request would drown everything else
+        pass
+
+class _TCPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ('local', 0)
+
+def create_server(address: str, batcher: BatchingQueue, preset: str = DECODING_PRESET):
+    kind, target = parse_address(address)
+    if kind == 'unix':
+        if os.path.exists(target):
+            if connect_server(address) is not None or _socket_in_use(target):
+                raise RuntimeError(f"A translation server is already listening on {target}")
+            os.unlink(target)
+        server = _UnixServer(target, _Handler)
+    else:
+        server = _TCPServer(target, _Handler)
+    server.batcher = batcher
+    server.model_name = get_model_name()
+    server.preset = preset
+    return server
+
+def _socket_in_use(path: str) -> bool:
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+def serve(address: str = SERVER_ADDRESS, use_memory: bool = USE_TRANSLATION_MEMORY, backend: str = BACKEND,
+          cpu_profile: Optional[CpuProfile] = None, max_wait: float = SERVER_MAX_WAIT_MS / 1000,
+          max_batch_lines: int = SERVER_MAX_BATCH_LINES, preset: str = DECODING_PRESET) -> int:
+    from translator import create_translator
+    # server=None: the server itself always translates locally
+    with create_translator(use_memory, backend, cpu_profile, server=None, preset=preset) as translator:
+        batcher = BatchingQueue(translator, max_wait, max_batch_lines)
+        server = create_server(address, batcher, preset)
+        print(f"Serving {get_model_name()} ({preset} preset) on {address} (max wait {max_wait * 1000:.0f} ms, "
+              f"{max_batch_lines} lines per batch)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\nShutting down translation server.")
+        finally:
+            server.server_close()
+            batcher.close()
+            kind, target = parse_address(address)
+            if kind == 'unix' and os.path.exists(target):
+                os.unlink(target)
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(prog='subtrans', description='Subtitle translation tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help='Keep the model loaded and translate for other subtrans processes')
+    serve_parser.add_argument('--listen', default=SERVER_ADDRESS, help='Unix socket path or http://host:port')
+    serve_parser.add_argument('--max-wait-ms', type=float, default=SERVER_MAX_WAIT_MS,
+                              help='How long a request may wait for others to share its batch')
+    serve_parser.add_argument('--max-batch-lines', type=int, default=SERVER_MAX_BATCH_LINES,
+                              help='Lines coalesced into one inference call')
+    serve_parser.add_argument('--no-memory', action='store_true', help='Do not use the persistent translation memory')
+    serve_parser.add_argument('--backend', choices=list(BACKENDS), default=BACKEND, help='Inference engine to use')
+    serve_parser.add_argument('--preset', choices=list(DECODING_PRESETS), default=DECODING_PRESET,
+                              help='Decoding preset used for every client')
+    add_cpu_profile_arguments(serve_parser)
+    add_metrics_arguments(serve_parser)
+
+    status_parser = commands.add_parser('status', help='Show whether a server is running and its queue depth')
+    status_parser.add_argument('--server', default=SERVER_ADDRESS, help='Unix socket path or http://host:port')
+
+    try:
+        args = parser.parse_args()
+        if args.command == 'status':
+            try:
+                info = server_request(args.server, 'GET', '/health', timeout=2.0)
+            except (OSError, RuntimeError, http.client.HTTPException):
+                print(f"No translation server running at {args.server}")
+                return 1
+            print(f"Translation server at {args.server}: {info['model']} ({info['backend']} backend, "
+                  f"{info.get('preset')} preset), "
+                  f"{info['queue_depth']} requests queued")
+            return 0
+
+        configure_from_args(args)
+        return serve(args.listen, use_memory=not args.no_memory, backend=args.backend,
+                     cpu_profile=cpu_profile_from_args(args), max_wait=args.max_wait_ms / 1000,
+                     max_batch_lines=args.max_batch_lines, preset=args.preset)
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        metrics.close()
+
+if __name__ == "__main__":
+    exit(main())
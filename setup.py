@@ -2,5 +2,11 @@ from setuptools import setup, find_packages
 
 setup(
     name="subtrans",
-    py_modules=['translator', 'batch_translator', 'subtitle_extractor', 'subtitle_formats', 'config'],
+    py_modules=['translator', 'batch_translator', 'subtitle_extractor', 'subtitle_formats', 'config',
+                'translation_memory', 'worker_pool', 'pipeline', 'manifest',
+                'library_index', 'watcher', 'backends', 'cpu_profile', 'metrics', 'sentences',
+                'server', 'state_store', 'targets', 'work_claims'],
+    entry_points={
+        'console_scripts': ['subtrans=server:main'],
+    },
 ) 
\ No newline at end of file
@@ -0,0 +1,149 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from manifest import file_hash
+from library_index import get_target_path
+from config import STATE_DB_FILE, get_model_name
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+# Bumped when the files table changes shape; older tables are rebuilt from the manifests
+SCHEMA_VERSION = 2
+
+class LibraryState:
+    # Run state of one library root in a shared SQLite database. WAL mode lets several
+    # batch_translator processes (on the same or different libraries) read and write
+    # at the same time; every write is its own short transaction. Files are tracked
+    # per model, so each target language has its own status.
+    def __init__(self, root, path=STATE_DB_FILE):
+        self.root = str(Path(root).resolve())
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            # The version is checked under the write lock, so of several processes opening
+            # an old database at once only the first rebuilds the table
+            self._conn.execute("BEGIN IMMEDIATE")
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                self._conn.execute("DROP TABLE IF EXISTS files")
+                self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS libraries (
+                    root TEXT PRIMARY KEY,
+                    fingerprint TEXT,
+                    last_check REAL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    root TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER,
+                    mtime_ns INTEGER,
+                    sha1 TEXT,
+                    status TEXT NOT NULL,
+                    duration REAL,
+                    model TEXT NOT NULL,
+                    error TEXT,
+                    updated REAL NOT NULL,
+                    PRIMARY KEY (root, path, model)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_status ON files (root, status)")
+
+    def last_fingerprint(self) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT fingerprint FROM libraries WHERE root = ?", (self.root,)).fetchone()
+        return row[0] if row else None
+
+    def save_fingerprint(self, fingerprint: Optional[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO libraries (root, fingerprint, last_check) VALUES (?, ?, ?)",
+                (self.root, fingerprint, time.time())
+            )
+
+    def forget_fingerprint(self) -> None:
+        self.save_fingerprint(None)
+
+    def mark_pending(self, source_paths: List, model: str) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO files (root, path, status, model, updated) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (root, path, model) DO UPDATE SET status = excluded.status, updated = excluded.updated",
+                [(self.root, os.path.abspath(path), PENDING, model, now) for path in source_paths]
+            )
+
+    def record(self, source_path, status: str, duration: Optional[float], model: str,
+               error: Optional[str] = None) -> None:
+        path = os.path.abspath(source_path)
+        size = mtime_ns = sha1 = None
+        try:
+            stats = os.stat(path)
+            size, mtime_ns = stats.st_size, stats.st_mtime_ns
+            if status == DONE:
+                sha1 = file_hash(path)
+        except OSError:
+            pass
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (root, path, size, mtime_ns, sha1, status, duration, model, error, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.root, path, size, mtime_ns, sha1, status, duration, model, error, time.time())
+            )
+
+    def get(self, source_path, model: str) -> Optional[Dict]:
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM files WHERE root = ? AND path = ? AND model = ?",
+                                        (self.root, os.path.abspath(source_path), model))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([column[0] for column in cursor.description], row))
+
+    def completed(self, model: str) -> Dict[str, tuple]:
+        # (size, mtime_ns) of every source last translated successfully with this model
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime_ns FROM files WHERE root = ? AND status = ? AND model = ?",
+                (self.root, DONE, model)
+            ).fetchall()
+        return {path: (size, mtime_ns) for path, size, mtime_ns in rows}
+
+    def targets_to_translate(self, scan, targets: List[str]) -> Dict[Path, List[str]]:
+        # Targets still missing for each source. A source recorded as done for a target
+        # with the same size and mtime, whose output still exists, is skipped without
+        # reading its manifest.
+        completed = {target: self.completed(get_model_name(target)) for target in targets}
+        pending = {}
+        for path, size, mtime_ns in scan.sources:
+            source = Path(path)
+            key = os.path.abspath(path)
+            needed = [
+                target for target in targets
+                if not (completed[target].get(key) == (size, mtime_ns)
+                        and str(get_target_path(source, target)) in scan.targets)
+                and scan.needs_translation(source, target)
+            ]
+            if needed:
+                pending[source] = needed
+        return pending
+
+    def status_counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM files WHERE root = ? GROUP BY status", (self.root,)
+            ).fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
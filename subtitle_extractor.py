@@ -1,10 +1,18 @@
 import subprocess
 import json
+import os
 from pathlib import Path
 import argparse
-from typing import List, Dict
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
 import shutil
-from translator import process_single_file
+from translator import process_single_file, create_translator
+from pipeline import TranslationPipeline
+from server import add_server_arguments, server_from_args
+from metrics import ProgressReporter, add_metrics_arguments, configure_from_args, metrics
+from config import (MEDIA_EXTENSIONS, PROBE_CACHE_FILE, SERVER_ADDRESS, SOURCE_LANG, SOURCE_SUFFIX, get_target_suffix,
+                    SUBTITLE_FORMATS)
 
 def check_dependencies() -> bool:
     missing = []
@@ -23,16 +31,37 @@ def check_dependencies() -> bool:
         return False
     return True
 
+# Image-based formats cannot be converted to text subtitles
+BITMAP_CODECS = {'hdmv_pgs_subtitle', 'dvd_subtitle', 'dvb_subtitle', 'xsub'}
+
+def language_matches(stream_language: str, language: str) -> bool:
+    # Accepts both ISO 639-1 and 639-2 style tags, e.g. 'en' matches 'eng'
+    stream_language, language = stream_language.lower(), language.lower()
+    return stream_language.startswith(language) or language.startswith(stream_language)
+
+def stream_language_suffix(stream: Dict) -> str:
+    # Extracted files are named after the stream's language, so only source language
+    # tracks look like sources to --translate and batch_translator. Untagged streams
+    # are assumed to be in the source language.
+    language = stream.get('tags', {}).get('language', '').lower()
+    if not language or language == 'und' or language_matches(language, SOURCE_LANG):
+        return SOURCE_SUFFIX
+    return f".{language}"
+
 class SubtitleExtractor:
-    def __init__(self, media_file: str):
+    def __init__(self, media_file: str, streams: Optional[List[Dict]] = None):
         if not check_dependencies():
             raise RuntimeError("Required dependencies not found")
         
         self.media_file = Path(media_file)
         if not self.media_file.exists():
             raise FileNotFoundError(f"Media file not found: {media_file}")
+        self._streams = streams
 
-    def get_subtitle_streams(self) -> List[Dict]:
+    def get_subtitle_streams(self, refresh: bool = False) -> List[Dict]:
+        if self._streams is not None and not refresh:
+            return self._streams
+        
         cmd = [
             'ffprobe',
             '-v', 'quiet',
@@ -43,52 +72,216 @@ class SubtitleExtractor:
         ]
 
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            with metrics.timer('probe'):
+                result = subprocess.run(cmd, capture_output=True, text=True, check=True)
             data = json.loads(result.stdout)
-            return data.get('streams', [])
+            self._streams = data.get('streams', [])
+            return self._streams
         except subprocess.CalledProcessError as e:
             raise RuntimeError(f"Error analyzing media file: {e}")
         except json.JSONDecodeError as e:
             raise RuntimeError(f"Error parsing ffprobe output: {e}")
 
-    def extract_subtitle(self, stream_index: int) -> Path:
-        streams = self.get_subtitle_streams()
-        stream = streams[stream_index]
-        codec_name = stream.get('codec_name', '').lower()
-        
-        if codec_name in ['ass', 'ssa']:
-            extension = '.en.ass'
-        else:
-            extension = '.en.srt'
-        
+    def find_streams(self, language: str) -> List[int]:
+        matches = []
+        for i, stream in enumerate(self.get_subtitle_streams()):
+            stream_language = stream.get('tags', {}).get('language', '')
+            if stream.get('codec_name', '').lower() in BITMAP_CODECS:
+                continue
+            if stream_language and language_matches(stream_language, language):
+                matches.append(i)
+        return matches
+
+    def _output_path(self, stream_index: int, extension: str, reserved: set) -> Path:
         output_path = self.media_file.with_suffix(extension)
-        if output_path.exists():
+        if output_path.exists() or output_path in reserved:
             output_path = self.media_file.with_suffix(f'.stream{stream_index}{extension}')
+        reserved.add(output_path)
+        return output_path
 
-        if codec_name in ['ass', 'ssa']:
-            cmd = [
-                'ffmpeg',
-                '-v', 'quiet',
-                '-i', str(self.media_file),
-                '-map', f'0:s:{stream_index}',
-                '-c:s', 'copy',
-                str(output_path)
-            ]
-        else:
-            cmd = [
-                'ffmpeg',
-                '-v', 'quiet',
-                '-i', str(self.media_file),
-                '-map', f'0:s:{stream_index}',
-                str(output_path)
-            ]
+    def extract_subtitles(self, stream_indices: List[int]) -> List[Path]:
+        streams = self.get_subtitle_streams()
+        
+        # One ffmpeg run with an output per stream reads the media file only once
+        cmd = ['ffmpeg', '-v', 'quiet', '-i', str(self.media_file)]
+        output_paths = []
+        reserved = set()
+        for stream_index in stream_indices:
+            codec_name = streams[stream_index].get('codec_name', '').lower()
+            suffix = stream_language_suffix(streams[stream_index])
+            
+            if codec_name in ['ass', 'ssa']:
+                extension = f'{suffix}.ass'
+            else:
+                extension = f'{suffix}.srt'
+            
+            output_path = self._output_path(stream_index, extension, reserved)
+            cmd += ['-map', f'0:s:{stream_index}']
+            if codec_name in ['ass', 'ssa']:
+                cmd += ['-c:s', 'copy']
+            cmd.append(str(output_path))
+            output_paths.append(output_path)
 
         try:
-            subprocess.run(cmd, check=True)
-            return output_path
+            with metrics.timer('ffmpeg'):
+                subprocess.run(cmd, check=True)
+            metrics.incr('streams_extracted', len(output_paths))
+            return output_paths
         except subprocess.CalledProcessError as e:
             raise RuntimeError(f"Error extracting subtitle: {e}")
 
+    def extract_subtitle(self, stream_index: int) -> Path:
+        return self.extract_subtitles([stream_index])[0]
+
+def _stream_flags(stream: Dict):
+    disposition = stream.get('disposition', {})
+    title = stream.get('tags', {}).get('title', '').lower()
+    forced = disposition.get('forced') == 1 or 'forced' in title
+    sdh = (disposition.get('hearing_impaired') == 1
+           or any(marker in title for marker in ('sdh', 'hearing', 'cc')))
+    return forced, sdh, disposition.get('default') == 1
+
+def select_best_stream(streams: List[Dict], language: str = SOURCE_LANG) -> Optional[int]:
+    # Full dialogue subtitles only: forced tracks cover foreign-language parts
+    # and bitmap tracks cannot be converted. Prefer non-SDH, then the default track.
+    best, best_score = None, None
+    for i, stream in enumerate(streams):
+        stream_language = stream.get('tags', {}).get('language', '')
+        if not stream_language or not language_matches(stream_language, language):
+            continue
+        if stream.get('codec_name', '').lower() in BITMAP_CODECS:
+            continue
+        forced, sdh, default = _stream_flags(stream)
+        if forced:
+            continue
+        score = (not sdh, default)
+        if best_score is None or score > best_score:
+            best, best_score = i, score
+    return best
+
+class ProbeCache:
+    # ffprobe results keyed by path and invalidated by size/mtime changes
+    def __init__(self, path=PROBE_CACHE_FILE):
+        self.path = Path(path) if path is not None else None
+        self.entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            try:
+                with open(self.path, 'r') as f:
+                    self.entries = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                self.entries = {}
+
+    def get(self, media_file: Path) -> Optional[List[Dict]]:
+        stats = media_file.stat()
+        with self._lock:
+            entry = self.entries.get(str(media_file))
+        if entry and entry['size'] == stats.st_size and entry['mtime_ns'] == stats.st_mtime_ns:
+            return entry['streams']
+        return None
+
+    def put(self, media_file: Path, streams: List[Dict]) -> None:
+        stats = media_file.stat()
+        with self._lock:
+            self.entries[str(media_file)] = {
+                'size': stats.st_size,
+                'mtime_ns': stats.st_mtime_ns,
+                'streams': streams,
+            }
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            # Concurrent runs each write their own temp file and the last rename wins;
+            # probes it drops are simply run again
+            tmp_path = self.path.with_name(f"{self.path.name}.tmp{os.getpid()}")
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(self.entries, f)
+                os.replace(tmp_path, self.path)
+            finally:
+                tmp_path.unlink(missing_ok=True)
+
+def find_media_files(directory: str) -> List[Path]:
+    media_files = []
+    for current, _, filenames in os.walk(directory):
+        for name in filenames:
+            if os.path.splitext(name)[1].lower() in MEDIA_EXTENSIONS:
+                media_files.append(Path(current) / name)
+    return sorted(media_files)
+
+def existing_subtitle(media_file: Path, suffix: str) -> Optional[Path]:
+    for ext in SUBTITLE_FORMATS:
+        path = media_file.with_suffix(f"{suffix}{ext}")
+        if path.exists():
+            return path
+    return None
+
+def prepare_media_file(media_file: Path, probe_cache: ProbeCache) -> Path:
+    source = existing_subtitle(media_file, f".{SOURCE_LANG}")
+    if source is not None:
+        return source
+    
+    streams = probe_cache.get(media_file)
+    extractor = SubtitleExtractor(str(media_file), streams=streams)
+    if streams is None:
+        probe_cache.put(media_file, extractor.get_subtitle_streams())
+    
+    stream_index = select_best_stream(extractor.get_subtitle_streams())
+    if stream_index is None:
+        raise RuntimeError("No suitable English text subtitle stream")
+    return extractor.extract_subtitle(stream_index)
+
+def process_library(directory: str, workers: int = 4, translate: bool = True,
+                    probe_cache: Optional[ProbeCache] = None, server: Optional[str] = SERVER_ADDRESS) -> int:
+    probe_cache = probe_cache if probe_cache is not None else ProbeCache()
+    media_files = [media for media in find_media_files(directory)
+                   if existing_subtitle(media, get_target_suffix()) is None]
+    print(f"Found {len(media_files)} media files without translated subtitles")
+    if not media_files:
+        return 0
+    
+    failures = 0
+    completed = 0
+    progress = ProgressReporter('library', len(media_files))
+    
+    def report(media_file, error):
+        nonlocal failures, completed
+        completed += 1
+        if error is not None:
+            failures += 1
+            metrics.incr('file_errors')
+            print(f"Skipped {media_file}: {error}")
+        progress.update(completed, 'files')
+    
+    def prepare(media_file):
+        return prepare_media_file(media_file, probe_cache)
+    
+    try:
+        if translate:
+            # ffmpeg runs in a bounded pool of loader threads feeding one shared model
+            with create_translator(server=server) as translator:
+                pipeline = TranslationPipeline(translator, prepare=prepare, load_workers=workers,
+                                               on_complete=report)
+                pipeline.run(media_files)
+                pipeline.print_report()
+        else:
+            def extract(media_file):
+                try:
+                    prepare(media_file)
+                    return media_file, None
+                except Exception as e:
+                    return media_file, str(e)
+            
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for media_file, error in pool.map(extract, media_files):
+                    report(media_file, error)
+    finally:
+        probe_cache.save()
+    
+    return 0 if failures < len(media_files) else 1
+
 def format_stream_info(stream: Dict) -> str:
     info = []
     
@@ -107,14 +300,30 @@ def format_stream_info(stream: Dict) -> str:
     
     return ' | '.join(info)
 
+def parse_stream_list(value: str) -> List[int]:
+    return [int(index) for index in value.split(',') if index.strip()]
+
 def main():
     parser = argparse.ArgumentParser(description='Extract and translate subtitles from media files')
-    parser.add_argument('media_file', help='Path to the media file')
+    parser.add_argument('media_file', help='Path to the media file (or library directory with --library)')
+    parser.add_argument('--library', action='store_true', help='Scan a media library directory and pick the best English stream per file')
+    parser.add_argument('--workers', type=int, default=4, help='With --library, number of parallel ffmpeg extractions')
     parser.add_argument('--auto-select', type=int, help='Automatically select stream index')
+    parser.add_argument('--streams', type=parse_stream_list, help='Comma separated stream indices to extract in one pass')
+    parser.add_argument('--language', help='Extract every text subtitle stream in this language (e.g. eng); files are named after each stream\'s language')
     parser.add_argument('--translate', action='store_true', help='Translate extracted subtitles to Danish')
+    add_server_arguments(parser)
+    add_metrics_arguments(parser)
     
     try:
         args = parser.parse_args()
+        configure_from_args(args)
+        
+        if args.library:
+            if not check_dependencies():
+                return 1
+            return process_library(args.media_file, workers=args.workers, translate=args.translate,
+                                   server=server_from_args(args))
         
         extractor = SubtitleExtractor(args.media_file)
         streams = extractor.get_subtitle_streams()
@@ -123,10 +332,25 @@ def main():
             print("No subtitle streams found in the media file.")
             return 0
         
-        if args.auto_select is not None:
-            if 0 <= args.auto_select < len(streams):
-                subtitle_path = extractor.extract_subtitle(args.auto_select)
+        subtitle_paths = []
+        if args.streams or args.language:
+            stream_indices = list(args.streams or [])
+            if args.language:
+                stream_indices += [i for i in extractor.find_streams(args.language) if i not in stream_indices]
+            invalid = [i for i in stream_indices if not 0 <= i < len(streams)]
+            if invalid:
+                print(f"Invalid stream index: {', '.join(map(str, invalid))}")
+                return 1
+            if not stream_indices:
+                print(f"No text subtitle streams found for language: {args.language}")
+                return 1
+            subtitle_paths = extractor.extract_subtitles(stream_indices)
+            for subtitle_path in subtitle_paths:
                 print(f"Extracted subtitles to: {subtitle_path}")
+        elif args.auto_select is not None:
+            if 0 <= args.auto_select < len(streams):
+                subtitle_paths = [extractor.extract_subtitle(args.auto_select)]
+                print(f"Extracted subtitles to: {subtitle_paths[0]}")
             else:
                 print(f"Invalid stream index: {args.auto_select}")
                 return 1
@@ -140,8 +364,8 @@ def main():
                     choice = input("\nSelect subtitle stream to extract (number): ")
                     stream_index = int(choice)
                     if 0 <= stream_index < len(streams):
-                        subtitle_path = extractor.extract_subtitle(stream_index)
-                        print(f"Extracted subtitles to: {subtitle_path}")
+                        subtitle_paths = [extractor.extract_subtitle(stream_index)]
+                        print(f"Extracted subtitles to: {subtitle_paths[0]}")
                         break
                     else:
                         print("Invalid selection. Please try again.")
@@ -151,9 +375,14 @@ def main():
                     print("\nOperation cancelled by user. Exiting...")
                     return 1
         
-        if args.translate and 'subtitle_path' in locals():
+        if args.translate and subtitle_paths:
             print("\nTranslating extracted subtitles...")
-            process_single_file(str(subtitle_path))
+            with create_translator(server=server_from_args(args)) as translator:
+                for subtitle_path in subtitle_paths:
+                    if not subtitle_path.stem.endswith(SOURCE_SUFFIX):
+                        print(f"Not translating {subtitle_path}: it is not in the source language ({SOURCE_LANG})")
+                        continue
+                    process_single_file(str(subtitle_path), translator=translator)
         
         return 0
 
@@ -163,6 +392,8 @@ def main():
     except Exception as e:
         print(f"Error: {e}")
         return 1
+    finally:
+        metrics.close()
 
 if __name__ == "__main__":
-    exit(main()) 
\ No newline at end of file
+    exit(main())
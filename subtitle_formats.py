@@ -1,47 +1,390 @@
+from contextlib import contextmanager
+from fnmatch import fnmatch
+from itertools import chain
 from pathlib import Path
-import pysrt
-import ass
+import io
+import os
+import re
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+from config import ASS_SKIP_STYLES
+
+_SRT_TIME = re.compile(r'(\d+):(\d+):(\d+)[,.](\d+)')
+_SRT_TIMING = re.compile(r'^\s*\d+:\d+:\d+[,.]\d+\s*-->\s*\d+:\d+:\d+[,.]\d+')
+_ASS_DEFAULT_FORMAT = ['Layer', 'Start', 'End', 'Style', 'Name', 'MarginL', 'MarginR', 'MarginV', 'Effect', 'Text']
+_ASS_EVENT_KINDS = ('Dialogue', 'Comment')
+_BOM = '\ufeff'
+# Longest first: the UTF-32 LE mark starts with the UTF-16 LE one
+_BOMS = [(b'\x00\x00\xfe\xff', 'utf-32-be'), (b'\xff\xfe\x00\x00', 'utf-32-le'), (b'\xef\xbb\xbf', 'utf-8'),
+         (b'\xfe\xff', 'utf-16-be'), (b'\xff\xfe', 'utf-16-le')]
+# Override blocks ({\i1}, {\pos(..)}, {comments}) and the \N, \n, \h escapes
+_ASS_MARKUP = re.compile(r'\{[^{}]*\}|\\[Nnh]')
+_ASS_DRAWING = re.compile(r'\\p[1-9]')
+_ASS_KARAOKE = re.compile(r'\\[kK][fo]?\d')
+
+def parse_timestamp(value: str) -> int:
+    match = _SRT_TIME.search(value)
+    if not match:
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    hours, minutes, seconds, fraction = match.groups()
+    millis = int(fraction.ljust(3, '0')[:3])
+    return ((int(hours) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + millis
+
+def format_srt_timestamp(millis: int) -> str:
+    seconds, millis = divmod(max(millis, 0), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02},{millis:03}"
+
+def format_ass_timestamp(millis: int) -> str:
+    seconds, millis = divmod(max(millis, 0), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}.{millis // 10:02}"
+
+def split_ass_markup(raw: str) -> Tuple[List[str], List[Tuple[int, int, str]]]:
+    # Plain text lines for the model, plus each override block as (line, offset, block).
+    # \N starts a new line; the soft break \n and hard space \h read as plain spaces.
+    lines = ['']
+    tags = []
+    position = 0
+    for match in _ASS_MARKUP.finditer(raw):
+        lines[-1] += raw[position:match.start()]
+        token = match.group()
+        if token == '\\N':
+            lines.append('')
+        elif token in ('\\n', '\\h'):
+            lines[-1] += ' '
+        else:
+            tags.append((len(lines) - 1, len(lines[-1]), token))
+        position = match.end()
+    lines[-1] += raw[position:]
+    return lines, tags
+
+def _nearest_boundary(text: str, target: int, word_end: bool) -> int:
+    # Closing tags usually follow a word, opening tags precede one
+    boundaries = [0, len(text)] + [i + (0 if word_end else 1) for i, char in enumerate(text) if char == ' ']
+    return min(boundaries, key=lambda pos: abs(pos - target))
+
+def join_ass_markup(lines: List[str], tags: List[Tuple[int, int, str]], original: List[str]) -> str:
+    # Put each block back at the same relative position of its line, moved to the
+    # nearest word boundary; blocks at the start or end of a line stay there
+    placed = [[] for _ in lines]
+    for line, offset, block in tags:
+        index = min(line, len(lines) - 1)
+        source_length = len(original[line]) if line < len(original) else 0
+        text = lines[index]
+        if offset == 0:
+            position = 0
+        elif offset >= source_length:
+            position = len(text)
+        else:
+            source = original[line]
+            word_end = source[offset - 1] != ' ' and source[offset] == ' '
+            position = _nearest_boundary(text, round(offset / source_length * len(text)), word_end)
+        placed[index].append((position, block))
+    
+    result = []
+    for text, blocks in zip(lines, placed):
+        pieces = []
+        start = 0
+        for position, block in sorted(blocks, key=lambda item: item[0]):
+            pieces.append(text[start:position])
+            pieces.append(block)
+            start = position
+        pieces.append(text[start:])
+        result.append(''.join(pieces))
+    return '\\N'.join(result)
+
+def _iter_lines(file_path: str, document) -> Iterator[str]:
+    # Decode line by line so large files are never held in memory as one string.
+    # A byte order mark selects the encoding; without one, lines that are not valid
+    # UTF-8 fall back to cp1252, the usual legacy encoding. Outputs are always UTF-8.
+    with open(file_path, 'rb') as f:
+        head = f.read(4)
+        encoding = None
+        for bom, name in _BOMS:
+            if head.startswith(bom):
+                document.bom = True
+                encoding = name
+                break
+        f.seek(len(bom) if encoding else 0)
+        if encoding not in (None, 'utf-8'):
+            first = True
+            for line in io.TextIOWrapper(f, encoding=encoding, errors='replace', newline=''):
+                if first:
+                    document.newline = '\r\n' if line.endswith('\r\n') else '\n'
+                    first = False
+                yield line.rstrip('\r\n')
+            return
+        first = True
+        for raw in f:
+            if first:
+                document.newline = '\r\n' if raw.endswith(b'\r\n') else '\n'
+                first = False
+            raw = raw.rstrip(b'\r\n')
+            try:
+                yield raw.decode('utf-8')
+            except UnicodeDecodeError:
+                yield raw.decode('cp1252', errors='replace')
+
+@contextmanager
+def _open_output(output_path: str, bom: bool):
+    # Written next to the target and renamed into place, so a crash never leaves
+    # a partial file that looks like a finished translation
+    tmp_path = f"{output_path}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            if bom:
+                f.write(_BOM)
+            yield f
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+class Cue:
+    __slots__ = ('start', 'end', 'text')
+
+    def __init__(self, start: int, end: int, text: str):
+        self.start = start
+        self.end = end
+        self.text = text
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.start}, {self.end}, {self.text!r})"
+
+class SrtCue(Cue):
+    # The raw index and timing lines are kept so unchanged cues are written back as
+    # they were, including any position coordinates after the end time. Separators
+    # between cues are normalized to one blank line.
+    __slots__ = ('index', '_timing', '_parsed')
+
+    def __init__(self, start: int, end: int, text: str, index: str = '', timing: Optional[str] = None):
+        super().__init__(start, end, text)
+        self.index = index
+        self._timing = timing
+        self._parsed = (start, end)
+
+    def timing_line(self) -> str:
+        if self._timing is not None and (self.start, self.end) == self._parsed:
+            return self._timing
+        suffix = ''
+        if self._timing is not None:
+            ends = list(_SRT_TIME.finditer(self._timing))
+            if len(ends) >= 2:
+                suffix = self._timing[ends[1].end():]
+        return f"{format_srt_timestamp(self.start)} --> {format_srt_timestamp(self.end)}{suffix}"
+
+class AssEvent(Cue):
+    # Every field except the text is kept as raw strings in file order. text is the
+    # raw ASS text, markup included.
+    __slots__ = ('kind', 'fields', '_format', '_lead', '_parsed')
+
+    def __init__(self, kind: str, fields: List[str], format_names: List[str], lead: str = ' '):
+        self.kind = kind
+        self.fields = fields
+        self._format = format_names
+        self._lead = lead
+        start = parse_timestamp(self._field('Start', '0:00:00.00'))
+        end = parse_timestamp(self._field('End', '0:00:00.00'))
+        super().__init__(start, end, fields[-1])
+        self._parsed = (start, end)
+
+    def _field(self, name: str, default: str = '') -> str:
+        try:
+            return self.fields[self._format.index(name)].strip()
+        except (ValueError, IndexError):
+            return default
+
+    @property
+    def style(self) -> str:
+        return self._field('Style')
+
+    @property
+    def layer(self) -> str:
+        return self._field('Layer')
+
+    @property
+    def is_comment(self) -> bool:
+        return self.kind == 'Comment'
+
+    @property
+    def is_drawing(self) -> bool:
+        return any(_ASS_DRAWING.search(block) for _, _, block in split_ass_markup(self.fields[-1])[1])
+
+    @property
+    def is_karaoke(self) -> bool:
+        return any(_ASS_KARAOKE.search(block) for _, _, block in split_ass_markup(self.fields[-1])[1])
+
+    def to_line(self) -> str:
+        fields = list(self.fields[:-1])
+        if (self.start, self.end) != self._parsed:
+            for name, value in (('Start', self.start), ('End', self.end)):
+                if name in self._format:
+                    fields[self._format.index(name)] = format_ass_timestamp(value)
+        # A raw newline would end the event line, so use the ASS hard break instead
+        fields.append(self.text.replace('\n', '\\N'))
+        return f"{self.kind}:{self._lead}{','.join(fields)}"
+
+class SrtDocument(list):
+    def __init__(self, cues: Iterable[SrtCue] = ()):
+        super().__init__(cues)
+        self.newline = '\n'
+        self.bom = False
+
+class AssDocument:
+    def __init__(self):
+        self.records: List[Union[str, AssEvent]] = []
+        self.newline = '\n'
+        self.bom = False
+
+    @property
+    def events(self) -> List[AssEvent]:
+        return [record for record in self.records if isinstance(record, AssEvent)]
 
 class SubtitleFormat:
     def read(self, file_path: str):
         raise NotImplementedError
-        
+
     def save(self, subtitles, output_path: str):
         raise NotImplementedError
-        
+
+    def iter_cues(self, file_path: str) -> Iterator[Cue]:
+        raise NotImplementedError
+
     def get_text(self, subtitle) -> str:
         raise NotImplementedError
-        
+
     def set_text(self, subtitle, text: str):
         raise NotImplementedError
 
+    def is_translatable(self, subtitle) -> bool:
+        return True
+
 class SrtFormat(SubtitleFormat):
-    def read(self, file_path: str):
-        return pysrt.open(file_path)
-    
+    def _iter_blocks(self, file_path: str, document: SrtDocument) -> Iterator[SrtCue]:
+        # A cue is only yielded once the next one starts, because a blank line does not
+        # always end a cue: lines after it that are not an index and timing line still
+        # belong to the cue before
+        cue = None
+        block = []
+        found_text = False
+        for line in chain(_iter_lines(file_path, document), ['']):
+            if line.strip():
+                block.append(line)
+                continue
+            if not block:
+                continue
+            found_text = True
+            next_cue = self._parse_block(block)
+            if next_cue is not None:
+                if cue is not None:
+                    yield cue
+                cue = next_cue
+            elif cue is not None:
+                cue.text = '\n'.join([cue.text] + block) if cue.text else '\n'.join(block)
+            block = []
+        if cue is not None:
+            yield cue
+        elif found_text:
+            raise ValueError(f"No subtitles found in {file_path} (unknown encoding or not an SRT file)")
+
+    def _parse_block(self, block: List[str]) -> Optional[SrtCue]:
+        if _SRT_TIMING.match(block[0]):
+            i = 0
+        elif len(block) > 1 and block[0].strip().isdigit() and _SRT_TIMING.match(block[1]):
+            i = 1
+        else:
+            return None
+        start, _, end = block[i].partition('-->')
+        return SrtCue(parse_timestamp(start), parse_timestamp(end), '\n'.join(block[i + 1:]),
+                      index=block[0] if i == 1 else '', timing=block[i])
+
+    def iter_cues(self, file_path: str) -> Iterator[SrtCue]:
+        return self._iter_blocks(file_path, SrtDocument())
+
+    def read(self, file_path: str) -> SrtDocument:
+        document = SrtDocument()
+        document.extend(self._iter_blocks(file_path, document))
+        return document
+
+    def write(self, cues: Iterable[SrtCue], output_path: str, newline: str = '\n', bom: bool = False):
+        with _open_output(output_path, bom) as f:
+            for cue in cues:
+                lines = [cue.index] if cue.index else []
+                lines.append(cue.timing_line())
+                if cue.text:
+                    lines.extend(cue.text.split('\n'))
+                f.write(newline.join(lines) + newline + newline)
+
     def save(self, subtitles, output_path: str):
-        subtitles.save(output_path, encoding='utf-8')
-    
+        self.write(subtitles, output_path, subtitles.newline, subtitles.bom)
+
     def get_text(self, subtitle) -> str:
         return subtitle.text
-    
+
     def set_text(self, subtitle, text: str):
         subtitle.text = text
 
 class AssFormat(SubtitleFormat):
-    def read(self, file_path: str):
-        with open(file_path, encoding='utf-8') as f:
-            return ass.parse(f)
-    
+    def iter_records(self, file_path: str, document: Optional[AssDocument] = None) -> Iterator[Union[str, AssEvent]]:
+        document = document if document is not None else AssDocument()
+        in_events = False
+        format_names = _ASS_DEFAULT_FORMAT
+        for line in _iter_lines(file_path, document):
+            stripped = line.strip()
+            if stripped.startswith('[') and stripped.endswith(']'):
+                in_events = stripped.lower() == '[events]'
+            elif in_events:
+                kind, sep, value = line.partition(':')
+                if sep and kind == 'Format':
+                    format_names = [name.strip() for name in value.split(',')]
+                elif sep and kind in _ASS_EVENT_KINDS:
+                    body = value.lstrip()
+                    lead = value[:len(value) - len(body)]
+                    fields = body.split(',', len(format_names) - 1)
+                    if len(fields) == len(format_names):
+                        yield AssEvent(kind, fields, format_names, lead)
+                        continue
+            yield line
+
+    def iter_cues(self, file_path: str) -> Iterator[AssEvent]:
+        return (record for record in self.iter_records(file_path) if isinstance(record, AssEvent))
+
+    def read(self, file_path: str) -> AssDocument:
+        document = AssDocument()
+        document.records.extend(self.iter_records(file_path, document))
+        return document
+
+    def write(self, records: Iterable[Union[str, AssEvent]], output_path: str,
+              newline: str = '\n', bom: bool = False):
+        with _open_output(output_path, bom) as f:
+            for record in records:
+                line = record.to_line() if isinstance(record, AssEvent) else record
+                f.write(line + newline)
+
     def save(self, subtitles, output_path: str):
-        with open(output_path, 'w', encoding='utf-8') as f:
-            subtitles.dump_file(f)
-    
+        self.write(subtitles.records, output_path, subtitles.newline, subtitles.bom)
+
     def get_text(self, subtitle) -> str:
-        return subtitle.text
-    
+        # Only the words go to the model; set_text puts the markup back
+        return '\n'.join(split_ass_markup(subtitle.text)[0])
+
     def set_text(self, subtitle, text: str):
-        subtitle.text = text
+        # Markup positions are taken from the text as read from the file, so every
+        # target language is laid out from the same source
+        original, tags = split_ass_markup(subtitle.fields[-1])
+        if text == '\n'.join(original):
+            subtitle.text = subtitle.fields[-1]
+            return
+        subtitle.text = join_ass_markup(text.split('\n'), tags, original)
+
+    def is_translatable(self, subtitle) -> bool:
+        # Comments, vector drawings, karaoke and sign styles are kept as they are
+        if subtitle.is_comment or subtitle.is_drawing or subtitle.is_karaoke:
+            return False
+        style = subtitle.style.lower()
+        return not any(fnmatch(style, pattern) for pattern in ASS_SKIP_STYLES)
 
 def get_subtitle_handler(file_path: str) -> SubtitleFormat:
     suffix = Path(file_path).suffix.lower()
@@ -50,4 +393,4 @@ def get_subtitle_handler(file_path: str) -> SubtitleFormat:
     elif suffix == '.ass':
         return AssFormat()
     else:
-        raise ValueError(f"Unsupported subtitle format: {suffix}") 
\ No newline at end of file
+        raise ValueError(f"Unsupported subtitle format: {suffix}")
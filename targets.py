@@ -0,0 +1,108 @@
+import argparse
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+from metrics import metrics
+from worker_pool import available_cores
+from config import TARGET_LANG, SOURCE_LANG, MODEL_CACHE_MB, MODEL_MEMORY_ESTIMATE_MB, MIN_CORES_PER_MODEL
+
+_LANGUAGE_CODE = re.compile(r'^[a-z]{2,3}(_[a-z]+)?$')
+
+def parse_targets(value: str) -> List[str]:
+    targets = list(dict.fromkeys(code.strip().lower() for code in value.split(',') if code.strip()))
+    if not targets:
+        raise argparse.ArgumentTypeError("expected at least one language code")
+    for target in targets:
+        if not _LANGUAGE_CODE.match(target):
+            raise argparse.ArgumentTypeError(f"invalid language code: {target!r}")
+        if target == SOURCE_LANG:
+            raise argparse.ArgumentTypeError(f"{target} is the source language")
+    return targets
+
+def add_target_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--targets', type=parse_targets, default=[TARGET_LANG],
+                        help=f'Comma-separated target languages, e.g. da,sv,no (default: {TARGET_LANG}). '
+                             'Each source is parsed once for all of them.')
+    parser.add_argument('--model-cache-mb', type=int, default=MODEL_CACHE_MB,
+                        help='Memory budget for translation models kept loaded at the same time')
+
+def group_targets(targets: List[str], budget_mb: int = MODEL_CACHE_MB,
+                  model_mb: int = MODEL_MEMORY_ESTIMATE_MB) -> List[List[str]]:
+    # Targets whose models fit in the budget together share one pass over the library;
+    # more than that would reload models for every file
+    per_group = max(1, budget_mb // max(model_mb, 1))
+    return [targets[i:i + per_group] for i in range(0, len(targets), per_group)]
+
+def model_concurrency(models: int, cores: Optional[int] = None) -> int:
+    if cores is None:
+        cores = len(available_cores())
+    return max(1, min(models, cores // MIN_CORES_PER_MODEL))
+
+class ModelCache:
+    # Translators by target language, least recently used first. Loading one that
+    # pushes the total over the budget unloads the oldest ones not in use.
+    def __init__(self, factory: Callable[[str], object], budget_mb: int = MODEL_CACHE_MB,
+                 model_mb: int = MODEL_MEMORY_ESTIMATE_MB):
+        self.factory = factory
+        self.budget = budget_mb * 1024 * 1024
+        self.model_bytes = model_mb * 1024 * 1024
+        self.loads = 0
+        self.evictions = 0
+        self._translators: 'OrderedDict[str, object]' = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._in_use: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, target: str) -> bool:
+        return target in self._translators
+
+    @property
+    def loaded_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    @contextmanager
+    def use(self, target: str):
+        with self._lock:
+            translator = self._translators.get(target)
+            if translator is None:
+                translator = self.factory(target)
+                size = translator.backend.memory_bytes()
+                self._translators[target] = translator
+                self._sizes[target] = self.model_bytes if size is None else size
+                self.loads += 1
+                metrics.incr('model_loads', target=target)
+            self._translators.move_to_end(target)
+            self._in_use[target] = self._in_use.get(target, 0) + 1
+            self._evict()
+        try:
+            yield translator
+        finally:
+            with self._lock:
+                self._in_use[target] -= 1
+
+    def _evict(self) -> None:
+        for target in list(self._translators):
+            if self.loaded_bytes <= self.budget:
+                break
+            if self._in_use.get(target):
+                continue
+            print(f"Unloading {target} model to stay within the {self.budget // (1024 * 1024)} MB model budget")
+            self._translators.pop(target).close()
+            del self._sizes[target]
+            self.evictions += 1
+            metrics.incr('model_evictions', target=target)
+
+    def close(self) -> None:
+        with self._lock:
+            for translator in self._translators.values():
+                translator.close()
+            self._translators.clear()
+            self._sizes.clear()
@@ -18,4 +18,98 @@ How are you?
 """
     file = tmp_path / "test.en.srt"
     file.write_text(content)
-    return file 
\ No newline at end of file
+    return file
+
+MB = 1024 * 1024
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+class FakeTokenizer:
+    def __call__(self, lines, **kwargs):
+        return {'input_ids': [[0] * (len(line.split()) + 1) for line in lines]}
+
+class FakePipeline:
+    # Stands in for the transformers translation pipeline: upper-cases every line
+    # (or gives the reply set for it) and records the batches it was handed
+    def __init__(self, task, model=None, device=None, fail_above=None):
+        self.tokenizer = FakeTokenizer()
+        self.model = model
+        self.device = device
+        self.fail_above = fail_above
+        self.error = RuntimeError("CUDA out of memory")
+        self.replies = {}
+        self.batch_sizes = []
+        self.generation = []
+        self.generation_kwargs = []
+
+    def __call__(self, lines, batch_size=1, **generation):
+        if self.fail_above is not None and len(lines) > self.fail_above:
+            raise self.error
+        self.batch_sizes.append(len(lines))
+        self.generation.append((generation.get('max_length'), generation.get('num_beams')))
+        self.generation_kwargs.append(generation)
+        return [{'translation_text': self.replies.get(line, line.upper())} for line in lines]
+
+@pytest.fixture
+def fake_pipeline(monkeypatch):
+    # Every model loads as a FakePipeline; returns the names of the models loaded
+    loads = []
+
+    def load(task, model=None, device=None):
+        loads.append(model)
+        return FakePipeline(task, model, device)
+
+    monkeypatch.setattr('backends.pipeline', load)
+    return loads
+
+class FakeBackend:
+    name = 'fake'
+    variant = 'fake'
+
+    def __init__(self, size):
+        self.size = size
+
+    def memory_bytes(self):
+        return self.size
+
+class FakeTranslator:
+    # Upper-cases whatever it is given, line by line or a whole document at a time
+    def __init__(self, target="da", fail_on=None, size=300 * MB):
+        self.target = target
+        self.fail_on = fail_on
+        self.backend = FakeBackend(size)
+        self.calls = []
+        self.translated = []
+        self.closed = False
+
+    def translate_lines(self, lines):
+        self.calls.append(list(lines))
+        if 'fail' in lines:
+            raise RuntimeError("model failed")
+        return [line.upper() for line in lines]
+
+    def translate_document(self, handler, subs, label, previous=None, journal=None, apply=True):
+        if label == self.fail_on:
+            raise RuntimeError("boom")
+        translations = [f"{handler.get_text(sub).upper()} ({self.target})" for sub in subs]
+        if apply:
+            for sub, text in zip(subs, translations):
+                handler.set_text(sub, text)
+        self.translated.append(label)
+        return translations
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def make_translator():
+    return FakeTranslator
@@ -0,0 +1,43 @@
+import importlib.util
+import pytest
+from backends import TranslationBackend, create_backend, BACKENDS
+from translator import SubtitleTranslator
+
+class ReverseBackend(TranslationBackend):
+    name = 'reverse'
+
+    def __init__(self):
+        self.calls = []
+
+    def count_tokens(self, lines):
+        return [len(line.split()) for line in lines]
+
+    def translate_batch(self, lines, max_length=512, num_beams=1):
+        self.calls.append(list(lines))
+        return [line[::-1] for line in lines]
+
+def test_known_backends():
+    assert set(BACKENDS) == {'hf', 'ct2'}
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_backend('nope', 'Helsinki-NLP/opus-mt-en-da', 'cpu')
+
+@pytest.mark.skipif(importlib.util.find_spec('ctranslate2') is not None,
+                    reason="CTranslate2 is installed")
+def test_ct2_backend_requires_ctranslate2():
+    with pytest.raises(RuntimeError):
+        create_backend('ct2', 'Helsinki-NLP/opus-mt-en-da', 'cpu')
+
+def test_translator_accepts_backend_instance():
+    backend = ReverseBackend()
+    translator = SubtitleTranslator(backend=backend)
+    assert translator.translate_text("-abc\ndef") == "-cba\nfed"
+    assert backend.calls == [["abc", "def"]]
+
+def test_generation_budget_is_capped():
+    from backends import generation_budget, get_decoding_preset
+    from config import MAX_LENGTH
+    preset = get_decoding_preset('balanced')
+    assert generation_budget(preset, 4) == 2 * 4 + 16
+    assert generation_budget(preset, 10000) == MAX_LENGTH
@@ -53,4 +53,56 @@ def test_calculate_directory_hash(tmp_path):
     # Modifying a file should change the hash
     with open(tmp_path / "test1.en.srt", "w") as f:
         f.write("Some content")
-    assert calculate_directory_hash(tmp_path) != initial_hash 
\ No newline at end of file
+    assert calculate_directory_hash(tmp_path) != initial_hash 
+
+def test_process_directory_loads_model_once(tmp_path, monkeypatch, fake_pipeline):
+    import batch_translator
+
+    monkeypatch.setattr(batch_translator, 'STATE_FILE', tmp_path / 'state.db')
+    monkeypatch.setattr(batch_translator, 'LIBRARY_INDEX_FILE', tmp_path / 'index.json')
+
+    library = tmp_path / "library"
+    library.mkdir()
+    for name in ("a", "b", "c"):
+        (library / f"{name}.en.srt").write_text("1\n00:00:01,000 --> 00:00:02,000\nHello\n")
+
+    batch_translator.process_directory(str(library), use_memory=False, server=None)
+
+    assert len(fake_pipeline) == 1
+    assert all((library / f"{name}.da.srt").exists() for name in ("a", "b", "c"))
+
+def test_needs_translation_after_source_edit(tmp_path):
+    from manifest import TranslationManifest
+
+    en_file = tmp_path / "test.en.srt"
+    en_file.write_text("original")
+    da_file = tmp_path / "test.da.srt"
+    da_file.touch()
+    TranslationManifest.create(en_file, da_file, "model", {}).save()
+    assert needs_translation(en_file) == False
+
+    en_file.write_text("fixed a typo")
+    assert needs_translation(en_file) == True
+
+def test_process_directory_several_targets(tmp_path, monkeypatch, fake_pipeline):
+    import batch_translator
+    from manifest import TranslationManifest
+
+    monkeypatch.setattr(batch_translator, 'STATE_FILE', tmp_path / 'state.db')
+    monkeypatch.setattr(batch_translator, 'LIBRARY_INDEX_FILE', tmp_path / 'index.json')
+
+    library = tmp_path / "library"
+    library.mkdir()
+    for name in ("a", "b"):
+        (library / f"{name}.en.srt").write_text("1\n00:00:01,000 --> 00:00:02,000\nHello\n")
+    batch_translator.process_directory(str(library), use_memory=False, server=None, targets=["da"])
+    assert sorted(fake_pipeline) == ["Helsinki-NLP/opus-mt-en-da"]
+
+    # Adding a target only translates what is missing for it
+    batch_translator.process_directory(str(library), use_memory=False, server=None, targets=["da", "sv"])
+    assert sorted(fake_pipeline) == ["Helsinki-NLP/opus-mt-en-da", "Helsinki-NLP/opus-mt-en-sv"]
+    for name in ("a", "b"):
+        for target in ("da", "sv"):
+            output = library / f"{name}.{target}.srt"
+            assert "HELLO" in output.read_text()
+            assert TranslationManifest.load(output).model.startswith(f"Helsinki-NLP/opus-mt-en-{target}|")
@@ -0,0 +1,34 @@
+import pytest
+from benchmarks.corpus import write_srt_corpus, write_library
+from benchmarks.stub import StubBackend
+from benchmarks.run import compare_results, run_suite
+
+def test_corpus_is_deterministic(tmp_path):
+    write_srt_corpus(tmp_path / "a.en.srt", 50, seed=1)
+    write_srt_corpus(tmp_path / "b.en.srt", 50, seed=1)
+    assert (tmp_path / "a.en.srt").read_text() == (tmp_path / "b.en.srt").read_text()
+
+def test_write_library(tmp_path):
+    paths = write_library(tmp_path, 8, 5)
+    assert len(paths) == 8
+    assert sum(p.suffix == '.ass' for p in paths) == 2
+    assert all(p.exists() for p in paths)
+
+def test_stub_backend():
+    backend = StubBackend()
+    assert backend.translate_batch(["Come on now"]) == ["now on Come"]
+    assert backend.count_tokens(["Come on now"]) == [4]
+
+def test_compare_results():
+    baseline = {'results': {'parse_srt': {'per_second': 100.0}, 'save_srt': {'per_second': 100.0}}}
+    current = {'results': {'parse_srt': {'per_second': 80.0}, 'save_srt': {'per_second': 95.0}}}
+    assert compare_results(baseline, current, threshold=0.15) == {'parse_srt': 0.8}
+    assert compare_results(baseline, current, threshold=0.25) == {}
+
+def test_run_suite_smoke():
+    import batch_translator
+    paths = batch_translator.STATE_FILE, batch_translator.LIBRARY_INDEX_FILE
+    results = run_suite(cues=50, files=4, cues_per_file=5, repeat=1, real_model=False)
+    assert (batch_translator.STATE_FILE, batch_translator.LIBRARY_INDEX_FILE) == paths
+    assert results['process_directory']['items'] == 4
+    assert all(result['per_second'] > 0 for result in results.values())
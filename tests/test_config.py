@@ -33,4 +33,9 @@ def test_language_codes():
     assert len(SOURCE_LANG) >= 2  # Language codes should be at least 2 chars
     assert len(TARGET_LANG) >= 2
     assert SOURCE_LANG.islower()  # Should be lowercase
-    assert TARGET_LANG.islower() 
\ No newline at end of file
+    assert TARGET_LANG.islower() 
+
+def test_other_targets():
+    assert get_target_suffix("sv") == ".sv"
+    assert get_model_name("sv") == f"Helsinki-NLP/opus-mt-{SOURCE_LANG}-sv"
+    assert get_model_name(TARGET_LANG) == get_model_name()
@@ -0,0 +1,37 @@
+import argparse
+import pytest
+from cpu_profile import CpuProfile, add_cpu_profile_arguments, cpu_profile_from_args, compare_outputs
+
+def parse(argv):
+    parser = argparse.ArgumentParser()
+    add_cpu_profile_arguments(parser)
+    return parser.parse_args(argv)
+
+def test_no_profile_by_default():
+    assert cpu_profile_from_args(parse([])) is None
+
+def test_profile_from_args():
+    profile = cpu_profile_from_args(parse(['--cpu-profile', '--threads', '6', '--interop-threads', '2', '--bf16']))
+    assert profile.quantize
+    assert profile.intra_threads == 6
+    assert profile.inter_threads == 2
+    assert profile.bf16
+
+def test_profile_without_quantization():
+    profile = cpu_profile_from_args(parse(['--cpu-profile', '--no-quantize']))
+    assert not profile.quantize
+    assert profile.intra_threads >= 1
+
+def test_compare_outputs():
+    report = compare_outputs(["Hej verden", "Hvad så"], ["Hej verden", "Hvad nu"])
+    assert report['exact_match'] == 0.5
+    assert report['token_f1'] == pytest.approx(0.75)
+    assert compare_outputs([], []) == {'exact_match': 1.0, 'token_f1': 1.0}
+
+@pytest.mark.timeout(300)
+def test_quantized_translation():
+    from translator import SubtitleTranslator
+    translator = SubtitleTranslator(cpu_profile=CpuProfile(intra_threads=2))
+    result = translator.translate_text("Hello world")
+    assert isinstance(result, str)
+    assert len(result) > 0
@@ -0,0 +1,121 @@
+import json
+import multiprocessing
+import os
+import pytest
+from pathlib import Path
+from library_index import LibraryIndex, get_target_path
+
+def make_library(root):
+    (root / "show" / "season1").mkdir(parents=True)
+    (root / "movies").mkdir()
+    (root / "show" / "season1" / "e01.en.srt").write_text("one")
+    (root / "show" / "season1" / "e01.da.srt").write_text("en")
+    (root / "show" / "season1" / "e02.en.ass").write_text("two")
+    (root / "movies" / "film.en.srt").write_text("three")
+    (root / "movies" / "film.mkv").touch()
+
+def age(path, seconds=60):
+    # Push directory mtimes out of the grace window so the cache is trusted
+    for directory in [path, *[p for p in path.rglob('*') if p.is_dir()]]:
+        stats = directory.stat()
+        os.utime(directory, ns=(stats.st_atime_ns, stats.st_mtime_ns - int(seconds * 1e9)))
+
+def test_get_target_path():
+    assert get_target_path(Path("/lib/show.en.srt")) == Path("/lib/show.da.srt")
+    assert get_target_path(Path("/lib/show.en.srt"), "sv") == Path("/lib/show.sv.srt")
+
+def test_needs_translation_per_target(tmp_path):
+    make_library(tmp_path)
+    (tmp_path / "movies" / "film.sv.srt").write_text("tre")
+    scan = LibraryIndex(tmp_path).scan()
+
+    assert sorted(p.name for p in scan.files_to_translate("sv")) == ["e01.en.srt", "e02.en.ass"]
+    assert scan.fingerprint(["da", "sv"]) != scan.fingerprint(["da"])
+
+def test_scan_collects_sources_and_targets(tmp_path):
+    make_library(tmp_path)
+    scan = LibraryIndex(tmp_path).scan()
+
+    assert sorted(p.name for p in scan.source_paths) == ["e01.en.srt", "e02.en.ass", "film.en.srt"]
+    assert not scan.needs_translation(tmp_path / "show" / "season1" / "e01.en.srt")
+    assert sorted(p.name for p in scan.files_to_translate()) == ["e02.en.ass", "film.en.srt"]
+
+def test_persistent_index_skips_unchanged_directories(tmp_path):
+    library = tmp_path / "library"
+    library.mkdir()
+    make_library(library)
+    age(library)
+    index_file = tmp_path / "index.json"
+
+    first = LibraryIndex(library, index_file)
+    first_scan = first.scan()
+    first.save()
+    assert first.listed == 4
+
+    second = LibraryIndex(library, index_file)
+    second_scan = second.scan()
+    assert second.listed == 0
+    assert second.reused == 4
+    assert second_scan.fingerprint() == first_scan.fingerprint()
+
+def test_changed_directory_is_relisted(tmp_path):
+    library = tmp_path / "library"
+    library.mkdir()
+    make_library(library)
+    age(library)
+    index_file = tmp_path / "index.json"
+
+    index = LibraryIndex(library, index_file)
+    before = index.scan()
+    index.save()
+
+    (library / "movies" / "new.en.srt").write_text("new")
+    index = LibraryIndex(library, index_file)
+    after = index.scan()
+    assert index.listed == 1
+    assert any(p.name == "new.en.srt" for p in after.source_paths)
+    assert after.fingerprint() != before.fingerprint()
+
+def test_modified_source_changes_fingerprint_without_relisting(tmp_path):
+    library = tmp_path / "library"
+    library.mkdir()
+    make_library(library)
+    age(library)
+    index_file = tmp_path / "index.json"
+
+    index = LibraryIndex(library, index_file)
+    before = index.scan()
+    index.save()
+
+    source = library / "movies" / "film.en.srt"
+    with open(source, "w") as f:
+        f.write("edited in place")
+    index = LibraryIndex(library, index_file)
+    assert index.scan().fingerprint() != before.fingerprint()
+    assert index.listed == 0
+
+def _save_repeatedly(library, index_file, times):
+    index = LibraryIndex(library, index_file)
+    index.scan()
+    for _ in range(times):
+        index.save()
+
+def test_concurrent_saves_from_several_processes(tmp_path):
+    index_file = tmp_path / "index.json"
+    libraries = []
+    for name in ("a", "b", "c"):
+        library = tmp_path / name
+        library.mkdir()
+        make_library(library)
+        libraries.append(library)
+
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=_save_repeatedly, args=(library, index_file, 30)) for library in libraries]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert [process.exitcode for process in processes] == [0, 0, 0]
+    json.loads(index_file.read_text())
+    assert list(tmp_path.glob("index.json.tmp*")) == []
@@ -0,0 +1,80 @@
+import os
+import pytest
+from manifest import TranslationJournal, TranslationManifest, cue_key, get_journal_path, get_manifest_path
+
+MODEL = "Helsinki-NLP/opus-mt-en-da"
+
+def test_get_manifest_path(tmp_path):
+    assert get_manifest_path(tmp_path / "show.da.srt") == tmp_path / ".show.da.srt.subtrans.json"
+
+def test_cue_key_ignores_whitespace():
+    assert cue_key("Hello  world\n") == cue_key("Hello world")
+    assert cue_key("Hello\nworld") != cue_key("Hello world")
+
+def test_save_and_load(tmp_path):
+    source = tmp_path / "show.en.srt"
+    source.write_text("content")
+    output = tmp_path / "show.da.srt"
+
+    TranslationManifest.create(source, output, MODEL, {cue_key("Hi"): "Hej"}).save()
+    manifest = TranslationManifest.load(output)
+
+    assert manifest.translations_for(MODEL) == {cue_key("Hi"): "Hej"}
+    assert manifest.translations_for("Helsinki-NLP/opus-mt-en-sv") == {}
+
+def test_load_missing_or_corrupt(tmp_path):
+    output = tmp_path / "show.da.srt"
+    assert TranslationManifest.load(output) is None
+    get_manifest_path(output).write_text("{not json")
+    assert TranslationManifest.load(output) is None
+
+def test_matches_source(tmp_path):
+    source = tmp_path / "show.en.srt"
+    source.write_text("content")
+    manifest = TranslationManifest.create(source, tmp_path / "show.da.srt", MODEL, {})
+    assert manifest.matches_source(source)
+
+    # Touched without changing content
+    os.utime(source, ns=(0, 0))
+    assert manifest.matches_source(source)
+
+    source.write_text("edited!")
+    assert not manifest.matches_source(source)
+
+def test_journal_round_trip(tmp_path):
+    output = tmp_path / "show.da.srt"
+    journal = TranslationJournal.open(output, MODEL, every=2)
+    journal.record({"Hello": "Hej"})
+    assert not get_journal_path(output).exists()
+    journal.record({"Bye": "Farvel"})
+    assert get_journal_path(output).exists()
+    journal.record({"Yes": "Ja"})
+    journal.close()
+
+    resumed = TranslationJournal.open(output, MODEL)
+    assert resumed.entries == {"Hello": "Hej", "Bye": "Farvel", "Yes": "Ja"}
+    resumed.remove()
+    assert not get_journal_path(output).exists()
+
+def test_journal_survives_torn_append(tmp_path):
+    output = tmp_path / "show.da.srt"
+    journal = TranslationJournal.open(output, MODEL, every=1)
+    journal.record({"Hello": "Hej"})
+    journal.close()
+    with open(get_journal_path(output), 'a') as f:
+        f.write('{"Bye": "Far')
+
+    resumed = TranslationJournal.open(output, MODEL, every=1)
+    assert resumed.entries == {"Hello": "Hej"}
+    resumed.record({"Yes": "Ja"})
+    resumed.close()
+    assert TranslationJournal.open(output, MODEL).entries == {"Hello": "Hej", "Yes": "Ja"}
+
+def test_journal_for_other_model_is_discarded(tmp_path):
+    output = tmp_path / "show.da.srt"
+    journal = TranslationJournal.open(output, MODEL, every=1)
+    journal.record({"Hello": "Hej"})
+    journal.close()
+
+    assert TranslationJournal.open(output, "other/model").entries == {}
+    assert not get_journal_path(output).exists()
@@ -0,0 +1,102 @@
+import json
+import pytest
+from metrics import Metrics, ProgressReporter, record_file
+from pipeline import TranslationPipeline
+
+SRT = "1\n00:00:01,000 --> 00:00:02,000\nHello\n"
+
+@pytest.fixture
+def recorder(monkeypatch):
+    recorder = Metrics()
+    monkeypatch.setattr('metrics.metrics', recorder)
+    return recorder
+
+def test_counters_and_labels():
+    recorder = Metrics()
+    recorder.incr('batches')
+    recorder.incr('batches', 2)
+    recorder.incr('stage_seconds', 1.5, stage='parse')
+    with recorder.timer('write'):
+        pass
+    assert recorder.counter('batches') == 3
+    assert recorder.counter('stage_seconds', stage='parse') == 1.5
+    assert recorder.counter('stage_seconds', stage='write') >= 0
+
+def test_unknown_format_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        Metrics().configure(tmp_path / "metrics.txt", 'csv')
+
+def test_jsonl_events_and_summary(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    recorder = Metrics()
+    recorder.configure(path, 'jsonl')
+    recorder.incr('batches')
+    recorder.event('file', path='a.en.srt', cues=3)
+    recorder.close()
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record['event'] for record in records] == ['file', 'summary']
+    assert records[0]['cues'] == 3
+    assert records[1]['counters']['batches'] == 1
+
+def test_prometheus_textfile(tmp_path):
+    path = tmp_path / "subtrans.prom"
+    recorder = Metrics()
+    recorder.configure(path, 'prometheus')
+    recorder.incr('files')
+    recorder.incr('stage_seconds', 2, stage='translate')
+    recorder.set('model_load_seconds', 4.5, backend='hf')
+    recorder.close()
+
+    text = path.read_text()
+    assert "# TYPE subtrans_files_total counter" in text
+    assert "subtrans_files_total 1" in text
+    assert 'subtrans_stage_seconds_total{stage="translate"} 2' in text
+    assert 'subtrans_model_load_seconds{backend="hf"} 4.5' in text
+    assert not list(tmp_path.glob("*.tmp*"))
+
+def test_record_file_rates(recorder, tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    recorder.configure(path, 'jsonl')
+    record_file('a.en.srt', {'cues': 10, 'lines': 20, 'tokens': 200}, {'parse': 0.1, 'translate': 2.0})
+
+    event = json.loads(path.read_text())
+    assert event['lines_per_second'] == 10.0
+    assert event['tokens_per_second'] == 100.0
+    assert event['translate_seconds'] == 2.0
+    assert recorder.counter('files') == 1
+    assert recorder.counter('cues') == 10
+
+def test_progress_reporter_is_throttled(capsys):
+    now = [0.0]
+    progress = ProgressReporter('library', 100, interval=10, clock=lambda: now[0])
+    for done in range(1, 101):
+        now[0] = done * 0.5
+        progress.update(done, 'files')
+    lines = capsys.readouterr().out.splitlines()
+    # Every 10 seconds (20 files) and once more at the end
+    assert len(lines) == 5
+    assert lines[0].startswith("[library] 20/100 files (2.0 files/s)")
+    assert lines[-1].startswith("[library] 100/100 files")
+
+def test_progress_reporter_quiet_for_short_work(capsys):
+    progress = ProgressReporter('model', 3, interval=3600)
+    for done in range(1, 4):
+        progress.update(done, 'lines')
+    assert capsys.readouterr().out == ''
+
+def test_pipeline_records_file_metrics(recorder, tmp_path):
+    path = tmp_path / "a.en.srt"
+    path.write_text(SRT)
+
+    class Translator:
+        last_stats = {'cues': 1, 'lines': 1, 'tokens': 3}
+
+        def translate_document(self, handler, subs, label, previous=None, journal=None, apply=True):
+            return [handler.get_text(sub) for sub in subs]
+
+    TranslationPipeline(Translator()).run([str(path)])
+    assert recorder.counter('files') == 1
+    assert recorder.counter('tokens') == 3
+    for stage in ('parse', 'translate', 'write'):
+        assert recorder.counter('stage_seconds', stage=stage) > 0
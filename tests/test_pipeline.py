@@ -0,0 +1,186 @@
+import pytest
+from pipeline import TranslationPipeline, StageStats
+
+SRT = "1\n00:00:01,000 --> 00:00:02,000\nHello\n"
+
+def test_stage_stats_utilization():
+    stats = StageStats('parse', workers=2)
+    stats.record(1.0)
+    stats.record(1.0)
+    assert stats.items == 2
+    assert stats.utilization(2.0) == 0.5
+    assert stats.utilization(0.0) == 0.0
+
+def test_pipeline_translates_and_writes(tmp_path, make_translator):
+    files = []
+    for name in ("a", "b", "c"):
+        path = tmp_path / f"{name}.en.srt"
+        path.write_text(SRT)
+        files.append(str(path))
+
+    completed = []
+    pipeline = TranslationPipeline(make_translator(), queue_size=1,
+                                   on_complete=lambda job, error: completed.append((job, error)))
+    results = pipeline.run(files)
+
+    assert sorted(results) == sorted((f, None) for f in files)
+    assert completed == results
+    for name in ("a", "b", "c"):
+        assert "HELLO (da)" in (tmp_path / f"{name}.da.srt").read_text()
+    assert pipeline.stats['translate'].items == 3
+    assert pipeline.stats['write'].items == 3
+
+def test_pipeline_reports_errors_and_continues(tmp_path, make_translator):
+    good = tmp_path / "good.en.srt"
+    good.write_text(SRT)
+    bad = tmp_path / "bad.en.srt"
+    bad.write_text(SRT)
+    missing = tmp_path / "missing.en.srt"
+
+    pipeline = TranslationPipeline(make_translator(fail_on=str(bad)), load_workers=2)
+    results = dict(pipeline.run([str(good), str(bad), str(missing)]))
+
+    assert results[str(good)] is None
+    assert results[str(bad)] == "boom"
+    assert results[str(missing)] is not None
+    assert not (tmp_path / "bad.da.srt").exists()
+
+def test_pipeline_survives_failing_callback(tmp_path, make_translator):
+    files = []
+    for name in ("a", "b", "c", "d"):
+        path = tmp_path / f"{name}.en.srt"
+        path.write_text(SRT)
+        files.append(str(path))
+
+    def on_complete(job, error):
+        if job.endswith("b.en.srt"):
+            raise RuntimeError("database is locked")
+
+    results = dict(TranslationPipeline(make_translator(), queue_size=1, on_complete=on_complete).run(files))
+    assert "database is locked" in results[files[1]]
+    assert [results[f] for f in files if f != files[1]] == [None, None, None]
+
+def test_pipeline_skips_jobs_it_may_not_write(tmp_path, make_translator):
+    files = []
+    for name in ("a", "b"):
+        path = tmp_path / f"{name}.en.srt"
+        path.write_text(SRT)
+        files.append(str(path))
+
+    pipeline = TranslationPipeline(make_translator(), may_write=lambda job: not job.endswith("b.en.srt"))
+    results = dict(pipeline.run(files))
+    assert results[files[0]] is None
+    assert results[files[1]] is not None
+    assert (tmp_path / "a.da.srt").exists()
+    assert not (tmp_path / "b.da.srt").exists()
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_pipeline_stops_when_writer_dies(tmp_path, monkeypatch, make_translator):
+    files = []
+    for name in ("a", "b", "c", "d"):
+        path = tmp_path / f"{name}.en.srt"
+        path.write_text(SRT)
+        files.append(str(path))
+
+    pipeline = TranslationPipeline(make_translator(), queue_size=1)
+    monkeypatch.setattr(pipeline, 'durations', None)
+    with pytest.raises(RuntimeError, match="writer stopped"):
+        pipeline.run(files)
+
+def test_pipeline_merged_sentences_with_repeated_cue(tmp_path):
+    from backends import TranslationBackend
+    from manifest import TranslationManifest, cue_key
+    from translator import SubtitleTranslator
+
+    class ReversingBackend(TranslationBackend):
+        def count_tokens(self, lines):
+            return [len(line.split()) for line in lines]
+
+        def translate_batch(self, lines, max_length=None, num_beams=None):
+            return [' '.join(reversed(line.split())) for line in lines]
+
+    source = tmp_path / "a.en.srt"
+    source.write_text("1\n00:00:01,000 --> 00:00:02,000\nI think\n\n"
+                      "2\n00:00:02,100 --> 00:00:03,000\nwe should go.\n\n"
+                      "3\n00:00:10,000 --> 00:00:11,000\nI think\n\n"
+                      "4\n00:00:11,100 --> 00:00:12,000\nit is fine now.\n")
+    translator = SubtitleTranslator(backend=ReversingBackend(), merge_sentences=True)
+    expected = tmp_path / "expected.srt"
+    translator.translate_subtitle_file(str(source), str(expected))
+
+    assert TranslationPipeline(translator).run([str(source)]) == [(str(source), None)]
+    output = (tmp_path / "a.da.srt").read_text()
+    assert output == expected.read_text()
+    assert "00:00:02,000\ngo.\n" in output
+    assert "00:00:11,000\nnow.\n" in output
+    # "I think" was translated two ways, so the manifest does not pin either
+    cues = TranslationManifest.load(tmp_path / "a.da.srt").cues
+    assert cue_key("I think") not in cues
+    assert cue_key("we should go.") in cues
+
+def test_pipeline_prepare_stage(tmp_path, make_translator):
+    def extract(job):
+        path = tmp_path / f"{job}.en.srt"
+        path.write_text(SRT)
+        return path
+
+    pipeline = TranslationPipeline(make_translator(), prepare=extract)
+    results = pipeline.run(["episode1", "episode2"])
+
+    assert sorted(results) == [("episode1", None), ("episode2", None)]
+    assert (tmp_path / "episode1.da.srt").exists()
+    assert pipeline.stats['extract'].items == 2
+
+def test_pipeline_parses_once_for_several_targets(tmp_path, monkeypatch, make_translator):
+    from targets import ModelCache
+    source = tmp_path / "a.en.srt"
+    source.write_text(SRT)
+    import subtitle_formats
+    reads = []
+    original_read = subtitle_formats.SrtFormat.read
+
+    def counting_read(self, path):
+        reads.append(path)
+        return original_read(self, path)
+
+    monkeypatch.setattr(subtitle_formats.SrtFormat, 'read', counting_read)
+
+    class Backend:
+        def memory_bytes(self):
+            return 0
+
+    def factory(target):
+        translator = make_translator(target=target)
+        translator.backend = Backend()
+        return translator
+
+    with ModelCache(factory) as models:
+        pipeline = TranslationPipeline(models, targets=["da", "sv", "no"], concurrency=2,
+                                       select_targets=lambda path: ["da", "sv"])
+        assert pipeline.run([str(source)]) == [(str(source), None)]
+
+    assert reads == [str(source)]
+    assert "HELLO (da)" in (tmp_path / "a.da.srt").read_text()
+    assert "HELLO (sv)" in (tmp_path / "a.sv.srt").read_text()
+    assert not (tmp_path / "a.no.srt").exists()
+
+def test_pipeline_target_failure_keeps_other_targets(tmp_path, make_translator):
+    from targets import ModelCache
+    source = tmp_path / "a.en.srt"
+    source.write_text(SRT)
+
+    class Backend:
+        def memory_bytes(self):
+            return 0
+
+    def factory(target):
+        translator = make_translator(fail_on=str(source) if target == "sv" else None, target=target)
+        translator.backend = Backend()
+        return translator
+
+    with ModelCache(factory) as models:
+        results = TranslationPipeline(models, targets=["da", "sv"]).run([str(source)])
+
+    assert results == [(str(source), "sv: boom")]
+    assert (tmp_path / "a.da.srt").exists()
+    assert not (tmp_path / "a.sv.srt").exists()
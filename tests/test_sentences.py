@@ -0,0 +1,52 @@
+from sentences import ends_sentence, group_sentences, split_translation
+from subtitle_formats import Cue
+
+def test_ends_sentence():
+    assert ends_sentence("Hello.")
+    assert ends_sentence('He said "go!"')
+    assert not ends_sentence("I was going to")
+    assert not ends_sentence("I was going to...", "tell you")
+    assert ends_sentence("Wait...", "Who is it?")
+
+def test_groups_lines_and_adjacent_cues():
+    segments = [(0, '', 'I was going to'), (0, '', 'tell you something.'),
+                (1, '-', 'Really?'), (1, '-', 'Yes, and'), (2, '', 'it is important.'),
+                (3, '', 'New one.')]
+    assert group_sentences(segments) == [[0, 1], [2], [3, 4], [5]]
+
+def test_does_not_merge_across_gaps_or_markup():
+    items = [Cue(0, 1000, ''), Cue(5000, 6000, ''), Cue(6100, 7000, '')]
+    segments = [(0, '', 'And then'), (1, '', 'we left'), (2, '', '<i>the house</i>')]
+    assert group_sentences(segments, items, max_gap_ms=1500) == [[0], [1], [2]]
+
+def test_merges_in_time_order_on_one_track(tmp_path):
+    from subtitle_formats import AssFormat
+    source = tmp_path / "test.ass"
+    source.write_text("""[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+Dialogue: 0,0:00:03.00,0:00:04.00,Default,,0,0,0,,it is important.
+Dialogue: 0,0:00:01.00,0:00:02.00,Default,,0,0,0,,I was going to say
+Dialogue: 0,0:00:01.50,0:00:03.00,Top,,0,0,0,,Meanwhile the
+Dialogue: 1,0:00:03.00,0:00:04.00,Top,,0,0,0,,other speaker talks.
+Dialogue: 0,0:00:02.00,0:00:03.50,Default,,0,0,0,,that
+""")
+    items = AssFormat().read(str(source)).events
+    segments = [(k, '', event.text) for k, event in enumerate(items)]
+    groups = group_sentences(segments, items)
+    # File order is 0..4; reading order of the Default track is 1, 4, 0
+    assert [1, 4] in groups
+    # 0 overlaps 4; 2 and 3 are on different layers
+    assert [0] in groups and [2] in groups and [3] in groups
+
+def test_respects_max_chars():
+    segments = [(0, '', 'one two'), (0, '', 'three four'), (0, '', 'five six')]
+    assert group_sentences(segments, max_chars=20) == [[0, 1], [2]]
+
+def test_split_translation_follows_proportions_and_punctuation():
+    assert split_translation("Jeg ville fortælle dig noget.", [14, 19]) == ["Jeg ville", "fortælle dig noget."]
+    assert split_translation("Ja, og det er vigtigt.", [8, 16]) == ["Ja,", "og det er vigtigt."]
+    assert split_translation("Hej", [4]) == ["Hej"]
+
+def test_split_translation_with_too_few_words():
+    assert split_translation("Ja", [3, 3, 3]) is None
+    assert split_translation("a b c d", [3, 3, 3]) == ["a b", "c", "d"]
@@ -0,0 +1,101 @@
+import threading
+import pytest
+from server import BatchingQueue, RemoteBackend, connect_server, create_server, parse_address, server_request
+from translator import SubtitleTranslator
+
+@pytest.fixture
+def running_server(tmp_path, make_translator):
+    translator = make_translator()
+    batcher = BatchingQueue(translator, max_wait=0.05, max_batch_lines=8)
+    address = str(tmp_path / "subtrans.sock")
+    server = create_server(address, batcher)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield address, translator
+    server.shutdown()
+    server.server_close()
+    batcher.close()
+
+def test_parse_address():
+    assert parse_address("http://127.0.0.1:8765") == ('http', ('127.0.0.1', 8765))
+    assert parse_address("unix:/tmp/s.sock") == ('unix', '/tmp/s.sock')
+    assert parse_address("/tmp/s.sock") == ('unix', '/tmp/s.sock')
+
+def test_batching_queue_coalesces_concurrent_requests(make_translator):
+    translator = make_translator()
+    batcher = BatchingQueue(translator, max_wait=0.2, max_batch_lines=64)
+    results = {}
+
+    def submit(name, lines):
+        results[name] = batcher.submit(lines)
+
+    threads = [threading.Thread(target=submit, args=(i, [f"line {i}", f"other {i}"])) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+
+    assert results[2] == ["LINE 2", "OTHER 2"]
+    assert len(translator.calls) < 4
+    assert sum(len(call) for call in translator.calls) == 8
+
+def test_batching_queue_reports_errors_to_every_request(make_translator):
+    batcher = BatchingQueue(make_translator(), max_wait=0)
+    with pytest.raises(RuntimeError):
+        batcher.submit(["fail"])
+    assert batcher.submit(["ok"]) == ["OK"]
+    batcher.close()
+
+def test_server_translates_over_unix_socket(running_server):
+    address, translator = running_server
+    assert server_request(address, 'POST', '/translate', {'lines': ["hello", "world"]}) == \
+        {'translations': ["HELLO", "WORLD"]}
+    assert server_request(address, 'GET', '/health')['queue_depth'] == 0
+    with pytest.raises(RuntimeError):
+        server_request(address, 'POST', '/translate', {'lines': "not a list"})
+
+def test_connect_server_and_remote_translator(running_server, monkeypatch, tmp_path):
+    address, translator = running_server
+    assert connect_server(str(tmp_path / "missing.sock")) is None
+    assert connect_server(None) is None
+
+    remote = connect_server(address)
+    assert isinstance(remote, RemoteBackend)
+    client = SubtitleTranslator(backend=remote)
+    assert client.translate_text("-Hello\n-Yes") == "-HELLO\n-YES"
+
+    monkeypatch.setattr('server.get_model_name', lambda: "another/model")
+    assert connect_server(address) is None
+
+def test_connect_server_requires_same_preset(running_server):
+    address, _ = running_server
+    assert connect_server(address) is not None
+    assert connect_server(address, preset="quality") is None
+
+def test_explicit_backend_is_not_replaced_by_server(running_server):
+    from backends import TranslationBackend
+    from translator import create_translator
+    address, translator = running_server
+
+    class LocalBackend(TranslationBackend):
+        name = 'local'
+
+        def count_tokens(self, lines):
+            return [1 for _ in lines]
+
+        def translate_batch(self, lines, max_length=512, num_beams=1):
+            return [f"local {line}" for line in lines]
+
+    local = LocalBackend()
+    client = create_translator(use_memory=False, backend=local, server=address)
+    assert client.backend is local
+    assert client.translate_text("Hello") == "local Hello"
+    assert translator.calls == []
+
+    assert isinstance(create_translator(use_memory=False, server=address).backend, RemoteBackend)
+
+def test_refuses_to_replace_running_server(running_server, make_translator):
+    address, _ = running_server
+    with pytest.raises(RuntimeError):
+        create_server(address, BatchingQueue(make_translator()))
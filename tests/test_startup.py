@@ -0,0 +1,39 @@
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# Importing every CLI module must stay well below the seconds torch/transformers need
+IMPORT_BUDGET_SECONDS = 1.5
+HEAVY_MODULES = ('torch', 'transformers', 'ctranslate2')
+
+def run_python(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, timeout=60)
+
+def test_cli_modules_do_not_import_torch():
+    result = run_python(
+        "import sys\n"
+        "import translator, batch_translator, subtitle_extractor, worker_pool, pipeline, backends\n"
+        f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))\n"
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ''
+
+def test_import_time_budget():
+    # Best of three, so a cold disk cache does not fail the run
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        result = run_python("import translator, batch_translator, subtitle_extractor")
+        timings.append(time.perf_counter() - start)
+        assert result.returncode == 0, result.stderr
+    assert min(timings) < IMPORT_BUDGET_SECONDS
+
+def test_help_does_not_load_model():
+    for script in ('translator.py', 'batch_translator.py', 'subtitle_extractor.py'):
+        result = subprocess.run([sys.executable, '-X', 'importtime', script, '--help'], cwd=ROOT,
+                                capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0, result.stderr
+        imported = {line.split('|')[-1].strip() for line in result.stderr.splitlines()}
+        assert not imported & set(HEAVY_MODULES)
@@ -0,0 +1,135 @@
+import threading
+import pytest
+from library_index import LibraryIndex
+from state_store import DONE, FAILED, PENDING, LibraryState
+
+MODEL = "Helsinki-NLP/opus-mt-en-da"
+SV_MODEL = "Helsinki-NLP/opus-mt-en-sv"
+
+def write_library(root, names):
+    root.mkdir(exist_ok=True)
+    for name in names:
+        (root / f"{name}.en.srt").write_text("1\n00:00:01,000 --> 00:00:02,000\nHello\n")
+
+def test_fingerprint_per_library(tmp_path):
+    db = tmp_path / "state.db"
+    movies = LibraryState(tmp_path / "movies", db)
+    shows = LibraryState(tmp_path / "shows", db)
+
+    movies.save_fingerprint("abc")
+    assert movies.last_fingerprint() == "abc"
+    assert shows.last_fingerprint() is None
+
+    movies.forget_fingerprint()
+    assert movies.last_fingerprint() is None
+    movies.close()
+    shows.close()
+
+def test_record_and_get(tmp_path):
+    write_library(tmp_path, ["a"])
+    source = tmp_path / "a.en.srt"
+    state = LibraryState(tmp_path, tmp_path / "state.db")
+
+    state.mark_pending([str(source)], MODEL)
+    assert state.get(source, MODEL)['status'] == PENDING
+
+    state.record(source, DONE, 1.5, MODEL)
+    row = state.get(source, MODEL)
+    assert row['status'] == DONE
+    assert row['duration'] == 1.5
+    assert row['model'] == MODEL
+    assert row['size'] == source.stat().st_size
+    assert row['sha1']
+
+    state.record(source, FAILED, 0.1, MODEL, "boom")
+    assert state.get(source, MODEL)['error'] == "boom"
+    assert state.status_counts() == {FAILED: 1}
+
+    # Each target language has its own row
+    state.record(source, DONE, 2.0, SV_MODEL)
+    assert state.status_counts() == {FAILED: 1, DONE: 1}
+    state.close()
+
+def test_targets_to_translate_skips_done(tmp_path):
+    library = tmp_path / "library"
+    write_library(library, ["a", "b"])
+    (library / "a.da.srt").write_text("translated")
+    state = LibraryState(library, tmp_path / "state.db")
+    state.record(library / "a.en.srt", DONE, 1.0, MODEL)
+
+    scan = LibraryIndex(library).scan()
+    pending = state.targets_to_translate(scan, ["da", "sv"])
+    assert {path.name: targets for path, targets in pending.items()} == {
+        "a.en.srt": ["sv"],
+        "b.en.srt": ["da", "sv"],
+    }
+    state.close()
+
+def test_old_schema_is_rebuilt(tmp_path):
+    import sqlite3
+    db = tmp_path / "state.db"
+    conn = sqlite3.connect(str(db))
+    conn.execute("CREATE TABLE files (root TEXT, path TEXT, status TEXT, PRIMARY KEY (root, path))")
+    conn.commit()
+    conn.close()
+
+    state = LibraryState(tmp_path, db)
+    state.record(tmp_path / "a.en.srt", DONE, 1.0, MODEL)
+    assert state.get(tmp_path / "a.en.srt", MODEL)['status'] == DONE
+    state.close()
+
+def test_old_schema_is_rebuilt_once(tmp_path):
+    import sqlite3
+    db = tmp_path / "state.db"
+    conn = sqlite3.connect(str(db))
+    conn.execute("CREATE TABLE files (root TEXT, path TEXT, status TEXT, PRIMARY KEY (root, path))")
+    conn.commit()
+    conn.close()
+    write_library(tmp_path, [str(i) for i in range(8)])
+    errors = []
+
+    def run(name):
+        try:
+            state = LibraryState(tmp_path, db)
+            state.record(tmp_path / f"{name}.en.srt", DONE, 0.1, MODEL)
+            state.close()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(str(i),)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    state = LibraryState(tmp_path, db)
+    assert state.status_counts() == {DONE: 8}
+    state.close()
+
+def test_concurrent_writers(tmp_path):
+    db = tmp_path / "state.db"
+    library = tmp_path / "library"
+    write_library(library, [str(i) for i in range(20)])
+    errors = []
+
+    def run(names):
+        state = LibraryState(library, db)
+        try:
+            for name in names:
+                state.record(library / f"{name}.en.srt", DONE, 0.1, MODEL)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            state.close()
+
+    threads = [threading.Thread(target=run, args=([str(i) for i in range(k, 20, 4)],)) for k in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    state = LibraryState(library, db)
+    assert state.status_counts() == {DONE: 20}
+    state.close()
@@ -1,5 +1,5 @@
 import pytest
-from subtitle_extractor import format_stream_info, SubtitleExtractor
+from subtitle_extractor import format_stream_info, stream_language_suffix, SubtitleExtractor
 from pathlib import Path
 from unittest.mock import patch
 import json
@@ -65,4 +65,113 @@ def test_get_subtitle_streams(tmp_path):
         
         assert len(streams) == 1
         assert streams[0]['codec_name'] == 'ass'
-        assert streams[0]['tags']['language'] == 'eng' 
\ No newline at end of file
+        assert streams[0]['tags']['language'] == 'eng' 
+
+MULTI_STREAMS = {
+    'streams': [
+        {'codec_name': 'subrip', 'tags': {'language': 'eng', 'title': 'Full'}},
+        {'codec_name': 'subrip', 'tags': {'language': 'eng', 'title': 'SDH'}},
+        {'codec_name': 'hdmv_pgs_subtitle', 'tags': {'language': 'eng'}},
+        {'codec_name': 'ass', 'tags': {'language': 'en'}},
+        {'codec_name': 'subrip', 'tags': {'language': 'dan'}},
+    ]
+}
+
+def test_language_matches():
+    from subtitle_extractor import language_matches
+    assert language_matches('eng', 'en')
+    assert language_matches('en', 'eng')
+    assert language_matches('ENG', 'eng')
+    assert not language_matches('dan', 'eng')
+
+@pytest.mark.skipif(not Path("/usr/bin/ffmpeg").exists(),
+                   reason="Requires ffmpeg")
+def test_probe_is_cached(tmp_path):
+    test_file = tmp_path / "test.mkv"
+    test_file.touch()
+
+    with patch('subprocess.run') as mock_run:
+        mock_run.return_value.stdout = json.dumps(MULTI_STREAMS)
+        extractor = SubtitleExtractor(str(test_file))
+        extractor.get_subtitle_streams()
+        extractor.find_streams('eng')
+        extractor.extract_subtitle(0)
+
+        probes = [call for call in mock_run.call_args_list if call.args[0][0] == 'ffprobe']
+        assert len(probes) == 1
+
+@pytest.mark.skipif(not Path("/usr/bin/ffmpeg").exists(),
+                   reason="Requires ffmpeg")
+def test_extract_subtitles_single_pass(tmp_path):
+    test_file = tmp_path / "test.mkv"
+    test_file.touch()
+
+    with patch('subprocess.run') as mock_run:
+        mock_run.return_value.stdout = json.dumps(MULTI_STREAMS)
+        extractor = SubtitleExtractor(str(test_file))
+        assert extractor.find_streams('eng') == [0, 1, 3]
+
+        paths = extractor.extract_subtitles([0, 1, 3, 4])
+        assert paths == [
+            tmp_path / "test.en.srt",
+            tmp_path / "test.stream1.en.srt",
+            tmp_path / "test.en.ass",
+            tmp_path / "test.dan.srt",
+        ]
+
+        ffmpeg_calls = [call.args[0] for call in mock_run.call_args_list if call.args[0][0] == 'ffmpeg']
+        assert len(ffmpeg_calls) == 1
+        cmd = ffmpeg_calls[0]
+        assert cmd.count('-i') == 1
+        assert [cmd[i + 1] for i, arg in enumerate(cmd) if arg == '-map'] == ['0:s:0', '0:s:1', '0:s:3', '0:s:4']
+        assert cmd[-6:-3] == ['-c:s', 'copy', str(tmp_path / "test.en.ass")]
+
+def test_stream_language_suffix():
+    assert stream_language_suffix({'tags': {'language': 'eng'}}) == ".en"
+    assert stream_language_suffix({'tags': {'language': 'en'}}) == ".en"
+    assert stream_language_suffix({'tags': {'language': 'DAN'}}) == ".dan"
+    assert stream_language_suffix({'tags': {'language': 'und'}}) == ".en"
+    assert stream_language_suffix({}) == ".en"
+
+def test_select_best_stream_prefers_full_non_sdh():
+    from subtitle_extractor import select_best_stream
+    streams = [
+        {'codec_name': 'subrip', 'tags': {'language': 'eng', 'title': 'Forced'}, 'disposition': {'forced': 1}},
+        {'codec_name': 'subrip', 'tags': {'language': 'eng', 'title': 'SDH'}, 'disposition': {'hearing_impaired': 1}},
+        {'codec_name': 'hdmv_pgs_subtitle', 'tags': {'language': 'eng'}},
+        {'codec_name': 'subrip', 'tags': {'language': 'eng'}},
+        {'codec_name': 'subrip', 'tags': {'language': 'dan'}, 'disposition': {'default': 1}},
+    ]
+    assert select_best_stream(streams) == 3
+
+def test_select_best_stream_falls_back_to_sdh():
+    from subtitle_extractor import select_best_stream
+    streams = [
+        {'codec_name': 'subrip', 'tags': {'language': 'eng', 'title': 'English (SDH)'}},
+        {'codec_name': 'subrip', 'tags': {'language': 'eng', 'title': 'Forced'}},
+    ]
+    assert select_best_stream(streams) == 0
+    assert select_best_stream(streams[1:]) is None
+
+def test_probe_cache_invalidated_by_change(tmp_path):
+    from subtitle_extractor import ProbeCache
+    media = tmp_path / "movie.mkv"
+    media.write_bytes(b"x")
+    cache_file = tmp_path / "probes.json"
+
+    cache = ProbeCache(cache_file)
+    assert cache.get(media) is None
+    cache.put(media, [{'codec_name': 'subrip'}])
+    cache.save()
+
+    assert ProbeCache(cache_file).get(media) == [{'codec_name': 'subrip'}]
+    media.write_bytes(b"longer")
+    assert ProbeCache(cache_file).get(media) is None
+
+def test_find_media_files(tmp_path):
+    from subtitle_extractor import find_media_files
+    (tmp_path / "show").mkdir()
+    (tmp_path / "show" / "e01.mkv").touch()
+    (tmp_path / "movie.MP4").touch()
+    (tmp_path / "movie.en.srt").touch()
+    assert [p.name for p in find_media_files(str(tmp_path))] == ["movie.MP4", "e01.mkv"]
@@ -63,4 +63,202 @@ Dialogue: 0,0:00:05.00,0:00:09.00,Default,,0,0,0,,{\\i1}Formatted text{\\i0}"""
     subs = handler.read(str(test_file))
     assert len(subs.events) == 2
     assert handler.get_text(subs.events[0]) == "Test subtitle"
-    assert "Formatted text" in handler.get_text(subs.events[1]) 
\ No newline at end of file
+    assert "Formatted text" in handler.get_text(subs.events[1]) 
+
+SRT_ROUND_TRIP = (
+    "1\r\n00:00:01,000 --> 00:00:04,000 X1:40 X2:600 Y1:20 Y2:50\r\nTest subtitle\r\n\r\n"
+    "2\r\n00:00:05,5 --> 00:00:09,000\r\n<i>Formatted</i>\r\n-Second line\r\n\r\n"
+)
+
+ASS_ROUND_TRIP = """[Script Info]
+; Comment kept as is
+Title: Test
+ScriptType: v4.00+
+Unknown Key: value
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize
+Style: Default,Arial,20
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+Dialogue: 0,0:00:01.00,0:00:04.00,Default,,0000,0000,0000,,Hello, world
+Comment: 0,0:00:02.00,0:00:03.00,Default,,0,0,0,,Note to self
+Dialogue: 1,0:00:05.00,0:00:09.50,Sign,Bob,0,0,0,Banner;10,{\\pos(10,20)}Text\\Nsecond
+
+[Fonts]
+fontname: custom.ttf
+"""
+
+def test_srt_round_trip_is_byte_identical(tmp_path):
+    handler = SrtFormat()
+    source = tmp_path / "source.srt"
+    source.write_bytes(SRT_ROUND_TRIP.encode('utf-8'))
+    output = tmp_path / "output.srt"
+
+    handler.save(handler.read(str(source)), str(output))
+    assert output.read_bytes() == source.read_bytes()
+
+def test_srt_cue_fields(tmp_path):
+    handler = SrtFormat()
+    source = tmp_path / "source.srt"
+    source.write_bytes(SRT_ROUND_TRIP.encode('utf-8'))
+
+    cues = handler.read(str(source))
+    assert (cues[0].start, cues[0].end) == (1000, 4000)
+    assert cues[1].start == 5500
+    assert cues[1].text == "<i>Formatted</i>\n-Second line"
+
+def test_srt_changed_timing_keeps_unknown_fields(tmp_path):
+    handler = SrtFormat()
+    source = tmp_path / "source.srt"
+    source.write_bytes(SRT_ROUND_TRIP.encode('utf-8'))
+
+    cues = handler.read(str(source))
+    cues[0].start += 500
+    output = tmp_path / "output.srt"
+    handler.save(cues, str(output))
+    assert "00:00:01,500 --> 00:00:04,000 X1:40 X2:600 Y1:20 Y2:50\r\n" in output.read_bytes().decode()
+
+def test_srt_iter_cues_is_lazy(tmp_path):
+    handler = SrtFormat()
+    source = tmp_path / "source.srt"
+    source.write_bytes(SRT_ROUND_TRIP.encode('utf-8'))
+
+    cues = handler.iter_cues(str(source))
+    assert next(cues).text == "Test subtitle"
+    assert next(cues).start == 5500
+
+def test_srt_bom_and_legacy_encoding(tmp_path):
+    handler = SrtFormat()
+    source = tmp_path / "source.srt"
+    source.write_bytes(b"\xef\xbb\xbf1\n00:00:01,000 --> 00:00:02,000\nCaf\xe9\n")
+
+    cues = handler.read(str(source))
+    assert cues.bom
+    assert cues[0].index == "1"
+    assert cues[0].text == "Café"
+
+@pytest.mark.parametrize("encoding", ["utf-16-le", "utf-16-be", "utf-32-le", "utf-32-be"])
+def test_srt_wide_encodings(tmp_path, encoding):
+    handler = SrtFormat()
+    source = tmp_path / "source.srt"
+    text = "1\r\n00:00:01,000 --> 00:00:02,000\r\nCafé\r\n\r\n2\r\n00:00:03,000 --> 00:00:04,000\r\nBye\r\n"
+    source.write_bytes('\ufeff'.encode(encoding) + text.encode(encoding))
+
+    cues = handler.read(str(source))
+    assert cues.bom
+    assert cues.newline == '\r\n'
+    assert [cue.text for cue in cues] == ["Café", "Bye"]
+
+def test_srt_blank_line_inside_cue(tmp_path):
+    handler = SrtFormat()
+    source = tmp_path / "source.srt"
+    source.write_text("1\n00:00:01,000 --> 00:00:02,000\nHello\n\nworld\n\n\n"
+                      "2\n00:00:03,000 --> 00:00:04,000\nBye\n  \n"
+                      "3\n00:00:05,000 --> 00:00:06,000\nLast")
+
+    cues = handler.read(str(source))
+    assert [cue.text for cue in cues] == ["Hello\nworld", "Bye", "Last"]
+    assert [cue.index for cue in cues] == ["1", "2", "3"]
+
+def test_srt_without_cues_is_an_error(tmp_path):
+    handler = SrtFormat()
+    source = tmp_path / "source.srt"
+    source.write_bytes("not a subtitle\n".encode('utf-16-le'))
+    with pytest.raises(ValueError):
+        handler.read(str(source))
+
+    empty = tmp_path / "empty.srt"
+    empty.write_text("")
+    assert handler.read(str(empty)) == []
+
+def test_ass_round_trip_is_byte_identical(tmp_path):
+    handler = AssFormat()
+    source = tmp_path / "source.ass"
+    source.write_text(ASS_ROUND_TRIP)
+    output = tmp_path / "output.ass"
+
+    handler.save(handler.read(str(source)), str(output))
+    assert output.read_bytes() == source.read_bytes()
+
+def test_ass_event_fields(tmp_path):
+    handler = AssFormat()
+    source = tmp_path / "source.ass"
+    source.write_text(ASS_ROUND_TRIP)
+
+    events = handler.read(str(source)).events
+    assert len(events) == 3
+    assert events[0].text == "Hello, world"
+    assert events[1].is_comment
+    assert events[2].style == "Sign"
+    assert (events[2].start, events[2].end) == (5000, 9500)
+    assert events[2].text == "{\\pos(10,20)}Text\\Nsecond"
+
+def test_ass_set_text_and_timing(tmp_path):
+    handler = AssFormat()
+    source = tmp_path / "source.ass"
+    source.write_text(ASS_ROUND_TRIP)
+
+    subs = handler.read(str(source))
+    event = subs.events[0]
+    handler.set_text(event, "Hej, verden\nAnden linje")
+    event.end = 4250
+    output = tmp_path / "output.ass"
+    handler.save(subs, str(output))
+
+    content = output.read_text()
+    assert "Dialogue: 0,0:00:01.00,0:00:04.25,Default,,0000,0000,0000,,Hej, verden\\NAnden linje\n" in content
+    assert "fontname: custom.ttf" in content
+
+def test_save_is_atomic(tmp_path):
+    from subtitle_formats import SrtCue, SrtDocument, SrtFormat
+    output = tmp_path / "out.da.srt"
+    output.write_text("previous\n")
+
+    class Exploding(SrtDocument):
+        def __iter__(self):
+            yield SrtCue(0, 1000, "Hej", index="1")
+            raise RuntimeError("killed")
+
+    with pytest.raises(RuntimeError):
+        SrtFormat().save(Exploding(), str(output))
+    assert output.read_text() == "previous\n"
+    assert [path.name for path in tmp_path.iterdir()] == ["out.da.srt"]
+
+    SrtFormat().save(SrtDocument([SrtCue(0, 1000, "Hej", index="1")]), str(output))
+    assert "Hej" in output.read_text()
+    assert [path.name for path in tmp_path.iterdir()] == ["out.da.srt"]
+
+def test_ass_markup_is_hidden_from_the_model(tmp_path):
+    handler = AssFormat()
+    source = tmp_path / "source.ass"
+    source.write_text(ASS_ROUND_TRIP)
+
+    subs = handler.read(str(source))
+    sign = subs.events[2]
+    assert handler.get_text(sign) == "Text\nsecond"
+    handler.set_text(sign, "Tekst\nanden")
+    assert sign.text == "{\\pos(10,20)}Tekst\\Nanden"
+    # The same plain text gives back the raw event unchanged
+    handler.set_text(sign, "Text\nsecond")
+    assert sign.text == "{\\pos(10,20)}Text\\Nsecond"
+
+def test_ass_tags_move_to_word_boundaries():
+    from subtitle_formats import join_ass_markup, split_ass_markup
+    lines, tags = split_ass_markup("{\\i1}Hello{\\i0} there my friend\\h!")
+    assert lines == ["Hello there my friend !"]
+    assert join_ass_markup(["Hej derude min ven !"], tags, lines) == "{\\i1}Hej{\\i0} derude min ven !"
+
+def test_ass_is_translatable(tmp_path):
+    handler = AssFormat()
+    source = tmp_path / "source.ass"
+    source.write_text(ASS_ROUND_TRIP + """[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+Dialogue: 0,0:00:01.00,0:00:02.00,Default,,0,0,0,,{\\p2}m 0 0 l 10 10
+Dialogue: 0,0:00:01.00,0:00:02.00,Default,,0,0,0,,{\\kf25}Ka{\\kf40}ra
+Dialogue: 0,0:00:01.00,0:00:02.00,Default,,0,0,0,,{\\pos(1,2)\\pbo0}Plain
+""")
+
+    events = handler.read(str(source)).events
+    assert [handler.is_translatable(event) for event in events] == [True, False, False, False, False, True]
@@ -0,0 +1,57 @@
+import argparse
+import pytest
+from targets import ModelCache, group_targets, model_concurrency, parse_targets
+
+def test_parse_targets():
+    assert parse_targets("da, sv,no,da") == ["da", "sv", "no"]
+    assert parse_targets("SV") == ["sv"]
+    for value in ("", "da,../x", "en"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_targets(value)
+
+def test_group_targets():
+    assert group_targets(["da", "sv", "no"], budget_mb=1000, model_mb=300) == [["da", "sv", "no"]]
+    assert group_targets(["da", "sv", "no"], budget_mb=600, model_mb=300) == [["da", "sv"], ["no"]]
+    # A budget below one model still translates, one target at a time
+    assert group_targets(["da", "sv"], budget_mb=100, model_mb=300) == [["da"], ["sv"]]
+
+def test_model_concurrency():
+    assert model_concurrency(3, cores=16) == 3
+    assert model_concurrency(3, cores=8) == 2
+    assert model_concurrency(3, cores=2) == 1
+
+def test_model_cache_reuses_and_evicts_least_recent(make_translator):
+    created = []
+
+    def factory(target):
+        created.append(make_translator(target))
+        return created[-1]
+
+    cache = ModelCache(factory, budget_mb=700)
+    with cache.use("da") as da:
+        pass
+    with cache.use("sv"):
+        pass
+    with cache.use("da") as again:
+        assert again is da
+    with cache.use("no"):
+        pass
+
+    assert [t.target for t in created] == ["da", "sv", "no"]
+    assert "sv" not in cache and created[1].closed
+    assert "da" in cache and "no" in cache
+    assert cache.evictions == 1
+
+    cache.close()
+    assert all(t.closed for t in created)
+
+def test_model_cache_keeps_models_in_use(make_translator):
+    cache = ModelCache(lambda target: make_translator(target), budget_mb=300)
+    with cache.use("da"):
+        with cache.use("sv"):
+            # Over budget, but both are translating
+            assert "da" in cache and "sv" in cache
+    with cache.use("no"):
+        pass
+    assert "da" not in cache and "sv" not in cache
+    cache.close()
@@ -0,0 +1,48 @@
+import pytest
+from translation_memory import TranslationMemory, normalize_line
+
+MODEL = "Helsinki-NLP/opus-mt-en-da"
+
+@pytest.fixture
+def memory(tmp_path):
+    memory = TranslationMemory(tmp_path / "memory.db", max_entries=3)
+    yield memory
+    memory.close()
+
+def test_normalize_line():
+    assert normalize_line("  What?  ") == "What?"
+    assert normalize_line("Let's   go.") == "Let's go."
+
+def test_lookup_and_store(memory):
+    assert memory.lookup(MODEL, ["What?"]) == {}
+    memory.store(MODEL, {"What?": "Hvad?"})
+    assert memory.lookup(MODEL, [" What? "]) == {"What?": "Hvad?"}
+    assert memory.hits == 1
+    assert memory.misses == 1
+    assert memory.hit_rate == 0.5
+
+def test_keyed_by_model(memory):
+    memory.store(MODEL, {"What?": "Hvad?"})
+    assert memory.lookup("Helsinki-NLP/opus-mt-en-sv", ["What?"]) == {}
+
+def test_persists_across_instances(tmp_path):
+    path = tmp_path / "memory.db"
+    first = TranslationMemory(path)
+    first.store(MODEL, {"Let's go.": "Lad os gå."})
+    first.close()
+
+    second = TranslationMemory(path)
+    assert second.lookup(MODEL, ["Let's go."]) == {"Let's go.": "Lad os gå."}
+    second.close()
+
+def test_lru_eviction(memory):
+    memory.store(MODEL, {"a": "A"})
+    memory.store(MODEL, {"b": "B"})
+    memory.store(MODEL, {"c": "C"})
+    # Touch "a" so "b" becomes the least recently used entry
+    memory.lookup(MODEL, ["a"])
+    memory.store(MODEL, {"d": "D"})
+
+    assert len(memory) == 3
+    assert memory.lookup(MODEL, ["b"]) == {}
+    assert set(memory.lookup(MODEL, ["a", "c", "d"])) == {"a", "c", "d"}
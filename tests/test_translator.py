@@ -1,3 +1,4 @@
+import math
 import pytest
 from pathlib import Path
 from translator import SubtitleTranslator
@@ -84,4 +85,247 @@ def test_translate_with_gpu():
     translator = SubtitleTranslator(device="cuda")
     result = translator.translate_text("Hello world")
     assert isinstance(result, str)
-    assert len(result) > 0 
\ No newline at end of file
+    assert len(result) > 0 
+
+@pytest.fixture
+def fake_translator(fake_pipeline):
+    return SubtitleTranslator()
+
+def test_translate_lines_batches_and_keeps_order(fake_translator):
+    lines = ["one", "two words", "", "three more words", "four"]
+    result = fake_translator.translate_lines(lines)
+    assert result == ["ONE", "TWO WORDS", "", "THREE MORE WORDS", "FOUR"]
+    assert fake_translator.backend.pipeline.batch_sizes == [4]
+
+def test_translate_lines_respects_token_budget(fake_translator):
+    fake_translator.max_batch_tokens = 4
+    fake_translator.translate_lines(["a b c", "a", "b", "c"])
+    # Longest line has 4 tokens, so it runs alone; the rest fit together
+    assert fake_translator.backend.pipeline.batch_sizes == [1, 2, 1]
+
+def test_translate_lines_deduplicates(fake_translator):
+    result = fake_translator.translate_lines(["Yeah.", "No!", " Yeah. ", "", "Yeah."])
+    assert result == ["YEAH.", "NO!", "YEAH.", "", "YEAH."]
+    assert fake_translator.backend.pipeline.batch_sizes == [2]
+    assert fake_translator.last_line_counts == (4, 2)
+
+def test_translate_document_dedups_across_dialogue_prefixes(fake_translator, sample_srt, tmp_path, capsys):
+    sample_srt.write_text("""1
+00:00:01,000 --> 00:00:02,000
+-Come on.
+-No!
+
+2
+00:00:03,000 --> 00:00:04,000
+Come on.
+""")
+    output = tmp_path / "test.da.srt"
+    fake_translator.translate_subtitle_file(str(sample_srt), str(output))
+    assert fake_translator.backend.pipeline.batch_sizes == [2]
+    assert "-COME ON.\n-NO!" in output.read_text()
+    assert "2 distinct of 3 lines (33% deduplicated)" in capsys.readouterr().out
+
+def test_generation_budget_follows_input_length(fake_pipeline):
+    translator = SubtitleTranslator(preset='fast', max_batch_size=1)
+    translator.translate_lines(["Yes", "This line is a fair bit longer than the first"])
+    # fast: greedy, 1.5 * input tokens + 8
+    assert translator.backend.pipeline.generation == [(math.ceil(1.5 * 11) + 8, 1), (math.ceil(1.5 * 2) + 8, 1)]
+
+    quality = SubtitleTranslator(preset='quality')
+    quality.translate_lines(["Yes"])
+    assert quality.backend.pipeline.generation == [(3 * 2 + 32, 4)]
+
+def test_default_preset_keeps_model_generation_config(fake_pipeline):
+    translator = SubtitleTranslator()
+    translator.translate_lines(["Yes", "No"])
+    assert translator.preset_name == 'model'
+    assert translator.backend.pipeline.generation_kwargs == [{}]
+
+def test_cached_translations_are_per_preset_and_backend(fake_pipeline, sample_srt, tmp_path):
+    from translation_memory import TranslationMemory
+    memory = TranslationMemory(tmp_path / "memory.db")
+    output = tmp_path / "test.da.srt"
+
+    fast = SubtitleTranslator(memory=memory, preset='fast')
+    assert fast.cache_key == "Helsinki-NLP/opus-mt-en-da|fast|hf-fp32"
+    fast.translate_subtitle_file(str(sample_srt), str(output))
+    assert fast.backend.pipeline.batch_sizes
+
+    # Neither the memory nor the manifest of the greedy run stands in for beam search
+    quality = SubtitleTranslator(memory=memory, preset='quality')
+    quality.translate_subtitle_file(str(sample_srt), str(output))
+    assert quality.backend.pipeline.batch_sizes
+
+    again = SubtitleTranslator(memory=memory, preset='quality')
+    again.translate_subtitle_file(str(sample_srt), str(output))
+    assert again.backend.pipeline.batch_sizes == []
+    memory.close()
+
+def test_model_cache_splits_threads_between_models(monkeypatch):
+    import argparse
+    from cpu_profile import add_cpu_profile_arguments, cpu_profile_from_args
+    from translator import create_model_cache
+    profiles = []
+    monkeypatch.setattr('translator.create_translator', lambda *args: profiles.append(args[2]))
+
+    parser = argparse.ArgumentParser()
+    add_cpu_profile_arguments(parser)
+    for argv, expected in ((['--cpu-profile', '--threads', '8'], 4), (['--cpu-profile'], None)):
+        profile = cpu_profile_from_args(parser.parse_args(argv))
+        threads = profile.intra_threads
+        create_model_cache(use_memory=False, cpu_profile=profile, concurrency=2).factory('da')
+        assert profiles[-1].intra_threads == (expected or max(1, threads // 2))
+        assert profile.intra_threads == threads
+
+def test_unknown_preset(fake_pipeline):
+    with pytest.raises(ValueError):
+        SubtitleTranslator(preset='turbo')
+
+def test_translate_lines_shrinks_batch_on_oom(fake_translator):
+    fake_translator.backend.pipeline.fail_above = 2
+    result = fake_translator.translate_lines(["a", "b", "c", "d", "e"])
+    assert result == ["A", "B", "C", "D", "E"]
+    assert max(fake_translator.backend.pipeline.batch_sizes) <= 2
+
+@pytest.mark.parametrize("error", [
+    RuntimeError("[enforce fail at alloc_cpu.cpp:83] . DefaultCPUAllocator: can't allocate memory: "
+                 "you tried to allocate 268435456 bytes. Error code 12 (Cannot allocate memory)"),
+    RuntimeError("DefaultCPUAllocator: not enough memory: you tried to allocate 268435456 bytes."),
+    MemoryError(),
+])
+def test_translate_lines_shrinks_batch_on_cpu_oom(fake_translator, error):
+    fake_translator.backend.pipeline.fail_above = 2
+    fake_translator.backend.pipeline.error = error
+    result = fake_translator.translate_lines(["a", "b", "c", "d", "e"])
+    assert result == ["A", "B", "C", "D", "E"]
+    assert max(fake_translator.backend.pipeline.batch_sizes) <= 2
+
+def test_translate_subtitle_file_batched(fake_translator, sample_srt, tmp_path):
+    sample_srt.write_text("""1
+00:00:01,000 --> 00:00:04,000
+-Hello world!
+-Hi.
+
+2
+00:00:05,000 --> 00:00:09,000
+How are you?
+""")
+    output = tmp_path / "test.da.srt"
+    fake_translator.translate_subtitle_file(str(sample_srt), str(output))
+    content = output.read_text()
+    assert "-HELLO WORLD!\n-HI." in content
+    assert "HOW ARE YOU?" in content
+    assert "00:00:05,000 --> 00:00:09,000" in content
+    assert fake_translator.backend.pipeline.batch_sizes == [3]
+    assert fake_translator.last_stats == {'cues': 2, 'reused_cues': 0, 'skipped_cues': 0, 'lines': 3,
+                                          'unique_lines': 3, 'tokens': 9, 'preset': 'model'}
+
+def test_translate_ass_file_keeps_markup_and_skips_signs(fake_translator, tmp_path):
+    source = tmp_path / "test.en.ass"
+    source.write_text("""[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+Dialogue: 0,0:00:01.00,0:00:04.00,Default,,0,0,0,,{\\an8}{\\i1}Hello{\\i0} there\\Nfriend
+Comment: 0,0:00:01.00,0:00:04.00,Default,,0,0,0,,Timing note
+Dialogue: 0,0:00:01.00,0:00:04.00,Default,,0,0,0,,{\\p1}m 0 0 l 100 0 100 100 0 100{\\p0}
+Dialogue: 0,0:00:01.00,0:00:04.00,Sign - Title,,0,0,0,,{\\pos(10,20)}Chapter one
+Dialogue: 0,0:00:01.00,0:00:04.00,OP,,0,0,0,,{\\k20}La {\\k30}la
+""")
+    output = tmp_path / "test.da.ass"
+    fake_translator.translate_subtitle_file(str(source), str(output))
+    content = output.read_text()
+
+    assert fake_translator.backend.pipeline.batch_sizes == [2]
+    assert "{\\an8}{\\i1}HELLO{\\i0} THERE\\NFRIEND\n" in content
+    assert "Timing note" in content
+    assert "{\\p1}m 0 0 l 100 0 100 100 0 100{\\p0}" in content
+    assert "{\\pos(10,20)}Chapter one" in content
+    assert "{\\k20}La {\\k30}la" in content
+    assert fake_translator.last_stats['skipped_cues'] == 4
+
+def test_translate_subtitle_file_merges_sentences(fake_pipeline, sample_srt, tmp_path):
+    translator = SubtitleTranslator(merge_sentences=True)
+    sample_srt.write_text("""1
+00:00:01,000 --> 00:00:03,000
+I was going to tell
+you something
+
+2
+00:00:03,200 --> 00:00:05,000
+about the house.
+-Really?
+-Yes.
+""")
+    output = tmp_path / "test.da.srt"
+    translator.translate_subtitle_file(str(sample_srt), str(output))
+    content = output.read_text()
+    # One sentence across three lines and two cues, plus two dialogue lines
+    assert translator.backend.pipeline.batch_sizes == [3]
+    assert "I WAS GOING TO TELL\nYOU SOMETHING\n" in content
+    assert "ABOUT THE HOUSE.\n-REALLY?\n-YES." in content
+
+def test_merged_sentence_too_short_to_split_is_translated_per_line(fake_pipeline):
+    translator = SubtitleTranslator(merge_sentences=True)
+    translator.backend.pipeline.replies["Are you sure you did?"] = "JA."
+    assert translator.translate_text("Are you\nsure you did?") == "ARE YOU\nSURE YOU DID?"
+    assert translator.backend.pipeline.batch_sizes == [1, 2]
+
+def test_translate_lines_uses_translation_memory(fake_pipeline, tmp_path):
+    from translation_memory import TranslationMemory
+    memory = TranslationMemory(tmp_path / "memory.db")
+    translator = SubtitleTranslator(memory=memory)
+
+    assert translator.translate_lines(["What?", "Let's go."]) == ["WHAT?", "LET'S GO."]
+    assert translator.backend.pipeline.batch_sizes == [2]
+
+    assert translator.translate_lines(["What?", "New line"]) == ["WHAT?", "NEW LINE"]
+    assert translator.backend.pipeline.batch_sizes == [2, 1]
+    assert memory.hits == 1
+    memory.close()
+
+def test_translate_subtitle_file_reuses_manifest(fake_translator, sample_srt, tmp_path):
+    output = tmp_path / "test.da.srt"
+    fake_translator.translate_subtitle_file(str(sample_srt), str(output))
+    assert fake_translator.backend.pipeline.batch_sizes == [2]
+
+    # Timing-only edit: nothing goes to the model
+    sample_srt.write_text(sample_srt.read_text().replace("00:00:05,000", "00:00:05,500"))
+    fake_translator.translate_subtitle_file(str(sample_srt), str(output))
+    assert fake_translator.backend.pipeline.batch_sizes == [2]
+    assert "00:00:05,500 --> 00:00:09,000\nHOW ARE YOU?" in output.read_text()
+
+    # Text edit: only the changed cue is translated
+    sample_srt.write_text(sample_srt.read_text().replace("How are you?", "How are you doing?"))
+    fake_translator.translate_subtitle_file(str(sample_srt), str(output))
+    assert fake_translator.backend.pipeline.batch_sizes == [2, 1]
+    assert "HOW ARE YOU DOING?" in output.read_text()
+    assert "HELLO WORLD!" in output.read_text()
+
+def test_translate_subtitle_file_resumes_from_checkpoint(fake_pipeline, sample_srt, tmp_path):
+    from manifest import get_journal_path
+    translator = SubtitleTranslator(max_batch_size=1)
+    output = tmp_path / "test.da.srt"
+    pipe = translator.backend.pipeline
+    calls = []
+
+    def crash_on_second_batch(lines, **kwargs):
+        calls.append(lines)
+        if len(calls) == 2:
+            raise RuntimeError("node lost")
+        return pipe(lines, **kwargs)
+
+    translator.backend.pipeline = crash_on_second_batch
+    with pytest.raises(RuntimeError):
+        translator.translate_subtitle_file(str(sample_srt), str(output))
+    assert not output.exists()
+    assert get_journal_path(output).exists()
+
+    translator.backend.pipeline = pipe
+    translator.translate_subtitle_file(str(sample_srt), str(output))
+    # Only the line lost in the crash goes to the model again
+    assert pipe.batch_sizes == [1, 1]
+    assert "HELLO WORLD!" in output.read_text() and "HOW ARE YOU?" in output.read_text()
+    assert not get_journal_path(output).exists()
+
+def test_device_argument_is_honoured(fake_pipeline):
+    assert SubtitleTranslator(device="cpu").backend.pipeline.device == "cpu"
+    assert SubtitleTranslator(device="cuda:1").backend.pipeline.device == "cuda:1"
@@ -0,0 +1,92 @@
+import sys
+import pytest
+from watcher import FileDebouncer, PollingWatcher, InotifyWatcher, is_source_file
+
+def test_is_source_file():
+    assert is_source_file("/lib/show.en.srt")
+    assert is_source_file("/lib/show.en.ass")
+    assert not is_source_file("/lib/show.da.srt")
+    assert not is_source_file("/lib/show.mkv")
+
+def test_debouncer_waits_for_quiet_period(tmp_path, clock):
+    debouncer = FileDebouncer(10, clock=clock)
+    path = tmp_path / "show.en.srt"
+    path.write_text("partial")
+
+    debouncer.touch(str(path))
+    clock.now = 5
+    assert debouncer.ready() == []
+    clock.now = 11
+    assert debouncer.ready() == [str(path)]
+    assert debouncer.pending == {}
+
+def test_debouncer_waits_for_size_to_settle(tmp_path, clock):
+    debouncer = FileDebouncer(10, clock=clock)
+    path = tmp_path / "show.en.srt"
+    path.write_text("partial")
+    debouncer.touch(str(path))
+
+    path.write_text("partial and still growing")
+    clock.now = 11
+    assert debouncer.ready() == []
+    clock.now = 22
+    assert debouncer.ready() == [str(path)]
+
+def test_debouncer_drops_deleted_files(tmp_path, clock):
+    debouncer = FileDebouncer(1, clock=clock)
+    path = tmp_path / "show.en.srt"
+    path.write_text("x")
+    debouncer.touch(str(path))
+    path.unlink()
+    clock.now = 2
+    assert debouncer.ready() == []
+    assert debouncer.pending == {}
+
+def test_polling_watcher_reports_new_and_modified(tmp_path):
+    existing = tmp_path / "old.en.srt"
+    existing.write_text("old")
+    watcher = PollingWatcher(tmp_path, interval=0)
+
+    new = tmp_path / "new.en.srt"
+    new.write_text("new")
+    existing.write_text("old but edited")
+    assert watcher.poll(timeout=0) == sorted([str(new), str(existing)])
+    assert watcher.poll(timeout=0) == []
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Requires inotify")
+def test_inotify_watcher_reports_written_files(tmp_path):
+    watcher = InotifyWatcher(tmp_path)
+    try:
+        (tmp_path / "show.en.srt").write_text("content")
+        season = tmp_path / "season"
+        season.mkdir()
+        changed = []
+        for _ in range(5):
+            changed.extend(watcher.poll(timeout=0.2))
+        assert str(tmp_path / "show.en.srt") in changed
+
+        (season / "e01.en.srt").write_text("content")
+        changed = []
+        for _ in range(5):
+            changed.extend(watcher.poll(timeout=0.2))
+        assert str(season / "e01.en.srt") in changed
+    finally:
+        watcher.close()
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Requires inotify")
+def test_inotify_watcher_reports_only_sources_in_moved_directory(tmp_path):
+    library = tmp_path / "library"
+    library.mkdir()
+    season = tmp_path / "season"
+    season.mkdir()
+    (season / "e01.en.srt").write_text("content")
+    (season / "e01.mkv").write_text("video")
+    watcher = InotifyWatcher(library)
+    try:
+        season.rename(library / "season")
+        changed = []
+        for _ in range(5):
+            changed.extend(watcher.poll(timeout=0.2))
+        assert changed == [str(library / "season" / "e01.en.srt")]
+    finally:
+        watcher.close()
@@ -0,0 +1,108 @@
+import json
+from work_claims import WorkClaims, get_claim_dir
+
+def test_claim_is_exclusive(tmp_path):
+    source = tmp_path / "a.en.srt"
+    first = WorkClaims(tmp_path, node="node-1")
+    second = WorkClaims(tmp_path, node="node-2")
+
+    assert first.claim(source)
+    assert not second.claim(source)
+    assert second.claim(tmp_path / "b.en.srt")
+
+    first.release(source)
+    assert second.claim(source)
+    second.close()
+    assert list(get_claim_dir(tmp_path).glob('*.claim')) == []
+
+def test_expired_claim_is_taken_over(tmp_path, clock):
+    source = tmp_path / "a.en.srt"
+    dead = WorkClaims(tmp_path, lease_seconds=60, node="dead", clock=clock)
+    alive = WorkClaims(tmp_path, lease_seconds=60, node="alive", clock=clock)
+
+    assert dead.claim(source)
+    clock.now += 30
+    assert not alive.claim(source)
+    clock.now += 31
+    assert alive.claim(source)
+
+    # The old owner no longer holds it, notices on its next renewal and does not
+    # remove the new claim
+    assert not dead.holds(source)
+    assert alive.holds(source)
+    assert dead.renew() == [str(source)]
+    assert not dead.release(source)
+    assert [claim['node'] for claim in alive.status()] == ["alive"]
+
+def test_renew_extends_lease(tmp_path, clock):
+    source = tmp_path / "a.en.srt"
+    claims = WorkClaims(tmp_path, lease_seconds=60, node="node-1", clock=clock)
+    other = WorkClaims(tmp_path, lease_seconds=60, node="node-2", clock=clock)
+
+    assert claims.claim(source)
+    clock.now += 50
+    assert claims.renew() == []
+    clock.now += 50
+    assert not other.claim(source)
+
+    status = claims.status()
+    assert len(status) == 1
+    assert status[0]['path'] == "a.en.srt"
+    assert status[0]['age'] == 100
+    assert not status[0]['expired']
+
+def test_renew_waits_for_a_busy_lock(tmp_path, clock):
+    source = tmp_path / "a.en.srt"
+    claims = WorkClaims(tmp_path, lease_seconds=60, node="node-1", clock=clock)
+    assert claims.claim(source)
+    before = claims._claim_path(source).read_text()
+
+    # Another node is in the middle of taking the claim over
+    lock = claims._claim_path(source).with_name(claims._claim_path(source).name + '.lock')
+    lock.write_text("node-2")
+    clock.now += 30
+    assert claims.renew() == []
+    assert claims._claim_path(source).read_text() == before
+
+    lock.unlink()
+    assert claims.renew() == []
+    assert claims._claim_path(source).read_text() != before
+
+def test_status_does_not_create_claim_dir(tmp_path):
+    assert WorkClaims(tmp_path).status() == []
+    assert not get_claim_dir(tmp_path).exists()
+
+def test_unreadable_claim_expires_by_mtime(tmp_path):
+    source = tmp_path / "a.en.srt"
+    claims = WorkClaims(tmp_path, lease_seconds=60)
+    get_claim_dir(tmp_path).mkdir()
+    claims._claim_path(source).write_text("")
+    assert not claims.claim(source)
+
+    later = WorkClaims(tmp_path, lease_seconds=60, clock=lambda: claims.clock() + 120)
+    assert later.claim(source)
+    assert json.loads(later._claim_path(source).read_text())['node'] == later.node
+
+def test_process_directory_skips_claimed_files(tmp_path, monkeypatch, fake_pipeline):
+    import batch_translator
+
+    monkeypatch.setattr(batch_translator, 'STATE_FILE', tmp_path / 'state.db')
+    monkeypatch.setattr(batch_translator, 'LIBRARY_INDEX_FILE', tmp_path / 'index.json')
+
+    library = tmp_path / "library"
+    library.mkdir()
+    for name in ("a", "b", "c"):
+        (library / f"{name}.en.srt").write_text("1\n00:00:01,000 --> 00:00:02,000\nHello\n")
+    other = WorkClaims(library, node="other")
+    assert other.claim(library / "b.en.srt")
+
+    batch_translator.process_directory(str(library), use_memory=False, server=None, distributed=True)
+    assert (library / "a.da.srt").exists()
+    assert not (library / "b.da.srt").exists()
+    assert (library / "c.da.srt").exists()
+    assert [claim['node'] for claim in other.status()] == ["other"]
+
+    # Once the other node lets go, the next run picks the file up
+    other.release(library / "b.en.srt")
+    batch_translator.process_directory(str(library), use_memory=False, server=None, distributed=True)
+    assert (library / "b.da.srt").exists()
@@ -0,0 +1,65 @@
+import multiprocessing
+import os
+import sys
+import types
+import pytest
+from backends import TranslationBackend
+from cpu_profile import CpuProfile, apply_thread_settings
+from worker_pool import _init_worker, process_files_parallel, split_cores
+
+def test_split_cores_even():
+    assert split_cores(4, list(range(8))) == [[0, 1], [2, 3], [4, 5], [6, 7]]
+
+def test_split_cores_leftover():
+    slices = split_cores(3, list(range(8)))
+    assert slices == [[0, 1, 6], [2, 3, 7], [4, 5]]
+    assert sorted(core for s in slices for core in s) == list(range(8))
+
+def test_split_cores_more_workers_than_cores():
+    assert split_cores(4, [0, 1]) == [[0], [1], [0], [1]]
+
+class FixedInteropTorch(types.SimpleNamespace):
+    # torch only lets the inter-op pool be sized once per process
+    def __init__(self):
+        super().__init__(threads=None, interop=None)
+
+    def set_num_threads(self, n):
+        self.threads = n
+
+    def set_num_interop_threads(self, n):
+        if self.interop is not None:
+            raise RuntimeError("Error: cannot set number of interop threads after parallel work has started")
+        self.interop = n
+
+def test_worker_sets_inter_op_threads_once(monkeypatch, capsys):
+    torch = FixedInteropTorch()
+    monkeypatch.setitem(sys.modules, 'torch', torch)
+    monkeypatch.delattr(os, 'sched_setaffinity', raising=False)
+    profiles = []
+    monkeypatch.setattr('translator.create_translator', lambda *args: profiles.append(args[2]))
+
+    _init_worker([[0, 1]], multiprocessing.Value('i', 0), False, 'hf', CpuProfile(intra_threads=8, inter_threads=4))
+    # What HFPipelineBackend does with the profile once the worker loads its model
+    apply_thread_settings(profiles[0])
+
+    assert (torch.threads, torch.interop) == (2, 1)
+    assert "already fixed" not in capsys.readouterr().out
+
+class StubBackend(TranslationBackend):
+    name = 'stub'
+
+    def count_tokens(self, lines):
+        return [len(line.split()) for line in lines]
+
+    def translate_batch(self, lines, max_length=None, num_beams=1):
+        return [line.upper() for line in lines]
+
+def test_process_files_parallel_reports_results_and_errors(sample_srt, tmp_path):
+    missing = tmp_path / "missing.en.srt"
+    results = {path: error for path, error, _ in
+               process_files_parallel([str(sample_srt), str(missing)], 2, use_memory=False,
+                                      backend=StubBackend(), server=None)}
+
+    assert results[str(sample_srt)] is None
+    assert "HELLO WORLD!" in (tmp_path / "test.da.srt").read_text()
+    assert results[str(missing)] is not None
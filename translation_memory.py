@@ -0,0 +1,94 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+from config import TRANSLATION_MEMORY_FILE, TRANSLATION_MEMORY_MAX_ENTRIES
+
+# SQLite limits the number of host parameters per statement
+_QUERY_CHUNK = 500
+
+def normalize_line(line: str) -> str:
+    return ' '.join(line.split())
+
+class TranslationMemory:
+    def __init__(self, path=TRANSLATION_MEMORY_FILE, max_entries: int = TRANSLATION_MEMORY_MAX_ENTRIES):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS translations (
+                model TEXT NOT NULL,
+                source TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, source)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)")
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def lookup(self, model: str, lines: List[str]) -> Dict[str, str]:
+        keys = list(dict.fromkeys(normalize_line(line) for line in lines))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _QUERY_CHUNK):
+                chunk = keys[start:start + _QUERY_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT source, translation FROM translations WHERE model = ? AND source IN ({placeholders})",
+                    [model, *chunk]
+                )
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE translations SET last_used = ? WHERE model = ? AND source = ?",
+                    [(now, model, source) for source in found]
+                )
+                self._conn.commit()
+
+        for line in lines:
+            if normalize_line(line) in found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def store(self, model: str, translations: Dict[str, str]) -> None:
+        if not translations:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO translations (model, source, translation, last_used) VALUES (?, ?, ?, ?)",
+                [(model, normalize_line(source), translation, now) for source, translation in translations.items()]
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        count = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM translations WHERE rowid IN "
+                "(SELECT rowid FROM translations ORDER BY last_used ASC, rowid ASC LIMIT ?)",
+                (excess,)
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,84 +1,396 @@
-from transformers import pipeline
+import copy
 from pathlib import Path
-import torch
+import time
 import argparse
+from typing import Dict, List, Optional, Tuple
 from subtitle_formats import get_subtitle_handler
-from config import get_model_name
+from translation_memory import TranslationMemory, normalize_line
+from manifest import TranslationJournal, TranslationManifest, cue_key, cue_translations
+from backends import BACKENDS, TranslationBackend, create_backend, generation_budget, get_decoding_preset
+from cpu_profile import CpuProfile, add_cpu_profile_arguments, cpu_profile_from_args, run_self_check
+from server import add_server_arguments, connect_server, server_from_args
+from sentences import group_sentences, split_translation
+from metrics import ProgressReporter, add_metrics_arguments, configure_from_args, metrics, record_file
+from targets import ModelCache, add_target_arguments, model_concurrency
+from worker_pool import available_cores
+from config import (get_model_name, get_target_suffix, MAX_BATCH_TOKENS, MAX_BATCH_SIZE, USE_TRANSLATION_MEMORY,
+                    BACKEND, MERGE_SENTENCES, SERVER_ADDRESS, DECODING_PRESET, DECODING_PRESETS, SOURCE_SUFFIX,
+                    TARGET_LANG, MODEL_CACHE_MB)
+
+def split_dialogue_prefix(line: str) -> Tuple[str, str]:
+    line = line.strip()
+    if line.startswith('-'):
+        return '-', line[1:].strip()
+    return '', line
+
+# CUDA says "out of memory"; PyTorch's CPU allocator "can't allocate memory" or "not enough memory"
+_OUT_OF_MEMORY_MESSAGES = ('out of memory', "can't allocate memory", 'not enough memory')
+
+def is_out_of_memory(error: Exception) -> bool:
+    if isinstance(error, MemoryError):
+        return True
+    message = str(error).lower()
+    return any(text in message for text in _OUT_OF_MEMORY_MESSAGES)
+
+def document_cues(subs) -> List:
+    return subs.events if hasattr(subs, 'events') else subs
+
+def apply_translations(handler, subs, texts: List[Optional[str]]) -> None:
+    # texts are by cue position, as returned by translate_document; None keeps the cue
+    for sub, text in zip(document_cues(subs), texts):
+        if text is not None:
+            handler.set_text(sub, text)
 
 class SubtitleTranslator:
-    def __init__(self, device=None):
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        if device is not None:
-            device = device
-        print(f"Using device: {device}")
+    def __init__(self, device=None, max_batch_tokens: int = MAX_BATCH_TOKENS,
+                 max_batch_size: int = MAX_BATCH_SIZE, memory: Optional[TranslationMemory] = None,
+                 backend=BACKEND, cpu_profile: Optional[CpuProfile] = None,
+                 merge_sentences: bool = MERGE_SENTENCES, preset: str = DECODING_PRESET,
+                 target: Optional[str] = None):
+        self.target = target or TARGET_LANG
+        self.model_name = get_model_name(target)
+        if isinstance(backend, TranslationBackend):
+            self.backend = backend
+        else:
+            if device is None:
+                import torch
+                device = "cpu" if cpu_profile is not None or not torch.cuda.is_available() else "cuda"
+            print(f"Using device: {device} ({backend} backend)")
+            start = time.perf_counter()
+            self.backend = create_backend(backend, self.model_name, device, cpu_profile)
+            load_seconds = time.perf_counter() - start
+            metrics.set('model_load_seconds', load_seconds, backend=backend)
+            metrics.event('model_loaded', backend=backend, device=str(device), model=self.model_name,
+                          seconds=round(load_seconds, 3))
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.memory = memory
+        self.merge_sentences = merge_sentences
+        self.preset_name = preset
+        self.preset = get_decoding_preset(preset)
+        # Translation memory, manifests and checkpoints are keyed on everything that
+        # changes the output, so e.g. greedy backlog translations never stand in for beam search
+        self.cache_key = f"{self.model_name}|{preset}|{self.backend.variant}"
+        self.tokens_translated = 0
+        self.last_line_counts = (0, 0)  # (non-empty, distinct) lines of the last translate_lines call
+        # Counts for the most recent translate_document call
+        self.last_stats: Dict[str, int] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        self.backend.close()
+        if self.memory is not None:
+            self.memory.close()
+            self.memory = None
+
+    def _batch_size_for(self, longest: int) -> int:
+        return max(1, min(self.max_batch_size, self.max_batch_tokens // max(longest, 1)))
+
+    def translate_lines(self, lines: List[str], journal: Optional[TranslationJournal] = None) -> List[str]:
+        lines = [normalize_line(line) for line in lines]
+        # Translate each distinct line once and fan the result out to every occurrence
+        unique = list(dict.fromkeys(line for line in lines if line))
+        self.last_line_counts = (sum(1 for line in lines if line), len(unique))
+        metrics.incr('deduplicated_lines', self.last_line_counts[0] - len(unique))
+        translated = dict(zip(unique, self._translate_unique(unique, journal)))
+        return [translated.get(line, '') for line in lines]
+
+    def _translate_unique(self, lines: List[str], journal: Optional[TranslationJournal] = None) -> List[str]:
+        results = [''] * len(lines)
+        pending = list(range(len(lines)))
+        if journal is not None and journal.entries:
+            resumed = [i for i in pending if lines[i] in journal.entries]
+            for i in resumed:
+                results[i] = journal.entries[lines[i]]
+            if resumed:
+                print(f"Resuming {len(resumed)} lines from checkpoint {journal.path.name}")
+            pending = [i for i in pending if lines[i] not in journal.entries]
+        if not pending:
+            return results
+
+        if self.memory is not None:
+            cached = self.memory.lookup(self.cache_key, [lines[i] for i in pending])
+            metrics.incr('memory_hits', len(cached))
+            metrics.incr('memory_misses', len(pending) - len(cached))
+            for i in pending:
+                if lines[i] in cached:
+                    results[i] = cached[lines[i]]
+            pending = [i for i in pending if lines[i] not in cached]
+            if not pending:
+                return results
+
+        # Longest first, so the head of each batch bounds its padded size
+        lengths = self.backend.count_tokens([lines[i] for i in pending])
+        order = sorted(zip(pending, lengths), key=lambda item: item[1], reverse=True)
+        progress = ProgressReporter('model', len(order))
+
+        start = 0
+        while start < len(order):
+            longest = order[start][1]
+            batch = order[start:start + self._batch_size_for(longest)]
+            try:
+                outputs = self.backend.translate_batch([lines[i] for i, _ in batch],
+                                                       max_length=generation_budget(self.preset, longest),
+                                                       num_beams=self.preset['num_beams'])
+            except (RuntimeError, MemoryError) as e:
+                if not is_out_of_memory(e) or len(batch) == 1:
+                    raise
+                # Halve the budget for this and all following batches
+                self.max_batch_tokens = max(1, (len(batch) // 2) * longest)
+                print(f"Out of memory with batch size {len(batch)}, retrying with {self._batch_size_for(longest)}")
+                import torch
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+                continue
+
+            for (i, _), output in zip(batch, outputs):
+                results[i] = output
+            if self.memory is not None:
+                self.memory.store(self.cache_key, {lines[i]: results[i] for i, _ in batch})
+            if journal is not None:
+                journal.record({lines[i]: results[i] for i, _ in batch})
+            tokens = sum(length for _, length in batch)
+            self.tokens_translated += tokens
+            metrics.incr('batches')
+            metrics.incr('batch_lines', len(batch))
+            metrics.incr('model_tokens', tokens, preset=self.preset_name)
+            start += len(batch)
+            progress.update(start, 'lines')
+
+        return results
+
+    def _translate_segments(self, segments: List[Tuple[int, str, str]], items=None,
+                            journal: Optional[TranslationJournal] = None) -> List[str]:
+        if not self.merge_sentences:
+            return self.translate_lines([body for _, _, body in segments], journal)
         
-        self.translator = pipeline(
-            "translation",
-            model=get_model_name(),
-            device=device
-        )
+        # Translate whole sentences, then cut each one back into its original lines
+        groups = group_sentences(segments, items)
+        translated_groups = self.translate_lines([' '.join(segments[i][2] for i in group) for group in groups],
+                                                 journal)
+        translated = [''] * len(segments)
+        unsplit = []
+        for group, text in zip(groups, translated_groups):
+            pieces = split_translation(text, [len(segments[i][2]) for i in group])
+            if pieces is None:
+                unsplit.extend(group)
+                continue
+            for i, piece in zip(group, pieces):
+                translated[i] = piece
+        # Too short to share out between its lines, so translate those lines one by one
+        if unsplit:
+            lines = self.translate_lines([segments[i][2] for i in unsplit], journal)
+            for i, line in zip(unsplit, lines):
+                translated[i] = line
+        return translated
 
     def translate_text(self, text: str) -> str:
         if not text.strip():
             return ""
         
-        lines = text.split('\n')
-        translated_lines = []
+        segments = [(0, *split_dialogue_prefix(line)) for line in text.split('\n') if line.strip()]
+        translated = self._translate_segments(segments)
+        
+        return '\n'.join(f"{prefix}{line}" for (_, prefix, _), line in zip(segments, translated))
+
+    def translate_document(self, handler, subs, label: str, previous: Optional[Dict[str, str]] = None,
+                           journal: Optional[TranslationJournal] = None, apply: bool = True) -> List[Optional[str]]:
+        # Returns the translation of every cue in document order (None for cues left
+        # untranslated). With apply=False the document is only read, so several targets
+        # can share it.
+        items = document_cues(subs)
+        previous = previous or {}
         
-        for line in lines:
-            line = line.strip()
-            if not line:
+        # Gather every line of every cue, remembering which cue it belongs to.
+        # Cues whose text already has a translation in the manifest are reused as is.
+        keys = [cue_key(handler.get_text(sub)) for sub in items]
+        # Comments, drawings and signs in ASS files never reach the model
+        translatable = [handler.is_translatable(sub) for sub in items]
+        skipped = translatable.count(False)
+        segments = []
+        reused = 0
+        for cue_index, sub in enumerate(items):
+            if not translatable[cue_index]:
                 continue
-                
-            prefix = ""
-            if line.startswith('-'):
-                prefix = '-'
-                line = line[1:].strip()
-            
-            result = self.translator(line, max_length=512)
-            translated = result[0]['translation_text']
-            
-            if prefix:
-                translated = f"{prefix}{translated}"
-            
-            translated_lines.append(translated)
+            if keys[cue_index] in previous:
+                reused += 1
+                continue
+            for line in handler.get_text(sub).split('\n'):
+                if line.strip():
+                    prefix, body = split_dialogue_prefix(line)
+                    segments.append((cue_index, prefix, body))
+        
+        if reused:
+            print(f"[{label}] Reusing {reused} of {len(items)} subtitle translations from manifest")
+        if skipped:
+            print(f"[{label}] Keeping {skipped} comment, drawing, karaoke or sign events untranslated")
+            metrics.incr('skipped_cues', skipped)
+        print(f"[{label}] Translating {len(segments)} lines from {len(items) - reused - skipped} subtitles...")
+        tokens_before = self.tokens_translated
+        translated = self._translate_segments(segments, items, journal)
+        sequences, distinct = self.last_line_counts if segments else (0, 0)
+        self.last_stats = {'cues': len(items), 'reused_cues': reused, 'skipped_cues': skipped,
+                           'lines': len(segments), 'unique_lines': distinct, 'tokens': self.tokens_translated - tokens_before,
+                           'preset': self.preset_name}
+        if sequences:
+            print(f"[{label}] {distinct} distinct of {sequences} lines "
+                  f"({1 - distinct / sequences:.0%} deduplicated)")
         
-        return '\n'.join(translated_lines)
+        cue_lines = [[] for _ in range(len(items))]
+        for (cue_index, prefix, _), line in zip(segments, translated):
+            cue_lines[cue_index].append(f"{prefix}{line}")
+        
+        # By position: cues with the same source text may get different pieces of merged sentences
+        translations = []
+        for sub, key, lines, wanted in zip(items, keys, cue_lines, translatable):
+            if not wanted:
+                translations.append(None)
+                continue
+            text = previous[key] if key in previous else '\n'.join(lines)
+            if apply:
+                handler.set_text(sub, text)
+            translations.append(text)
+        
+        if self.memory is not None:
+            print(f"Translation memory: {self.memory.hits} hits, {self.memory.misses} misses "
+                  f"({self.memory.hit_rate:.0%} hit rate)")
+        return translations
 
     def translate_subtitle_file(self, input_path: str, output_path: str):
+        timings = {}
+        start = time.perf_counter()
         handler = get_subtitle_handler(input_path)
         subs = handler.read(input_path)
+        manifest = TranslationManifest.load(output_path)
+        previous = manifest.translations_for(self.cache_key) if manifest else None
+        timings['parse'] = time.perf_counter() - start
         
-        total = len(subs.events if hasattr(subs, 'events') else subs)
-        items = subs.events if hasattr(subs, 'events') else subs
-        
-        for i, sub in enumerate(items, 1):
-            print(f"[{input_path}] Translating subtitle {i}/{total}...")
-            text = handler.get_text(sub)
-            translated = self.translate_text(text)
-            handler.set_text(sub, translated)
+        start = time.perf_counter()
+        keys = [cue_key(handler.get_text(sub)) for sub in document_cues(subs)]
+        journal = TranslationJournal.open(output_path, self.cache_key)
+        try:
+            translations = self.translate_document(handler, subs, input_path, previous, journal)
+        finally:
+            journal.close()
+        timings['translate'] = time.perf_counter() - start
         
+        start = time.perf_counter()
         handler.save(subs, output_path)
+        TranslationManifest.create(input_path, output_path, self.cache_key,
+                                   cue_translations(keys, translations)).save()
+        journal.remove()
+        timings['write'] = time.perf_counter() - start
+        record_file(input_path, self.last_stats, timings)
         print(f"Translation completed! Saved to: {output_path}")
 
-def process_single_file(input_file: str) -> None:
+def create_translator(use_memory: bool = USE_TRANSLATION_MEMORY, backend: str = BACKEND,
+                      cpu_profile: Optional[CpuProfile] = None,
+                      merge_sentences: bool = MERGE_SENTENCES,
+                      server: Optional[str] = SERVER_ADDRESS,
+                      preset: str = DECODING_PRESET, target: Optional[str] = None) -> SubtitleTranslator:
+    memory = TranslationMemory() if use_memory else None
+    # A running `subtrans serve` already has the model loaded. An explicit backend or
+    # CPU profile only applies to a local model, so those always translate in-process.
+    if backend == BACKEND and cpu_profile is None:
+        remote = connect_server(server, get_model_name(target), preset)
+        if remote is not None:
+            print(f"Using translation server at {server}")
+            backend = remote
+    elif connect_server(server, get_model_name(target), preset) is not None:
+        print(f"Not using the translation server at {server}: the requested backend or CPU profile "
+              f"needs a local model")
+    return SubtitleTranslator(memory=memory, backend=backend, cpu_profile=cpu_profile,
+                              merge_sentences=merge_sentences, preset=preset, target=target)
+
+def create_model_cache(use_memory: bool = USE_TRANSLATION_MEMORY, backend: str = BACKEND,
+                       cpu_profile: Optional[CpuProfile] = None, merge_sentences: bool = MERGE_SENTENCES,
+                       server: Optional[str] = SERVER_ADDRESS, preset: str = DECODING_PRESET,
+                       budget_mb: int = MODEL_CACHE_MB, concurrency: int = 1) -> ModelCache:
+    if concurrency > 1 and cpu_profile is not None:
+        # Models translating side by side split the threads (by default one per available
+        # core) instead of each claiming all of them. A copy, as each target group of a
+        # run builds its own cache from the same profile.
+        total = cpu_profile.intra_threads or len(available_cores())
+        cpu_profile = copy.copy(cpu_profile)
+        cpu_profile.intra_threads = max(1, total // concurrency)
+    return ModelCache(lambda target: create_translator(use_memory, backend, cpu_profile, merge_sentences,
+                                                       server, preset, target), budget_mb)
+
+def get_output_path(input_file: str, target: Optional[str] = None) -> Path:
+    input_path = Path(input_file)
+    suffix = get_target_suffix(target)
+    
+    if input_path.stem.endswith(SOURCE_SUFFIX):
+        return input_path.parent / f"{input_path.stem[:-len(SOURCE_SUFFIX)]}{suffix}{input_path.suffix}"
+    return input_path.parent / f"{input_path.stem}{suffix}{input_path.suffix}"
+
+def translate_targets(input_file: str, models: ModelCache, targets: List[str], concurrency: int = 1) -> None:
+    # Parses the source once and writes one output per target
+    from pipeline import TranslationPipeline
+    pipeline = TranslationPipeline(models, targets=targets, concurrency=concurrency)
+    errors = [error for _, error in pipeline.run([input_file]) if error is not None]
+    if errors:
+        raise RuntimeError(errors[0])
+
+def process_single_file(input_file: str, translator: Optional[SubtitleTranslator] = None,
+                        use_memory: bool = USE_TRANSLATION_MEMORY, backend: str = BACKEND,
+                        cpu_profile: Optional[CpuProfile] = None, merge_sentences: bool = MERGE_SENTENCES,
+                        server: Optional[str] = SERVER_ADDRESS, preset: str = DECODING_PRESET,
+                        targets: Optional[List[str]] = None, models: Optional[ModelCache] = None,
+                        budget_mb: int = MODEL_CACHE_MB) -> None:
     input_path = Path(input_file)
     
-    if input_path.stem.endswith('.en'):
-        output_path = input_path.parent / f"{input_path.stem[:-3]}.da{input_path.suffix}"
-    else:
-        output_path = input_path.parent / f"{input_path.stem}.da{input_path.suffix}"
+    if translator is not None:
+        translator.translate_subtitle_file(str(input_path), str(get_output_path(input_file, translator.target)))
+        return
+    
+    targets = targets or [TARGET_LANG]
+    if models is not None:
+        translate_targets(str(input_path), models, targets)
+        return
+    
+    if len(targets) == 1:
+        with create_translator(use_memory, backend, cpu_profile, merge_sentences, server, preset,
+                               targets[0]) as translator:
+            translator.translate_subtitle_file(str(input_path), str(get_output_path(input_file, targets[0])))
+        return
     
-    translator = SubtitleTranslator()
-    translator.translate_subtitle_file(str(input_path), str(output_path))
+    concurrency = model_concurrency(len(targets))
+    with create_model_cache(use_memory, backend, cpu_profile, merge_sentences, server, preset, budget_mb,
+                            concurrency) as models:
+        translate_targets(str(input_path), models, targets, concurrency)
 
 def main():
     parser = argparse.ArgumentParser(description='Translate English SRT files to Danish')
     parser.add_argument('input', help='Path to the input .srt file')
+    parser.add_argument('--no-memory', action='store_true', help='Do not use the persistent translation memory')
+    parser.add_argument('--backend', choices=list(BACKENDS), default=BACKEND, help='Inference engine to use')
+    parser.add_argument('--preset', choices=list(DECODING_PRESETS), default=DECODING_PRESET,
+                        help='Decoding preset: model (its own generation config), fast (greedy), balanced or quality (more beams)')
+    parser.add_argument('--merge-sentences', action='store_true', default=MERGE_SENTENCES,
+                        help='Translate sentences that span several lines or cues as one and split the result back')
+    parser.add_argument('--self-check', action='store_true', help='Compare --cpu-profile output and speed against fp32 on the input file instead of translating it')
+    add_target_arguments(parser)
+    add_server_arguments(parser)
+    add_cpu_profile_arguments(parser)
+    add_metrics_arguments(parser)
     
     try:
         args = parser.parse_args()
-        process_single_file(args.input)
+        configure_from_args(args)
+        cpu_profile = cpu_profile_from_args(args)
+        if args.self_check:
+            run_self_check(args.input, cpu_profile or CpuProfile(), args.backend)
+            return 0
+        process_single_file(args.input, use_memory=not args.no_memory, backend=args.backend,
+                            cpu_profile=cpu_profile, merge_sentences=args.merge_sentences,
+                            server=server_from_args(args), preset=args.preset, targets=args.targets,
+                            budget_mb=args.model_cache_mb)
         return 0
 
     except KeyboardInterrupt:
@@ -87,6 +399,8 @@ def main():
     except Exception as e:
         print(f"Error: {e}")
         return 1
+    finally:
+        metrics.close()
 
 if __name__ == "__main__":
-    exit(main()) 
\ No newline at end of file
+    exit(main())
@@ -0,0 +1,160 @@
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import select
+import struct
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+from library_index import LibraryIndex
+from config import get_source_patterns, WATCH_POLL_SECONDS
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+_EVENT_HEADER = struct.Struct('iIII')
+
+def is_source_file(path: str) -> bool:
+    name = os.path.basename(path)
+    return any(fnmatch.fnmatch(name, pattern) for pattern in get_source_patterns())
+
+class FileDebouncer:
+    # A file is ready once it has had no events for settle_seconds and its size
+    # has stopped changing, so a season being copied in is picked up file by file
+    # as each one finishes rather than half-written
+    def __init__(self, settle_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.settle_seconds = settle_seconds
+        self.clock = clock
+        self.pending: Dict[str, Tuple[float, int]] = {}
+
+    def _size(self, path: str) -> int:
+        try:
+            return os.stat(path).st_size
+        except OSError:
+            return -1
+
+    def touch(self, path: str) -> None:
+        self.pending[path] = (self.clock(), self._size(path))
+
+    def ready(self) -> List[str]:
+        now = self.clock()
+        ready = []
+        for path, (touched, size) in list(self.pending.items()):
+            if now - touched < self.settle_seconds:
+                continue
+            current = self._size(path)
+            if current < 0:
+                del self.pending[path]
+            elif current != size:
+                self.pending[path] = (now, current)
+            else:
+                del self.pending[path]
+                ready.append(path)
+        return sorted(ready)
+
+class PollingWatcher:
+    def __init__(self, root, interval: float = WATCH_POLL_SECONDS):
+        self.root = str(root)
+        self.interval = interval
+        self.index = LibraryIndex(root)
+        self.snapshot = self._snapshot()
+        self.last_poll = time.monotonic()
+        self.needs_reconcile = False
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        return {path: (size, mtime_ns) for path, size, mtime_ns in self.index.scan().sources}
+
+    def poll(self, timeout: float) -> List[str]:
+        remaining = self.interval - (time.monotonic() - self.last_poll)
+        if remaining > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(remaining, 0))
+        self.last_poll = time.monotonic()
+        
+        previous, self.snapshot = self.snapshot, self._snapshot()
+        return sorted(path for path, info in self.snapshot.items() if previous.get(path) != info)
+
+    def close(self) -> None:
+        pass
+
+class InotifyWatcher:
+    def __init__(self, root):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.root = str(root)
+        self.watches: Dict[int, str] = {}
+        self.needs_reconcile = False
+        self._add_tree(self.root)
+
+    def _add_watch(self, directory: str) -> None:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            # Usually fs.inotify.max_user_watches; the reconciliation scan covers it
+            print(f"Warning: cannot watch {directory}: {os.strerror(ctypes.get_errno())}")
+            self.needs_reconcile = True
+            return
+        self.watches[wd] = directory
+
+    def _add_tree(self, directory: str) -> List[str]:
+        # Returns source files already present, which appeared before the watch existed
+        found = []
+        for current, dirnames, filenames in os.walk(directory):
+            self._add_watch(current)
+            found.extend(os.path.join(current, name) for name in filenames if is_source_file(name))
+        return found
+
+    def poll(self, timeout: float) -> List[str]:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        
+        changed = []
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return []
+        
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            
+            if mask & _IN_Q_OVERFLOW:
+                self.needs_reconcile = True
+                continue
+            if mask & _IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            
+            directory = self.watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO):
+                    changed.extend(self._add_tree(path))
+            elif mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE):
+                changed.append(path)
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+def create_watcher(root, polling: bool = False):
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}), falling back to polling")
+    return PollingWatcher(root)
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from metrics import metrics
+from config import CLAIM_DIR_NAME, CLAIM_LEASE_SECONDS
+
+def get_claim_dir(root) -> Path:
+    return Path(root) / CLAIM_DIR_NAME
+
+class WorkClaims:
+    # Nodes sharing a library (e.g. over NFS) claim source files through lease files in
+    # <root>/.subtrans-claims. A claim is created with O_EXCL, which is atomic on NFSv3
+    # and later, and renewed in the background while the file is being translated.
+    # A claim that is not renewed before it expires belonged to a dead worker and is
+    # taken over by the next node that wants the file. Takeovers, renewals and releases
+    # replace or remove a claim file only while holding its .lock marker.
+    def __init__(self, root, lease_seconds: float = CLAIM_LEASE_SECONDS, node: Optional[str] = None,
+                 clock=time.time):
+        self.root = Path(root).resolve()
+        self.dir = get_claim_dir(self.root)
+        self.lease_seconds = lease_seconds
+        self.node = node or f"{socket.gethostname()}:{os.getpid()}"
+        self.clock = clock
+        self.held: Dict[str, Tuple[str, float]] = {}  # source path -> (token, claimed at)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._renewer: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        self._renewer = threading.Thread(target=self._renew_loop, daemon=True)
+        self._renewer.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _claim_path(self, source_path) -> Path:
+        relative = os.path.relpath(os.path.abspath(source_path), self.root)
+        return self.dir / f"{hashlib.sha1(relative.encode('utf-8')).hexdigest()}.claim"
+
+    def _payload(self, source_path, token: str, claimed: float) -> bytes:
+        return json.dumps({
+            'path': os.path.relpath(os.path.abspath(source_path), self.root),
+            'node': self.node,
+            'token': token,
+            'claimed': claimed,
+            'expires': self.clock() + self.lease_seconds,
+        }).encode('utf-8')
+
+    @staticmethod
+    def _read(path: Path) -> Optional[Dict]:
+        try:
+            with open(path, 'rb') as f:
+                return json.loads(f.read().decode('utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def _create(self, path: Path, payload: bytes) -> bool:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        try:
+            os.write(fd, payload)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return True
+
+    def _expired(self, claim: Optional[Dict], path: Path) -> bool:
+        if claim is None:
+            # Unreadable: a crash between create and write, or a write still in flight
+            try:
+                return self.clock() - path.stat().st_mtime > self.lease_seconds
+            except OSError:
+                return False
+        return claim.get('expires', 0) < self.clock()
+
+    @contextmanager
+    def _locked(self, path: Path):
+        # Yields whether this node got the claim's lock marker
+        marker = path.with_name(path.name + '.lock')
+        if not self._create(marker, self.node.encode('utf-8')):
+            if self._expired(None, marker):
+                # A node died while holding it
+                marker.unlink(missing_ok=True)
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            marker.unlink(missing_ok=True)
+
+    def claim(self, source_path) -> bool:
+        self.dir.mkdir(exist_ok=True)
+        path = self._claim_path(source_path)
+        token = uuid.uuid4().hex
+        claimed = self.clock()
+        payload = self._payload(source_path, token, claimed)
+        if not self._create(path, payload):
+            if not self._take_over(path) or not self._create(path, payload):
+                return False
+        with self._lock:
+            self.held[str(source_path)] = (token, claimed)
+        metrics.incr('claims')
+        return True
+
+    def _take_over(self, path: Path) -> bool:
+        # Only one node may replace an expired claim: it checks again under the lock
+        # that the claim is still the expired one
+        if not self._expired(self._read(path), path):
+            return False
+        with self._locked(path) as locked:
+            if not locked:
+                return False
+            previous = self._read(path)
+            if not self._expired(previous, path):
+                return False
+            previous = previous or {}
+            path.unlink(missing_ok=True)
+            print(f"Taking over expired claim on {previous.get('path', path.name)} from {previous.get('node', 'unknown node')}")
+            metrics.incr('claims_taken_over')
+            return True
+
+    def renew(self) -> List[str]:
+        # Extends every claim still ours and returns the ones lost to another node.
+        # A claim whose lock is busy is left for the next round, two thirds of the
+        # lease before it would expire.
+        lost = []
+        with self._lock:
+            held = dict(self.held)
+        for source_path, (token, claimed) in held.items():
+            path = self._claim_path(source_path)
+            with self._locked(path) as locked:
+                if not locked:
+                    continue
+                claim = self._read(path)
+                if claim is None or claim.get('token') != token:
+                    lost.append(source_path)
+                    continue
+                tmp_path = path.with_name(f"{path.name}.tmp{os.getpid()}")
+                with open(tmp_path, 'wb') as f:
+                    f.write(self._payload(source_path, token, claimed))
+                os.replace(tmp_path, path)
+        with self._lock:
+            for source_path in lost:
+                self.held.pop(source_path, None)
+        for source_path in lost:
+            print(f"Lost claim on {source_path} to another node")
+        return lost
+
+    def _renew_loop(self) -> None:
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self.renew()
+            except OSError as e:
+                print(f"Could not renew claims: {e}")
+
+    def holds(self, source_path) -> bool:
+        # Checked right before a result is saved, so a file taken over since the last
+        # renewal is not written by two nodes
+        with self._lock:
+            token, _ = self.held.get(str(source_path), (None, None))
+        if token is None:
+            return False
+        claim = self._read(self._claim_path(source_path))
+        return claim is not None and claim.get('token') == token
+
+    def release(self, source_path) -> bool:
+        # False when the claim had already been lost to another node
+        with self._lock:
+            token, _ = self.held.pop(str(source_path), (None, None))
+        if token is None:
+            return False
+        path = self._claim_path(source_path)
+        with self._locked(path) as locked:
+            claim = self._read(path)
+            if claim is None or claim.get('token') != token:
+                return False
+            if locked:
+                path.unlink(missing_ok=True)
+            # Otherwise the claim is left to expire
+        return True
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._renewer is not None:
+            self._renewer.join()
+            self._renewer = None
+        with self._lock:
+            held = list(self.held)
+        for source_path in held:
+            self.release(source_path)
+
+    def status(self) -> List[Dict]:
+        if not self.dir.is_dir():
+            return []
+        now = self.clock()
+        claims = []
+        for path in sorted(self.dir.glob('*.claim')):
+            claim = self._read(path)
+            if claim is None:
+                continue
+            claim['age'] = now - claim.get('claimed', now)
+            claim['expired'] = claim.get('expires', 0) < now
+            claims.append(claim)
+        return claims
+
+def print_queue_status(pending: int, claims: List[Dict]) -> None:
+    active = [claim for claim in claims if not claim['expired']]
+    nodes = {claim['node'] for claim in active}
+    print(f"{pending} files need translation, {len(active)} claimed by {len(nodes)} nodes, "
+          f"{len(claims) - len(active)} expired claims")
+    for claim in claims:
+        state = 'expired' if claim['expired'] else f"{claim['age']:.0f}s"
+        print(f"  {claim['node']:<30} {state:>8}  {claim['path']}")
@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import time
+from typing import Iterator, List, Optional, Tuple, Union
+from cpu_profile import CpuProfile
+from metrics import metrics
+from config import (USE_TRANSLATION_MEMORY, BACKEND, MERGE_SENTENCES, SERVER_ADDRESS, DECODING_PRESET,
+                    MODEL_CACHE_MB)
+
+# Translator owned by the current worker process (a ModelCache with several targets)
+_translator = None
+
+def available_cores() -> List[int]:
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def split_cores(workers: int, cores: Optional[List[int]] = None) -> List[List[int]]:
+    cores = cores if cores is not None else available_cores()
+    if workers >= len(cores):
+        return [[cores[i % len(cores)]] for i in range(workers)]
+    
+    per_worker = len(cores) // workers
+    slices = [cores[i * per_worker:(i + 1) * per_worker] for i in range(workers)]
+    # Hand leftover cores to the first workers
+    for i, core in enumerate(cores[workers * per_worker:]):
+        slices[i].append(core)
+    return slices
+
+def _init_worker(core_slices: List[List[int]], counter, use_memory: bool, backend: str,
+                 cpu_profile: Optional[CpuProfile], metrics_file: Optional[str] = None,
+                 merge_sentences: bool = MERGE_SENTENCES, server: Optional[str] = SERVER_ADDRESS,
+                 preset: str = DECODING_PRESET, targets: Optional[List[str]] = None,
+                 budget_mb: int = MODEL_CACHE_MB) -> None:
+    global _translator
+    with counter.get_lock():
+        slot = counter.value
+        counter.value += 1
+    cores = core_slices[slot % len(core_slices)]
+    
+    # Pin before torch starts its thread pools so they inherit the affinity
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    import torch
+    torch.set_num_threads(len(cores))
+    torch.set_num_interop_threads(1)
+    
+    from translator import create_model_cache, create_translator
+    if metrics_file is not None:
+        # Workers append their own events; appends of single lines do not interleave
+        metrics.configure(metrics_file, 'jsonl')
+    print(f"Worker {os.getpid()} pinned to cores {cores}")
+    if cpu_profile is not None:
+        # The core slice decides the thread count, whatever the profile asked for. The
+        # inter-op pool is fixed above and torch refuses to resize it, so the backend
+        # must leave it alone.
+        cpu_profile.intra_threads = len(cores)
+        cpu_profile.inter_threads = None
+    if targets is not None and len(targets) > 1:
+        _translator = create_model_cache(use_memory, backend, cpu_profile, merge_sentences, server, preset,
+                                         budget_mb)
+    else:
+        _translator = create_translator(use_memory, backend, cpu_profile, merge_sentences, server, preset,
+                                        targets[0] if targets else None)
+
+def _translate_file(job: Union[str, Tuple[str, List[str]]]) -> Tuple[str, Optional[str], float]:
+    from translator import process_single_file
+    # A job is a path, or a path and the targets it still needs
+    input_file, targets = job if isinstance(job, tuple) else (job, None)
+    start = time.perf_counter()
+    try:
+        if hasattr(_translator, 'use'):
+            process_single_file(input_file, models=_translator, targets=targets)
+        else:
+            process_single_file(input_file, translator=_translator)
+        return input_file, None, time.perf_counter() - start
+    except Exception as e:
+        return input_file, str(e), time.perf_counter() - start
+
+def process_files_parallel(files: List[Union[str, Tuple[str, List[str]]]], workers: int,
+                           use_memory: bool = USE_TRANSLATION_MEMORY,
+                           backend: str = BACKEND,
+                           cpu_profile: Optional[CpuProfile] = None,
+                           merge_sentences: bool = MERGE_SENTENCES,
+                           server: Optional[str] = SERVER_ADDRESS,
+                           preset: str = DECODING_PRESET,
+                           targets: Optional[List[str]] = None,
+                           budget_mb: int = MODEL_CACHE_MB) -> Iterator[Tuple[str, Optional[str], float]]:
+    # Each worker loads its own model; spawn avoids forking a process with live torch threads
+    context = multiprocessing.get_context('spawn')
+    counter = context.Value('i', 0)
+    core_slices = split_cores(workers)
+    # Only JSON lines can be shared; a Prometheus textfile only sees the parent's counters
+    metrics_file = str(metrics.path) if metrics.path is not None and metrics.format == 'jsonl' else None
+    
+    with context.Pool(workers, initializer=_init_worker,
+                      initargs=(core_slices, counter, use_memory, backend, cpu_profile, metrics_file,
+                                merge_sentences, server, preset, targets, budget_mb)) as pool:
+        # chunksize=1 makes the pool's task queue hand out one file at a time
+        yield from pool.imap_unordered(_translate_file, files, chunksize=1)